@@ -0,0 +1,263 @@
+import os
+import sys
+import glob
+import json
+import logging
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+from get_zcta_data import read_zcta_polygons, shapefile_path, ZCTA_FIELD
+from stage_cache import fingerprint
+from storage import get_latest_csv, read_dataset, write_dataset, vintage_name
+from catalog import register_artifact, file_hash
+from clean_data import get_latest_lineage_file
+from zcta_keys import parse_zcta
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ADJACENCY_FOLDER = os.path.join("automated data", "adjacency")
+# queen: polygons sharing any boundary point are neighbors; rook: only those sharing a boundary segment
+CONTIGUITY = ('queen', 'rook')
+# Cleaned columns filled from neighbors by default; crime_grade is a letter grade, not a number
+IMPUTE_COLUMNS = ['median_household_income', 'sunlight_hours_per_year']
+IMPUTE_METHODS = ('fill', 'smooth')
+
+
+def build_adjacency(shapefile=None, folder=ADJACENCY_FOLDER, contiguity='queen'):
+    """Write the ZCTA adjacency graph of a shapefile as a CSR matrix (.npz) and return its path.
+
+    shapefile defaults to the SHAPEFILE_PATH shapefile. Neighbor pairs come from one STRtree query of
+    all polygons against themselves. The file is named after a fingerprint of the shapefile and the
+    contiguity, so an unchanged shapefile is never read twice.
+    """
+    if contiguity not in CONTIGUITY:
+        raise ValueError(f"Unknown contiguity: {contiguity}")
+    shapefile = shapefile or shapefile_path()
+    shapefile_files = sorted(glob.glob(os.path.splitext(shapefile)[0] + ".*"))
+    key = fingerprint("zcta_adjacency", shapefile_files, {'contiguity': contiguity}, cache_folder=folder)
+    adjacency_path = os.path.join(folder, f"zcta_adjacency_{contiguity}_{key[:16]}.npz")
+    if os.path.exists(adjacency_path):
+        return adjacency_path
+
+    zcta_gdf = read_zcta_polygons(shapefile)
+    polygons = zcta_gdf.geometry.to_numpy()
+    # Bounding boxes prefilter the candidates; the exact test runs on prepared polygons
+    shapely.prepare(polygons)
+    sources, targets = shapely.STRtree(polygons).query(polygons, predicate='intersects')
+    # Each pair once; the matrix is symmetrized below
+    pairs = sources < targets
+    sources, targets = sources[pairs], targets[pairs]
+    if contiguity == 'rook':
+        # Polygons meeting at a single corner share a boundary of zero length
+        shared = shapely.length(shapely.intersection(polygons[sources], polygons[targets])) > 0
+        sources, targets = sources[shared], targets[shared]
+    rows = np.concatenate([sources, targets])
+    columns = np.concatenate([targets, sources])
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(len(polygons),) * 2)
+
+    os.makedirs(folder, exist_ok=True)
+    # Written under a temporary name (np.savez appends .npz to names without it), so readers never
+    # see a partial file
+    tmp_path = f"{adjacency_path}.tmp.npz"
+    np.savez(tmp_path, indptr=matrix.indptr.astype(np.int32), indices=matrix.indices.astype(np.int32),
+             zctas=parse_zcta(zcta_gdf[ZCTA_FIELD]).to_numpy(dtype=np.uint32, na_value=0))
+    os.replace(tmp_path, adjacency_path)
+    logger.info(f"Adjacency graph of {len(polygons)} ZCTAs with {len(sources)} {contiguity} neighbor pairs "
+                f"saved to {adjacency_path}")
+    return adjacency_path
+
+
+class ZctaAdjacency:
+    """Fill or smooth ZCTA columns from their neighbors with sparse matrix products over the adjacency graph."""
+
+    def __init__(self, zctas, matrix, path=None):
+        self.zctas = pd.Index(zctas)
+        self.matrix = matrix
+        self.path = path
+
+    @classmethod
+    def load(cls, adjacency_path):
+        """Load the adjacency graph written by build_adjacency."""
+        with np.load(adjacency_path) as arrays:
+            indptr, indices, zctas = arrays['indptr'], arrays['indices'], arrays['zctas']
+        # Stored without its values, which are all one
+        matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(zctas),) * 2)
+        return cls(zctas, matrix, adjacency_path)
+
+    @classmethod
+    def from_shapefile(cls, shapefile=None, folder=ADJACENCY_FOLDER, contiguity='queen'):
+        """Load the adjacency graph of a shapefile, building it first if needed."""
+        return cls.load(build_adjacency(shapefile, folder, contiguity))
+
+    def neighbor_mean(self, values, known):
+        """Return (mean of the known neighbor values, number of known neighbors) for every ZCTA."""
+        counts = self.matrix @ known.astype(float)
+        sums = self.matrix @ np.where(known, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts, counts
+
+    def fill(self, values, max_hops=1):
+        """Fill the NaNs of a per-ZCTA value array with the mean of their known neighbors.
+
+        Values filled in one hop count as known in the next, so max_hops=2 also reaches ZCTAs whose
+        neighbors are all missing. Returns (filled values, hop of every value: 0 for observed values,
+        -1 for values still missing).
+        """
+        values = np.array(values, dtype=float)
+        known = ~np.isnan(values)
+        hops = np.where(known, 0, -1).astype(np.int8)
+        for hop in range(1, max_hops + 1):
+            mean, counts = self.neighbor_mean(values, known)
+            filled = ~known & (counts > 0)
+            if not filled.any():
+                break
+            values[filled] = mean[filled]
+            hops[filled] = hop
+            known |= filled
+        return values, hops
+
+    def smooth(self, values, weight=0.5):
+        """Blend every value with the mean of its known neighbors: (1 - weight) * value + weight * mean.
+
+        Values without known neighbors are kept and missing values stay missing.
+        """
+        values = np.asarray(values, dtype=float)
+        mean, counts = self.neighbor_mean(values, ~np.isnan(values))
+        return np.where(counts > 0, (1 - weight) * values + weight * mean, values)
+
+    def positions(self, zctas):
+        """Return the graph positions of ZCTA codes in any form accepted by parse_zcta (-1 when not in the graph)."""
+        keys = parse_zcta(zctas).to_numpy(dtype=np.int64, na_value=-1)
+        return self.zctas.get_indexer(keys)
+
+
+def impute_column(adjacency, data, column, method='fill', max_hops=1, weight=0.5):
+    """Return (imputed copy of a data column, lineage operation entry) for the rows of data.
+
+    The column is scattered onto the graph by the data's zcta column, filled or smoothed there and
+    gathered back; integer columns are rounded to keep their dtype. The entry's provenance maps each
+    hop to the data's ZCTAs filled in it, or lists the smoothed ZCTAs.
+    """
+    series = data[column]
+    if not pd.api.types.is_numeric_dtype(series.dtype):
+        raise ValueError(f"Column {column} is not numeric")
+    positions = adjacency.positions(data['zcta'])
+    on_graph = positions >= 0
+    observed = series.to_numpy(dtype=float, na_value=np.nan)
+    values = np.full(len(adjacency.zctas), np.nan)
+    values[positions[on_graph]] = observed[on_graph]
+    # Graph ZCTAs without a data row are filled as stepping stones but are not reported
+    present = np.zeros(len(adjacency.zctas), bool)
+    present[positions[on_graph]] = True
+
+    if method == 'fill':
+        values, hops = adjacency.fill(values, max_hops)
+        changed = (hops > 0) & present
+        provenance = {str(hop): adjacency.zctas[(hops == hop) & present].tolist() for hop in range(1, max_hops + 1)}
+        counts = ', '.join(f"hop {hop}: {len(zctas)}" for hop, zctas in provenance.items())
+        details = f"Filled {changed.sum()} missing values from neighbor means ({counts})"
+    elif method == 'smooth':
+        smoothed = adjacency.smooth(values, weight)
+        changed = ~np.isnan(values) & (smoothed != values) & present
+        values = smoothed
+        provenance = {'smoothed': adjacency.zctas[changed].tolist()}
+        details = f"Smoothed {changed.sum()} values with weight {weight} on the neighbor mean"
+    else:
+        raise ValueError(f"Unknown imputation method: {method}")
+
+    imputed = observed.copy()
+    imputed[on_graph] = values[positions[on_graph]]
+    if pd.api.types.is_integer_dtype(series.dtype):
+        imputed = np.round(imputed)
+    result = pd.Series(imputed, index=series.index, name=column).astype(series.dtype)
+    entry = {
+        'type': 'operation',
+        'name': f"{method}_{column}",
+        'details': details,
+        'method': method,
+        'adjacency': {'path': adjacency.path, 'sha256': file_hash(adjacency.path) if adjacency.path else None},
+        'provenance': provenance,
+    }
+    return result, entry
+
+
+def impute_data(data=None, lineage_data=None, columns=None, method='fill', max_hops=1, weight=0.5,
+                contiguity='queen', shapefile=None, vintage=None, fmt=None, csv_export=False, persist=True,
+                folder="automated data", lineage_folder="automated data lineage"):
+    """Fill (or smooth) cleaned columns from neighboring ZCTAs and return (imputed_data, lineage_data).
+
+    data and lineage_data default to the latest cleaned_data and cleaned_lineage artifacts. columns
+    defaults to the IMPUTE_COLUMNS present. The adjacency graph is built from shapefile (default: the
+    vintage's shapefile) on first use. Every column adds an operation to the lineage whose
+    provenance names the ZCTAs that got a neighbor value. The result is saved as imputed_data with
+    its lineage as imputed_lineage; with persist=False nothing is written.
+    """
+    logger.info("Starting neighbor imputation...")
+    data_file = None
+    if data is None:
+        data_file = get_latest_csv(vintage_name("cleaned_data", vintage))
+        if not data_file:
+            raise FileNotFoundError("Cleaned data is required for neighbor imputation")
+        data = read_dataset(data_file)
+        lineage_file = get_latest_lineage_file(vintage_name("cleaned_lineage", vintage))
+        if lineage_data is None and lineage_file is not None:
+            with open(lineage_file, 'r') as f:
+                lineage_data = json.load(f)
+    lineage_data = list(lineage_data or [])
+    columns = columns or [column for column in IMPUTE_COLUMNS if column in data]
+
+    adjacency = ZctaAdjacency.from_shapefile(shapefile or shapefile_path(vintage), contiguity=contiguity)
+    result = data.copy()
+    for column in columns:
+        missing = result[column].isna().sum()
+        result[column], entry = impute_column(adjacency, result, column, method, max_hops, weight)
+        entry.update(input='cleaned_data', output='imputed_data')
+        lineage_data.append(entry)
+        logger.info(f"{entry['details']} in {column} ({missing} missing before, "
+                    f"{result[column].isna().sum()} after)")
+    lineage_data.append({
+        'type': 'output',
+        'name': 'imputed_data',
+        'shape': result.shape,
+        'columns': list(result.columns)
+    })
+    if not persist:
+        return result, lineage_data
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    os.makedirs(lineage_folder, exist_ok=True)
+    lineage_name = vintage_name("imputed_lineage", vintage)
+    lineage_path = os.path.join(lineage_folder, f"{lineage_name}_{timestamp}.json")
+    with open(lineage_path, 'w') as f:
+        json.dump(lineage_data, f, indent=4)
+    register_artifact(lineage_path, lineage_name, rows=len(lineage_data), timestamp=timestamp,
+                      catalog_folder=folder)
+    inputs = [path for path in [data_file, adjacency.path] if path]
+    output_path = write_dataset(result, vintage_name("imputed_data", vintage), folder=folder, fmt=fmt,
+                                timestamp=timestamp, csv_export=csv_export, inputs=inputs)
+    logger.info(f"Saved imputed data to {output_path}")
+    return result, lineage_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill or smooth cleaned ZCTA columns from neighboring ZCTAs.")
+    parser.add_argument("--columns", nargs="+", help=f"Numeric columns (default: {' '.join(IMPUTE_COLUMNS)})")
+    parser.add_argument("--method", choices=IMPUTE_METHODS, default='fill')
+    parser.add_argument("--max-hops", type=int, default=1, help="Neighbor rings a missing value may be filled from")
+    parser.add_argument("--weight", type=float, default=0.5, help="Weight of the neighbor mean when smoothing")
+    parser.add_argument("--contiguity", choices=CONTIGUITY, default='queen')
+    parser.add_argument("--vintage", type=int, help="TIGER/Line year (default: the SHAPEFILE_PATH shapefile)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    impute_data(columns=args.columns, method=args.method, max_hops=args.max_hops, weight=args.weight,
+                contiguity=args.contiguity, vintage=args.vintage)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from benchmarks.synthetic import generate_inputs
+
+# Nationwide size multiples the suite runs at
+SCALES = (1, 10, 100)
+# Stages timed at every scale, in the order they run
+STAGES = ('get_latest_csv', 'join_data', 'clean_data', 'pipeline')
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# A stage regresses when it is this much slower or larger than its baseline
+TOLERANCE = 0.25
+# Wall-time differences below this many seconds are noise
+MIN_SECONDS = 0.05
+
+
+def run_stage(stage):
+    """Run one pipeline stage in the current working directory without the stage cache."""
+    from storage import get_latest_csv
+    from join_data import join_data
+    from clean_data import clean_data
+    from pipeline import run_pipeline
+
+    if stage == 'get_latest_csv':
+        for dataset_name in ('zcta_data', 'income_data', 'crime_data', 'sunlight_data'):
+            get_latest_csv(dataset_name)
+    elif stage == 'join_data':
+        join_data(use_cache=False)
+    elif stage == 'clean_data':
+        clean_data(use_cache=False)
+    elif stage == 'pipeline':
+        # In-memory join and clean, persisting only the cleaned data
+        stages = [
+            {'name': 'merged_data', 'depends_on': [],
+             'function': lambda upstream, persist: join_data(use_cache=False, persist=persist)},
+            {'name': 'cleaned_data', 'depends_on': ['merged_data'],
+             'function': lambda upstream, persist: clean_data(*upstream['merged_data'], use_cache=False,
+                                                              persist=persist)},
+        ]
+        run_pipeline(stages, persist=('cleaned_data',))
+    else:
+        raise ValueError(f"Unknown benchmark stage: {stage}")
+
+
+def measure_stage(folder, stage, queue):
+    """Child process entry point: run a stage in folder and report its wall time, CPU time and peak RSS."""
+    from log_setup import configure_logging
+    from profiling import peak_rss_mb
+
+    os.chdir(folder)
+    configure_logging('quiet')
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    run_stage(stage)
+    queue.put({
+        'wall_seconds': time.perf_counter() - start_wall,
+        'cpu_seconds': time.process_time() - start_cpu,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+
+
+def run_scale(scale, seed=0):
+    """Generate inputs at a scale and return {stage: metrics}; every stage runs in a fresh process."""
+    folder = tempfile.mkdtemp(prefix=f"zcta_bench_{scale:g}x_")
+    context = multiprocessing.get_context('spawn')
+    try:
+        rows = generate_inputs(folder, scale=scale, seed=seed)
+        print(f"Scale {scale:g}x inputs: {rows}")
+        results = {}
+        for stage in STAGES:
+            queue = context.Queue()
+            process = context.Process(target=measure_stage, args=(folder, stage, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Benchmark stage {stage} failed at scale {scale:g}x")
+            results[stage] = queue.get()
+            print(f"  {stage:<15} {results[stage]['wall_seconds']:8.3f}s wall "
+                  f"{results[stage]['cpu_seconds']:8.3f}s CPU {results[stage]['peak_rss_mb']:8.0f} MiB peak RSS")
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def find_regressions(results, baselines, tolerance=TOLERANCE):
+    """Return a message for every stage whose wall time or peak RSS exceeds its baseline by more than tolerance."""
+    regressions = []
+    for scale, stages in results.items():
+        for stage, metrics in stages.items():
+            baseline = baselines.get(str(scale), {}).get(stage)
+            if baseline is None:
+                continue
+            wall_limit = max(baseline['wall_seconds'] * (1 + tolerance), baseline['wall_seconds'] + MIN_SECONDS)
+            if metrics['wall_seconds'] > wall_limit:
+                regressions.append(f"{stage} at {scale}x: {metrics['wall_seconds']:.3f}s wall, "
+                                   f"baseline {baseline['wall_seconds']:.3f}s")
+            if metrics['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{stage} at {scale}x: {metrics['peak_rss_mb']:.0f} MiB peak RSS, "
+                                   f"baseline {baseline['peak_rss_mb']:.0f} MiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic nationwide inputs.")
+    parser.add_argument("--scales", type=float, nargs="+", default=list(SCALES),
+                        help="Multiples of nationwide size to run (default: 1 10 100)")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--update-baselines", action="store_true",
+                        help="Store this run's numbers as the new baselines instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = {f"{scale:g}": run_scale(scale, seed=args.seed) for scale in args.scales}
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, 'r') as f:
+            baselines = json.load(f)
+    if args.update_baselines:
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=4)
+        print(f"Baselines saved to {args.baselines}")
+        return 0
+
+    if not baselines:
+        print(f"No baselines in {args.baselines}; run with --update-baselines to store them.")
+        return 0
+    regressions = find_regressions(results, baselines, args.tolerance)
+    if regressions:
+        print("PERFORMANCE REGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against baselines.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
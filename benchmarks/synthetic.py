@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import pandas as pd
+from storage import write_dataset
+
+# Size of the nationwide inputs that scale 1 reproduces
+NATIONWIDE_ZCTAS = 33791
+# Real ZCTAs start at 00501, so about one key in ten has a leading zero
+ZCTA_CODES = np.arange(501, 100000)
+STATES = ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS',
+          'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV',
+          'NY', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']
+CRIME_GRADES = ['A+', 'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'D-', 'F']
+# Share of the ZCTA keys each source covers; the rest are missing matches
+COVERAGE = {
+    'zip_zcta_xref': 0.97,
+    'zcta_review': 0.12,
+    'income_data': 0.95,
+    'crime_data': 0.80,
+    'sunlight_data': 0.98,
+}
+# Share of extra source keys that are not in zcta_data (misses in the other direction)
+EXTRA_KEYS = 0.02
+TIMESTAMP = "20000101_000000"
+
+
+def zcta_keys(rng, count):
+    """Draw count ZCTA codes; ZCTA codes only have 100,000 values, so larger tables repeat keys."""
+    unique = rng.choice(ZCTA_CODES, min(count, len(ZCTA_CODES)), replace=False)
+    if count <= len(unique):
+        return unique
+    return np.concatenate([unique, rng.choice(unique, count - len(unique))])
+
+
+def covered_keys(rng, keys, coverage):
+    """Return a share of the distinct keys plus a few codes that are not among them."""
+    distinct = np.unique(keys)
+    covered = rng.choice(distinct, int(len(distinct) * coverage), replace=False)
+    absent = np.setdiff1d(ZCTA_CODES, distinct)
+    extra = rng.choice(absent, min(len(absent), int(len(covered) * EXTRA_KEYS)), replace=False)
+    return np.concatenate([covered, extra])
+
+
+def fanout(rng, count, mean):
+    """Draw a geometric number (at least one) of rows per key with the given mean."""
+    return rng.geometric(1 / mean, count)
+
+
+def generate_zcta_data(rng, count):
+    keys = zcta_keys(rng, count)
+    return pd.DataFrame({
+        'zcta': pd.Series(keys).astype(str).str.zfill(5),
+        'latitude': rng.uniform(18.0, 71.0, count).round(6),
+        'longitude': rng.uniform(-170.0, -65.0, count).round(6),
+    })
+
+
+def generate_xref(rng, keys):
+    """Many ZIPs per ZCTA; zcta is a float column with gaps like the real CSV, so leading zeros are lost."""
+    covered = covered_keys(rng, keys, COVERAGE['zip_zcta_xref'])
+    repeats = fanout(rng, len(covered), 1.25)
+    zcta = np.repeat(covered, repeats).astype(float)
+    # Every ZCTA contains its namesake ZIP first, then other ZIPs
+    first = np.concatenate([[True], np.diff(zcta) != 0])
+    zip_code = np.where(first, zcta, rng.integers(501, 100000, len(zcta))).astype(np.int64)
+    zcta[rng.random(len(zcta)) < 0.0002] = np.nan
+    return pd.DataFrame({
+        'zcta': zcta,
+        'zip_code': zip_code,
+        'source': rng.choice(['tiger', 'hud', 'usps'], len(zcta), p=[0.9, 0.07, 0.03]),
+    })
+
+
+def generate_review(rng, keys):
+    """Several review rows per reviewed ZCTA plus rows that never matched a ZCTA."""
+    covered = covered_keys(rng, keys, COVERAGE['zcta_review'])
+    zcta = np.repeat(covered, fanout(rng, len(covered), 2.0)).astype(float)
+    unmatched = np.full(int(len(zcta) * 0.02), np.nan)
+    zcta = np.concatenate([zcta, unmatched])
+    count = len(zcta)
+    cities = np.array([f"City {number}" for number in range(max(1, count // 2))])
+    return pd.DataFrame({
+        'zip': rng.integers(501, 100000, count),
+        'city': rng.choice(cities, count),
+        'stusab': rng.choice(STATES, count),
+        'latitude': rng.uniform(18.0, 71.0, count).round(4),
+        'longitude': rng.uniform(-170.0, -65.0, count).round(4),
+        'INTPTLAT': np.nan,
+        'INTPTLONG': np.nan,
+        'zcta': zcta,
+        'point map url\n': 'point map',
+        'zip map url': 'zip map',
+        'result': np.where(rng.random(count) < 0.9, rng.integers(501, 100000, count), np.nan),
+        'notes': np.where(rng.random(count) < 0.01, 'check boundary', None),
+        'census_reporter_check': 'data profile',
+    })
+
+
+def generate_income(rng, keys):
+    covered = covered_keys(rng, keys, COVERAGE['income_data'])
+    income = pd.array(rng.integers(20000, 250000, len(covered)), dtype='Int64')
+    income[rng.random(len(covered)) < 0.01] = pd.NA
+    return pd.DataFrame({'zcta': pd.Series(covered).astype(str).str.zfill(5), 'median_household_income': income})
+
+
+def generate_crime(rng, keys):
+    covered = covered_keys(rng, keys, COVERAGE['crime_data'])
+    return pd.DataFrame({'zcta': pd.Series(covered).astype(str).str.zfill(5),
+                         'crime_grade': rng.choice(CRIME_GRADES, len(covered))})
+
+
+def generate_sunlight(rng, keys):
+    covered = covered_keys(rng, keys, COVERAGE['sunlight_data'])
+    peak_sun_hours = rng.uniform(3.0, 6.5, len(covered)).round(2)
+    return pd.DataFrame({'zcta': pd.Series(covered).astype(str).str.zfill(5),
+                         'peak_sun_hours_per_day': peak_sun_hours,
+                         'sunlight_hours_per_year': peak_sun_hours * 365})
+
+
+def generate_inputs(folder, scale=1, seed=0, fmt=None):
+    """Write synthetic pipeline inputs at scale times nationwide size into folder and return their row counts.
+
+    The manual CSVs go to "manual data" and zcta_data, income_data, crime_data and sunlight_data are
+    written as catalogued artifacts in "automated data", so join_data and clean_data can run in folder.
+    """
+    rng = np.random.default_rng(seed)
+    zcta_data = generate_zcta_data(rng, max(1, int(NATIONWIDE_ZCTAS * scale)))
+    keys = zcta_data['zcta'].astype(int).to_numpy()
+
+    manual_folder = os.path.join(folder, "manual data")
+    data_folder = os.path.join(folder, "automated data")
+    os.makedirs(manual_folder, exist_ok=True)
+    xref = generate_xref(rng, keys)
+    xref.to_csv(os.path.join(manual_folder, "zip_zcta_xref.csv"), index=False)
+    review = generate_review(rng, keys)
+    review.to_csv(os.path.join(manual_folder, "zcta_review.csv"), index=False)
+
+    artifacts = {
+        'zcta_data': zcta_data,
+        'income_data': generate_income(rng, keys),
+        'crime_data': generate_crime(rng, keys),
+        'sunlight_data': generate_sunlight(rng, keys),
+    }
+    for dataset_name, df in artifacts.items():
+        write_dataset(df, dataset_name, folder=data_folder, fmt=fmt, timestamp=TIMESTAMP)
+
+    rows = {dataset_name: len(df) for dataset_name, df in artifacts.items()}
+    rows.update({'zip_zcta_xref': len(xref), 'zcta_review': len(review)})
+    return rows
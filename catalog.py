@@ -0,0 +1,267 @@
+import logging
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from log_setup import configure_logging, VERBOSITY_LEVELS, DEFAULT_VERBOSITY
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FOLDER = "automated data"
+# Append-only history of every artifact ever registered
+CATALOG_FILENAME = "catalog.jsonl"
+# Latest record per dataset, rewritten atomically on every registration
+LATEST_FILENAME = "catalog_latest.json"
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+# Lock file guarding the catalog files of a folder across processes
+LOCK_FILENAME = "catalog.lock"
+
+_catalog_lock = threading.Lock()
+
+
+@contextmanager
+def folder_lock(lock, folder, lock_filename):
+    """Hold a thread lock and an exclusive flock on folder/lock_filename.
+
+    Shared JSON files are read, modified and rewritten under it. The thread lock serializes the
+    threads of one process, and the file lock serializes processes that share the folder, such as
+    the vintage workers of panel.build_panel.
+    """
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, lock_filename), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents.
+
+    A directory (such as a partitioned dataset) is hashed over the relative paths and contents of its files.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(file_hash(file_path, chunk_size).encode())
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_timestamp(path):
+    """Parse the trailing _YYYYmmdd_HHMMSS timestamp from an artifact filename, or None if it has none."""
+    stem = os.path.basename(path).split('.')[0]
+    parts = stem.split('_')
+    if len(parts) < 3:
+        return None
+    try:
+        return datetime.strptime(parts[-2] + '_' + parts[-1], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def find_latest_by_name(dataset_name, folder, extensions):
+    """Glob-based fallback for artifacts not in the catalog; files without a valid timestamp are skipped."""
+    candidates = []
+    for rank, extension in enumerate(reversed(extensions)):
+        for path in glob.glob(os.path.join(folder, f"{dataset_name}_*{extension}")):
+            timestamp = parse_timestamp(path)
+            if timestamp is not None:
+                candidates.append((timestamp, rank, path))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+def _catalog_paths(catalog_folder):
+    return os.path.join(catalog_folder, CATALOG_FILENAME), os.path.join(catalog_folder, LATEST_FILENAME)
+
+
+def _read_latest_index(catalog_folder):
+    _, latest_path = _catalog_paths(catalog_folder)
+    if not os.path.exists(latest_path):
+        return {}
+    with open(latest_path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path, data):
+    # Per-process temporary name, so processes sharing the folder never replace each other's half-written file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_catalog(catalog_folder=CATALOG_FOLDER):
+    """Return every record in the catalog history, oldest first."""
+    catalog_path, _ = _catalog_paths(catalog_folder)
+    if not os.path.exists(catalog_path):
+        return []
+    records = []
+    with open(catalog_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def register_artifact(path, dataset_name, df=None, rows=None, schema=None, inputs=None, exports=None, timestamp=None,
+                      catalog_folder=CATALOG_FOLDER):
+    """Record a produced artifact in the catalog and make it the latest version of its dataset.
+
+    inputs is a list of upstream file paths; their catalog hashes are reused, other files are hashed.
+    exports lists companion files (such as CSV copies) that share the artifact's lifetime.
+    """
+    if timestamp is None:
+        parsed = parse_timestamp(path)
+        timestamp = parsed.strftime(TIMESTAMP_FORMAT) if parsed else datetime.now(timezone.utc).strftime(
+            TIMESTAMP_FORMAT)
+    record = {
+        'dataset': dataset_name,
+        'timestamp': timestamp,
+        'path': path,
+        'format': os.path.splitext(path)[1].lstrip('.'),
+        'rows': len(df) if df is not None else rows,
+        'schema': {str(col): str(dtype) for col, dtype in df.dtypes.items()} if df is not None else schema,
+        'sha256': file_hash(path),
+        'inputs': [],
+        'exports': list(exports or []),
+    }
+
+    os.makedirs(catalog_folder, exist_ok=True)
+    catalog_path, latest_path = _catalog_paths(catalog_folder)
+    with folder_lock(_catalog_lock, catalog_folder, LOCK_FILENAME):
+        known_hashes = {entry['path']: entry['sha256'] for entry in _read_latest_index(catalog_folder).values()}
+        for input_path in inputs or []:
+            input_hash = known_hashes.get(input_path)
+            if input_hash is None and os.path.isfile(input_path):
+                input_hash = file_hash(input_path)
+            record['inputs'].append({'path': input_path, 'sha256': input_hash})
+        with open(catalog_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        latest = _read_latest_index(catalog_folder)
+        current = latest.get(dataset_name)
+        if current is None or current['timestamp'] <= timestamp:
+            latest[dataset_name] = record
+            _write_json_atomic(latest_path, latest)
+    logger.debug(f"Registered {dataset_name} artifact in catalog: {path}")
+    return record
+
+
+def latest_artifact(dataset_name, catalog_folder=CATALOG_FOLDER):
+    """Return the catalog record for the latest version of a dataset, or None if unknown or deleted."""
+    record = _read_latest_index(catalog_folder).get(dataset_name)
+    if record is None or not os.path.exists(record['path']):
+        return None
+    return record
+
+
+def compact(keep=3, catalog_folder=CATALOG_FOLDER, dry_run=False):
+    """Delete all but the newest `keep` artifacts of every dataset and rewrite the catalog.
+
+    Records whose files no longer exist are dropped as well. Returns the list of deleted paths.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    catalog_path, latest_path = _catalog_paths(catalog_folder)
+    with folder_lock(_catalog_lock, catalog_folder, LOCK_FILENAME):
+        # A rewritten path (same dataset and timestamp) keeps only its most recent record
+        by_path = {}
+        for record in read_catalog(catalog_folder):
+            if os.path.exists(record['path']):
+                by_path.pop(record['path'], None)
+                by_path[record['path']] = record
+        by_dataset = {}
+        for record in by_path.values():
+            by_dataset.setdefault(record['dataset'], []).append(record)
+
+        kept, deleted = [], []
+        for dataset_name, records in by_dataset.items():
+            records.sort(key=lambda record: record['timestamp'])
+            kept.extend(records[-keep:])
+        kept_paths = {path for record in kept for path in [record['path']] + record.get('exports', [])}
+        for records in by_dataset.values():
+            for record in records[:-keep]:
+                for path in [record['path']] + record.get('exports', []):
+                    if os.path.exists(path) and path not in kept_paths and path not in deleted:
+                        deleted.append(path)
+
+        if dry_run:
+            for path in deleted:
+                logger.info(f"Would delete: {path}")
+            return deleted
+
+        for path in deleted:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            logger.info(f"Deleted: {path}")
+        kept.sort(key=lambda record: record['timestamp'])
+        tmp_path = f"{catalog_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for record in kept:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, catalog_path)
+        latest = {}
+        for record in kept:
+            latest[record['dataset']] = record
+        _write_json_atomic(latest_path, latest)
+    logger.info(f"Compaction complete: kept {len(kept)} artifacts, deleted {len(deleted)} files")
+    return deleted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and compact the automated data catalog.")
+    parser.add_argument("--catalog-folder", default=CATALOG_FOLDER)
+    parser.add_argument("--verbosity", choices=list(VERBOSITY_LEVELS), default=DEFAULT_VERBOSITY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Show the latest artifact of every dataset")
+    latest_parser = subparsers.add_parser("latest", help="Show the latest artifact of one dataset")
+    latest_parser.add_argument("dataset")
+    compact_parser = subparsers.add_parser("compact", help="Delete old artifacts beyond the retention limit")
+    compact_parser.add_argument("--keep", type=int, default=3, help="Artifacts to keep per dataset")
+    compact_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    configure_logging(args.verbosity)
+
+    if args.command == "list":
+        for dataset_name, record in sorted(_read_latest_index(args.catalog_folder).items()):
+            print(f"{dataset_name}: {record['path']} ({record['rows']} rows, {record['timestamp']})")
+    elif args.command == "latest":
+        record = latest_artifact(args.dataset, args.catalog_folder)
+        if record is None:
+            print(f"No artifact found for {args.dataset}")
+            return 1
+        print(json.dumps(record, indent=4))
+    elif args.command == "compact":
+        compact(keep=args.keep, catalog_folder=args.catalog_folder, dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
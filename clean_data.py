@@ -1,223 +1,178 @@
-import pandas as pd
 import os
-import glob
+import logging
 import json
 from datetime import datetime, timezone
-from graphviz import Digraph
-
-
-def get_latest_csv(dataset_name, folder="automated data"):
-    """Find the most recent CSV file for a given dataset in the specified folder."""
-    pattern = os.path.join(folder, f"{dataset_name}_*.csv")
-    files = glob.glob(pattern)
-    if not files:
-        print(f"No CSV file found for {dataset_name} in {folder}")
+from storage import (get_latest_csv, read_dataset, write_dataset, export_csv, dataset_columns, vintage_name,
+                     DEFAULT_FORMAT)
+from schemas import apply_schema
+from catalog import register_artifact, latest_artifact, find_latest_by_name
+from stage_cache import StageCache, fingerprint
+from log_setup import configure_logging
+from profiling import profiled, call_profiled, frame_memory_mb, write_profile
+from serving import publish_snapshot
+from lineage_graph import render_lineage_async
+
+logger = logging.getLogger(__name__)
+
+
+# Merged columns renamed in the cleaned data (_x columns come from zcta_data, _y from zcta_review)
+CLEANED_RENAMES = {
+    'latitude_x': 'zcta_latitude',
+    'longitude_x': 'zcta_longitude',
+    'latitude_y': 'city_latitude',
+    'longitude_y': 'city_longitude',
+    'notes': 'zcta_review_notes',
+}
+# Columns of the cleaned data, in order; every other merged column is never read
+CLEANED_COLUMNS = [
+    'zcta', 'zip', 'city', 'stusab', 'zcta_latitude', 'zcta_longitude',
+    'city_latitude', 'city_longitude', 'median_household_income',
+    'crime_grade', 'sunlight_hours_per_year', 'zcta_review_notes'
+]
+
+
+def get_latest_lineage(dataset_name, folder="automated data lineage"):
+    """Load the most recent lineage JSON for a dataset, resolved through the catalog."""
+    latest_file = get_latest_lineage_file(dataset_name, folder)
+    if latest_file is None:
         return None
-
-    # Extract timestamp from filename and find the most recent
-    def extract_timestamp(filepath):
-        filename = os.path.basename(filepath)
-        timestamp_str = filename.split('_')[-2] + '_' + filename.split('_')[-1].replace('.csv', '')
-        return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-
-    latest_file = max(files, key=extract_timestamp)
-    print(f"Found latest file for {dataset_name}: {latest_file}")
-    return latest_file
+    with open(latest_file, 'r') as f:
+        return json.load(f)
 
 
-def get_latest_lineage(dataset_name, folder="automated data"):
-    """Find the most recent lineage JSON file for a given dataset in the specified folder."""
-    pattern = os.path.join(folder, f"{dataset_name}_*.json")
-    files = glob.glob(pattern)
-    if not files:
-        print(f"No lineage file found for {dataset_name} in {folder}")
+def get_latest_lineage_file(dataset_name, folder="automated data lineage"):
+    """Find the most recent lineage JSON file for a dataset; uncatalogued files are found by name."""
+    record = latest_artifact(dataset_name)
+    latest_file = record['path'] if record is not None else find_latest_by_name(dataset_name, folder, ['.json'])
+    if latest_file is None:
+        logger.warning(f"No lineage file found for {dataset_name} in {folder}")
         return None
-
-    # Extract timestamp from filename and find the most recent
-    def extract_timestamp(filepath):
-        filename = os.path.basename(filepath)
-        timestamp_str = filename.split('_')[-2] + '_' + filename.split('_')[-1].replace('.json', '')
-        return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-
-    latest_file = max(files, key=extract_timestamp)
-    print(f"Found latest lineage file for {dataset_name}: {latest_file}")
-    with open(latest_file, 'r') as f:
-        return json.load(f)
+    logger.debug(f"Found latest lineage file for {dataset_name}: {latest_file}")
+    return latest_file
 
 
 def compare_distinct_values(df1, df2, columns, df1_name="merged_data", df2_name="cleaned_data"):
-    """Compare the number of distinct values for specified columns between two DataFrames."""
-    print("\nComparing distinct values between datasets:")
+    """Log the number of distinct values for specified columns of two DataFrames at debug level."""
     for col in columns:
         if col in df1.columns and col in df2.columns:
             df1_distinct = df1[col].nunique()
             df2_distinct = df2[col].nunique()
-            print(f"Distinct values for '{col}': {df1_name} = {df1_distinct}, {df2_name} = {df2_distinct}")
+            logger.debug(f"Distinct values for '{col}': {df1_name} = {df1_distinct}, {df2_name} = {df2_distinct}")
         else:
-            print(
+            logger.debug(
                 f"Column '{col}' not found in one or both datasets: {df1_name} = {col in df1.columns}, {df2_name} = {col in df2.columns}")
-    print()
-
 
-def generate_data_lineage_graph(lineage_data, output_path):
-    """Generate a data lineage graph using Graphviz."""
-    print("Generating data lineage graph...")
-    print(f"Output path: {output_path}")
-    print(f"Lineage data entries: {len(lineage_data)}")
-    for entry in lineage_data:
-        print(f"Lineage entry: {entry}")
 
-    dot = Digraph(comment='Data Lineage Graph', format='png')
-    dot.attr(rankdir='LR')  # Left to right layout
-
-    # Add nodes for datasets and operations
-    print("Building graph nodes and edges...")
-    for entry in lineage_data:
-        if entry['type'] == 'dataset':
-            node_id = entry['name']
-            label = f"{entry['name']}\\nShape: {entry['shape']}\\nColumns: {', '.join(entry['columns'])}"
-            dot.node(node_id, label=label, shape='box', style='filled', fillcolor='lightblue')
-        elif entry['type'] == 'merge':
-            node_id = f"merge_{entry['output']}"
-            label = f"Merge\\nJoin on: {entry['join_key']}"
-            dot.node(node_id, label=label, shape='ellipse', style='filled', fillcolor='lightgreen')
-            dot.edge(entry['input1'], node_id)
-            dot.edge(entry['input2'], node_id)
-            dot.edge(node_id, entry['output'])
-        elif entry['type'] == 'operation':
-            node_id = f"op_{entry['name']}"
-            label = f"{entry['name']}\\n{entry['details']}"
-            dot.node(node_id, label=label, shape='ellipse', style='filled', fillcolor='lightgreen')
-            dot.edge(entry['input'], node_id)
-            dot.edge(node_id, entry['output'])
-        elif entry['type'] == 'output':
-            node_id = entry['name']
-            label = f"{entry['name']}\\nShape: {entry['shape']}\\nColumns: {', '.join(entry['columns'])}"
-            dot.node(node_id, label=label, shape='box', style='filled', fillcolor='lightyellow')
-
-    # Save the graph with detailed error handling
-    try:
-        print(f"Attempting to render graph to: {output_path}")
-        dot.save(output_path + '.dot')  # Explicitly save the .dot file
-        print(f"Saved .dot file to: {output_path}.dot")
-        dot.render(output_path, view=False, cleanup=False)  # Keep the .dot file for debugging
-        print(f"Unified data lineage graph saved to: {output_path}.png")
-        # Verify the files exist
-        dot_file = f"{output_path}.dot"
-        png_file = f"{output_path}.png"
-        if os.path.exists(dot_file):
-            print(f"Found .dot file: {dot_file}")
-        else:
-            print(f".dot file not found: {dot_file}")
-        if os.path.exists(png_file):
-            print(f"Found .png file: {png_file}")
+def cleaned_columns(available):
+    """Return (source columns, output columns) of the cleaned data for the given merged data columns.
+
+    The output keeps CLEANED_COLUMNS that exist, in that order; each is read from the merged column
+    that CLEANED_RENAMES maps to it, or from the column of the same name.
+    """
+    sources = {new: old for old, new in CLEANED_RENAMES.items()}
+    source_columns, columns_to_keep = [], []
+    for column in CLEANED_COLUMNS:
+        source = sources.get(column, column)
+        if source in available:
+            source_columns.append(source)
+            columns_to_keep.append(column)
+    return source_columns, columns_to_keep
+
+
+def clean_data(merged_data=None, lineage_data=None, fmt=None, csv_export=False, use_cache=True, persist=True,
+               graph_format='png', vintage=None, timings=True):
+    """Rename, drop, reorder and select the merged columns and return (cleaned_data, lineage_data).
+
+    merged_data and lineage_data default to the latest merged_data and join_lineage artifacts; the
+    pipeline runner passes them in memory instead. With persist=False nothing is written.
+    lineage_data is None when a cached result was reused, and both are None without merged data.
+    The unified lineage is saved as cleaned_lineage, and its graph is rendered in graph_format by a
+    background thread (lineage_graph.render_lineage_async) after the data is written; None skips it.
+    timings=False leaves step timings and the slowest-step highlight out of the graph.
+    With a vintage year the inputs and outputs are the <name>_<vintage> datasets, and no serving
+    snapshot is published (serving always holds the current cleaned_data).
+    """
+    logger.info("Starting data cleaning process...")
+    cleaned_name = vintage_name("cleaned_data", vintage)
+
+    # Find the most recent merged data and lineage data from join_data.py unless they were handed over
+    join_lineage_file = None
+    merged_file = None
+    if merged_data is None:
+        join_lineage_file = get_latest_lineage_file(vintage_name("join_lineage", vintage))
+        merged_file = get_latest_csv(vintage_name("merged_data", vintage))
+        if not merged_file:
+            logger.error("Merged data is required. Exiting.")
+            return None, None
+
+    # Reuse the cached output when the merged data, its lineage and the parameters are unchanged
+    cache = StageCache() if use_cache else None
+    if cache is not None:
+        params = {'fmt': fmt or DEFAULT_FORMAT}
+        if vintage is not None:
+            params['vintage'] = vintage
+        if merged_file is not None:
+            cache_key = fingerprint("clean_data", [merged_file, join_lineage_file], params)
         else:
-            print(f".png file not found: {png_file}")
-    except Exception as e:
-        print(f"Error rendering Graphviz graph: {e}")
-        print("Ensure Graphviz is installed and the 'dot' executable is in your PATH.")
-        print(f"You can manually render the .dot file using: dot -Tpng {output_path}.dot -o {output_path}.png")
-
-
-def clean_data():
-    print("Starting data cleaning process...")
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"PATH environment variable: {os.environ['PATH']}")
-
-    # Load lineage data from join_data.py
-    join_lineage = get_latest_lineage("join_lineage")
-    lineage_data = join_lineage if join_lineage is not None else []
-
-    # Load the most recent merged data
-    merged_file = get_latest_csv("merged_data")
-    if not merged_file:
-        print("Merged data is required. Exiting.")
-        return
-
-    print("Loading merged data...")
-    merged_data = pd.read_csv(merged_file)
-    print(f"Initial columns in merged_data: {list(merged_data.columns)}")
-    print(f"Initial shape of merged_data: {merged_data.shape}")
-    lineage_data.append({
+            cache_key = fingerprint("clean_data", [], dict(params, lineage=lineage_data), frames=[merged_data])
+        entry = cache.get(cache_key)
+        if entry is not None:
+            if not persist:
+                logger.info("Inputs unchanged. Reusing cached cleaned data.")
+                return read_dataset(entry['files'][cleaned_name]['path']), None
+            output_path = cache.restore(entry)[cleaned_name]
+            logger.info(f"Inputs unchanged. Reusing cached cleaned data: {output_path}")
+            result = read_dataset(output_path)
+            if csv_export:
+                export_csv(result, output_path)
+            if vintage is None:
+                publish_snapshot(result, latest_artifact("cleaned_data")['sha256'])
+            return result, None
+
+    if merged_data is None:
+        lineage_data = []
+        if join_lineage_file is not None:
+            with open(join_lineage_file, 'r') as f:
+                lineage_data = json.load(f)
+        available = dataset_columns(merged_file)
+    else:
+        # Extend a copy so the caller's lineage list is left as it was
+        lineage_data = list(lineage_data or [])
+        available = list(merged_data.columns)
+    # Entries from here on are this stage's own steps
+    clean_start = len(lineage_data)
+    logger.debug(f"Initial columns in merged_data: {available}")
+
+    # Compute the final column set first so only those columns are read, then rename them
+    source_columns, columns_to_keep = cleaned_columns(available)
+    load_profile = None
+    if merged_data is None:
+        logger.info(f"Loading {len(source_columns)} of {len(available)} merged data columns...")
+        merged_data, load_profile = call_profiled(read_dataset, merged_file, source_columns)
+    with profiled() as project_profile:
+        result = merged_data if load_profile is not None else merged_data[source_columns]
+        # A renamed view of the columns; the merged frame itself keeps its names
+        result = result.set_axis(columns_to_keep, axis=1, copy=False)
+        result = apply_schema(result, 'cleaned_data')
+    project_profile.update(rows_in=len(merged_data), rows_out=len(result), memory_mb=frame_memory_mb(result))
+    logger.debug(f"Initial shape of merged_data: {(len(result), len(available))}")
+    merged_entry = {
         'type': 'dataset',
         'name': 'merged_data',
-        'shape': merged_data.shape,
-        'columns': list(merged_data.columns)
-    })
-
-    # Rename columns
-    merged_data = merged_data.rename(columns={
-        'latitude_x': 'zcta_latitude',
-        'longitude_x': 'zcta_longitude',
-        'latitude_y': 'city_latitude',
-        'longitude_y': 'city_longitude',
-        'notes': 'zcta_review_notes'
-    })
+        'shape': (len(result), len(available)),
+        'columns': available
+    }
+    if load_profile is not None:
+        merged_entry['profile'] = load_profile
+    lineage_data.append(merged_entry)
+    renamed = [f"{source}->{column}" for source, column in zip(source_columns, columns_to_keep) if source != column]
     lineage_data.append({
         'type': 'operation',
-        'name': 'rename_columns',
-        'details': 'Renamed: latitude_x->zcta_latitude, longitude_x->zcta_longitude, latitude_y->city_latitude, longitude_y->city_longitude, notes->zcta_review_notes',
+        'name': 'project_columns',
+        'details': f"Renamed: {', '.join(renamed)}\\nSelected: {', '.join(columns_to_keep)}",
         'input': 'merged_data',
-        'output': 'renamed_data'
-    })
-    lineage_data.append({
-        'type': 'output',
-        'name': 'renamed_data',
-        'shape': merged_data.shape,
-        'columns': list(merged_data.columns)
-    })
-
-    # Drop specified columns
-    columns_to_drop = ['point map url', 'zip map url', 'census_reporter_check']
-    merged_data = merged_data.drop(columns=columns_to_drop, errors='ignore')
-    lineage_data.append({
-        'type': 'operation',
-        'name': 'drop_columns',
-        'details': f"Dropped: {', '.join(columns_to_drop)}",
-        'input': 'renamed_data',
-        'output': 'dropped_data'
-    })
-    lineage_data.append({
-        'type': 'output',
-        'name': 'dropped_data',
-        'shape': merged_data.shape,
-        'columns': list(merged_data.columns)
-    })
-
-    # Reorder columns: start with zcta, zip, city, stusab, then the rest
-    priority_columns = ['zcta', 'zip', 'city', 'stusab']
-    priority_columns = [col for col in priority_columns if col in merged_data.columns]
-    remaining_columns = [col for col in merged_data.columns if col not in priority_columns]
-    new_column_order = priority_columns + remaining_columns
-    merged_data = merged_data[new_column_order]
-    lineage_data.append({
-        'type': 'operation',
-        'name': 'reorder_columns',
-        'details': f"Priority columns: {', '.join(priority_columns)}",
-        'input': 'dropped_data',
-        'output': 'reordered_data'
-    })
-    lineage_data.append({
-        'type': 'output',
-        'name': 'reordered_data',
-        'shape': merged_data.shape,
-        'columns': list(merged_data.columns)
-    })
-
-    # Select relevant columns
-    columns_to_keep = [
-        'zcta', 'zip', 'city', 'stusab', 'zcta_latitude', 'zcta_longitude',
-        'city_latitude', 'city_longitude', 'median_household_income',
-        'crime_grade', 'sunlight_hours_per_year', 'zcta_review_notes'
-    ]
-    columns_to_keep = [col for col in columns_to_keep if col in merged_data.columns]
-    result = merged_data[columns_to_keep]
-    lineage_data.append({
-        'type': 'operation',
-        'name': 'select_columns',
-        'details': f"Selected: {', '.join(columns_to_keep)}",
-        'input': 'reordered_data',
-        'output': 'cleaned_data'
+        'output': 'cleaned_data',
+        'profile': project_profile
     })
     lineage_data.append({
         'type': 'output',
@@ -227,41 +182,54 @@ def clean_data():
     })
 
     # Compare distinct values between merged_data and result
-    columns_to_compare = ['zcta', 'zip', 'city', 'stusab']
-    compare_distinct_values(merged_data, result, columns_to_compare)
+    if logger.isEnabledFor(logging.DEBUG):
+        columns_to_compare = ['zcta', 'zip', 'city', 'stusab']
+        compare_distinct_values(merged_data, result, columns_to_compare)
+
+    if not persist:
+        return result, lineage_data
 
     # Create automated data folder if it doesn't exist
     data_folder = "automated data"
     os.makedirs(data_folder, exist_ok=True)
-    print(f"Permissions for {data_folder}:")
-    os.system(f"ls -ld '{data_folder}'")
 
     # Create automated data lineage folder if it doesn't exist
     lineage_folder = "automated data lineage"
     os.makedirs(lineage_folder, exist_ok=True)
-    print(f"Permissions for {lineage_folder}:")
-    os.system(f"ls -ld '{lineage_folder}'")
 
-    # Generate unified data lineage graph
+    # Save the unified lineage; its graph is rendered from it off the critical path
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    # Sanitize the filename to avoid spaces and special characters
-    graph_filename = f"data_lineage_unified_{timestamp}".replace(" ", "_").replace("(", "").replace(")", "")
-    graph_path = os.path.join(lineage_folder, graph_filename)
-    generate_data_lineage_graph(lineage_data, graph_path)
-
-    # Generate CSV filename with UTC datetime
-    csv_filename = f"cleaned_data_{timestamp}.csv"
-    csv_path = os.path.join(data_folder, csv_filename)
-
-    # Save to CSV
-    print(f"Saving cleaned data to: {os.path.abspath(csv_path)}")
-    result.to_csv(csv_path, index=False)
-    print(f"Final cleaned data saved to {csv_path}")
-    print(f"Final columns in result: {list(result.columns)}")
-    print(f"Final shape of result: {result.shape}")
-    print("\nSample of final dataset:")
-    print(result.head())
+    lineage_file = os.path.join(lineage_folder, f"{vintage_name('cleaned_lineage', vintage)}_{timestamp}.json")
+    with open(lineage_file, 'w') as f:
+        json.dump(lineage_data, f, indent=4)
+    register_artifact(lineage_file, vintage_name("cleaned_lineage", vintage), rows=len(lineage_data),
+                      timestamp=timestamp)
+
+    # Save the per-step profile of this stage's own steps
+    profile_file = os.path.join(lineage_folder, f"{vintage_name('clean_profile', vintage)}_{timestamp}.json")
+    write_profile(lineage_data[clean_start:], "clean_data", profile_file)
+    logger.info(f"Profile saved to: {profile_file}")
+    register_artifact(profile_file, vintage_name("clean_profile", vintage), timestamp=timestamp)
+
+    # Save cleaned data with the same UTC timestamp as its lineage
+    inputs = [path for path in [merged_file, join_lineage_file] if path]
+    output_path = write_dataset(result, cleaned_name, folder=data_folder, fmt=fmt, timestamp=timestamp,
+                                csv_export=csv_export, inputs=inputs)
+    logger.info(f"Final cleaned data saved to {output_path}")
+    if cache is not None:
+        cache.put(cache_key, {cleaned_name: output_path})
+    # Publish the memory-mapped snapshot that lookup and enrichment workers attach to
+    if vintage is None:
+        publish_snapshot(result, latest_artifact("cleaned_data")['sha256'])
+    logger.info(f"Final shape of result: {result.shape}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Final columns in result: {list(result.columns)}")
+        logger.debug(f"Sample of final dataset:\n{result.head().to_string(index=False)}")
+    if graph_format:
+        render_lineage_async(lineage_data, graph_format, timings=timings)
+    return result, lineage_data
 
 
 if __name__ == "__main__":
+    configure_logging()
     clean_data()
\ No newline at end of file
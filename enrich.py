@@ -0,0 +1,196 @@
+import os
+import sys
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from catalog import CATALOG_FOLDER
+from storage import format_from_path, COMPRESSION
+from serving import ZctaLookupTable, latest_snapshot, SERVING_FOLDER, XREF_PATH
+from zcta_keys import parse_zcta_codes, format_zcta_codes
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+ZIP_COLUMN = 'zip_code'
+# Listing rows enriched at a time; memory use grows with this, not with the size of the file
+CHUNK_ROWS = 250_000
+# Enriched chunks per worker that may be queued or in flight at once
+PENDING_PER_WORKER = 2
+
+
+def read_batches(path, zip_column=ZIP_COLUMN, chunk_rows=CHUNK_ROWS):
+    """Yield the rows of a CSV, Parquet or Arrow listings file as Arrow record batches without loading it whole."""
+    fmt = format_from_path(path)
+    if fmt == 'parquet':
+        yield from pq.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+    elif fmt == 'arrow':
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index)
+    else:
+        # ZIP codes are read as text so that leading zeros survive
+        convert_options = pv.ConvertOptions(column_types={zip_column: pa.string()})
+        yield from pv.open_csv(path, convert_options=convert_options)
+
+
+def listings_schema(path, zip_column=ZIP_COLUMN):
+    """Return the Arrow schema read_batches yields for a listings file, from its header or metadata only."""
+    fmt = format_from_path(path)
+    if fmt == 'parquet':
+        return pq.read_schema(path)
+    if fmt == 'arrow':
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema
+    convert_options = pv.ConvertOptions(column_types={zip_column: pa.string()})
+    return pv.open_csv(path, convert_options=convert_options).schema
+
+
+def rebatch(batches, chunk_rows=CHUNK_ROWS):
+    """Regroup record batches of any size into tables of chunk_rows rows (the last one may be smaller)."""
+    pending = []
+    pending_rows = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunk_rows:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, chunk_rows)
+            rest = table.slice(chunk_rows)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending)
+
+
+def zcta_column_name(listing_columns):
+    return 'zcta' if 'zcta' not in listing_columns else 'zcta_zcta'
+
+
+def enrich_chunk(table, chunk, zip_column=ZIP_COLUMN):
+    """Return a listings chunk (Arrow table) with the ZCTA of its ZIP code and that ZCTA's cleaned columns appended.
+
+    Listings whose ZIP code is not in the zip_zcta_xref mapping, or whose ZCTA is not in the cleaned
+    data, get nulls. Cleaned columns whose name the listings already use get a _zcta suffix.
+    """
+    zctas = table.zctas_of_zips(parse_zcta_codes(chunk.column(zip_column).combine_chunks()))
+    attributes = table.gather(table.positions(zctas))
+    enriched = chunk.append_column(zcta_column_name(chunk.column_names),
+                                   format_zcta_codes(zctas))
+    for name in attributes.column_names:
+        if name == 'zcta':
+            continue
+        column_name = name if name not in enriched.column_names else f"{name}_zcta"
+        enriched = enriched.append_column(column_name, attributes.column(name))
+    return enriched
+
+
+def bounded_map(executor, function, items, max_pending):
+    """Like executor.map, in order, but submitting at most max_pending items ahead of the consumer."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ChunkWriter:
+    """Append Arrow tables to a CSV, Parquet or Arrow file, created with the schema of the first table."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or format_from_path(path)
+        self.writer = None
+
+    def write(self, table):
+        if self.writer is None:
+            if self.fmt == 'parquet':
+                self.writer = pq.ParquetWriter(self.path, table.schema, compression=COMPRESSION)
+            elif self.fmt == 'arrow':
+                self.writer = pa.ipc.new_file(self.path, table.schema)
+            else:
+                self.writer = pv.CSVWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def enrich_listings(listings_path, output_path, zip_column=ZIP_COLUMN, chunk_rows=CHUNK_ROWS, workers=1,
+                    catalog_folder=CATALOG_FOLDER, serving_folder=SERVING_FOLDER, xref_path=XREF_PATH):
+    """Stream a listings file through ZIP -> ZCTA normalization and the cleaned ZCTA columns into output_path.
+
+    The cleaned data is the memory-mapped serving snapshot of the latest cleaned_data artifact.
+    Listings are read, enriched and written chunk by chunk (in order), so memory stays bounded by
+    the chunk size; with workers > 1 chunks are enriched by a thread pool while earlier ones are written.
+    Returns the number of listing rows and of rows that got a ZCTA.
+    """
+    snapshot, record = latest_snapshot(catalog_folder, serving_folder, xref_path)
+    if record is None:
+        raise FileNotFoundError("No cleaned_data artifact to enrich the listings with")
+    logger.info(f"Enriching {listings_path} with {record['path']}")
+
+    table = ZctaLookupTable(snapshot)
+    chunks = rebatch(read_batches(listings_path, zip_column, chunk_rows), chunk_rows)
+    executor = None
+    if workers > 1:
+        # The Arrow and NumPy kernels release the GIL, so threads share one table without copying chunks
+        executor = ThreadPoolExecutor(workers)
+        enriched = bounded_map(executor, lambda chunk: enrich_chunk(table, chunk, zip_column), chunks,
+                               workers * PENDING_PER_WORKER)
+    else:
+        enriched = (enrich_chunk(table, chunk, zip_column) for chunk in chunks)
+
+    # Written under a temporary name, so a failed run never leaves a truncated output behind
+    tmp_path = f"{output_path}.tmp"
+    writer = ChunkWriter(tmp_path, format_from_path(output_path))
+    stats = {'rows': 0, 'matched': 0}
+    try:
+        for chunk in enriched:
+            writer.write(chunk)
+            stats['rows'] += chunk.num_rows
+            # The ZCTA column comes right after the listing columns, followed by the other cleaned columns
+            zcta_column = chunk.column(chunk.num_columns - len(table.columns))
+            stats['matched'] += chunk.num_rows - zcta_column.null_count
+            logger.debug(f"{stats['rows']} listings enriched")
+        if stats['rows'] == 0:
+            # No chunks: write the enriched columns of an empty listings table, so the output is still valid
+            writer.write(enrich_chunk(table, listings_schema(listings_path, zip_column).empty_table(), zip_column))
+    except BaseException:
+        writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    os.replace(tmp_path, output_path)
+    logger.info(f"{stats['matched']} of {stats['rows']} listings matched a ZCTA; saved to {output_path}")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append ZCTA attributes to a large listings file keyed by ZIP code.")
+    parser.add_argument("listings", help="Listings file (.csv, .parquet or .arrow)")
+    parser.add_argument("output", help="Enriched output file (.csv, .parquet or .arrow)")
+    parser.add_argument("--zip-column", default=ZIP_COLUMN)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1, help="Threads enriching chunks in parallel")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    enrich_listings(args.listings, args.output, args.zip_column, args.chunk_rows, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
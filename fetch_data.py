@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from storage import get_latest_csv, read_dataset, write_dataset, export_csv, DEFAULT_FORMAT
+from schemas import apply_schema
+from stage_cache import StageCache, fingerprint
+from http_cache import CachedSession, HTTP_CACHE_FOLDER
+from zcta_keys import format_zcta
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Census ACS 5-year detailed tables; a published vintage never changes, so its responses never go stale
+ACS_URL = "https://api.census.gov/data/{year}/acs/acs5"
+ACS_YEAR = 2023
+ACS_GEOGRAPHY = "zip code tabulation area"
+# ACS variables fetched for income_data and the columns they become
+INCOME_VARIABLES = {'B19013_001E': 'median_household_income'}
+# The API accepts at most 50 variables per request
+ACS_MAX_VARIABLES = 49
+# ZCTAs per request when specific ZCTAs are requested instead of all of them
+ACS_ZCTA_BATCH = 500
+# Annotation values the ACS uses in place of an estimate (not available, too few samples, ...)
+ACS_MISSING_BELOW = -100000000
+
+# CSV of ZCTA crime grades; the provider is configured per deployment
+CRIME_DATA_URL = os.environ.get("CRIME_DATA_URL")
+# Provider columns -> crime_data columns
+CRIME_COLUMNS = {'zcta': 'zcta', 'crime_grade': 'crime_grade'}
+# Crime grades are republished in place, so they are revalidated (ETag) after a day
+CRIME_TTL = 24 * 3600
+
+# NREL solar resource API: average daily global horizontal irradiance (kWh/m2/day = peak sun hours)
+NREL_URL = "https://developer.nrel.gov/api/solar/solar_resource/v1.json"
+# Coordinates are rounded so nearby ZCTAs share a request (0.01 degrees is about 1 km)
+NREL_COORDINATE_DECIMALS = 2
+NREL_TTL = 30 * 24 * 3600
+
+
+def responses_digest(responses):
+    """Hash the bodies of a list of cached responses (None for failed ones) into one fingerprint parameter."""
+    digest = hashlib.sha256()
+    for response in responses:
+        digest.update(response['sha256'].encode() if response else b'<failed>')
+    return digest.hexdigest()
+
+
+def acs_requests(variables, year=ACS_YEAR, zctas=None, api_key=None, base_url=ACS_URL):
+    """Return the (url, params) requests that fetch ACS variables for all ZCTAs (or the given ones).
+
+    Variables are batched to the API's per-request limit, and explicit ZCTA lists to ACS_ZCTA_BATCH.
+    """
+    variables = list(variables)
+    variable_batches = [variables[start:start + ACS_MAX_VARIABLES]
+                        for start in range(0, len(variables), ACS_MAX_VARIABLES)]
+    if zctas is None:
+        geographies = ["*"]
+    else:
+        codes = format_zcta(pd.Series(zctas)).dropna().unique().tolist()
+        geographies = [",".join(codes[start:start + ACS_ZCTA_BATCH]) for start in range(0, len(codes), ACS_ZCTA_BATCH)]
+    url = base_url.format(year=year)
+    requests_to_fetch = []
+    for batch in variable_batches:
+        for geography in geographies:
+            params = {'get': ",".join(batch), 'for': f"{ACS_GEOGRAPHY}:{geography}"}
+            if api_key:
+                params['key'] = api_key
+            requests_to_fetch.append((url, params))
+    return requests_to_fetch
+
+
+def parse_acs(responses, variables):
+    """Combine ACS JSON responses (a header row, then one row per ZCTA) into one row per ZCTA.
+
+    Annotation values (large negative numbers) become missing; columns are renamed with variables.
+    """
+    frames = {}
+    for response in responses:
+        with open(response['path'], 'r') as f:
+            rows = json.load(f)
+        frame = pd.DataFrame(rows[1:], columns=rows[0]).rename(columns={ACS_GEOGRAPHY: 'zcta'}).set_index('zcta')
+        batch = tuple(column for column in frame.columns if column in variables)
+        frames.setdefault(batch, []).append(frame[list(batch)])
+    # Geography batches of the same variables stack; variable batches sit side by side
+    combined = pd.concat([pd.concat(batches) for batches in frames.values()], axis=1)
+    result = pd.DataFrame({'zcta': combined.index.astype(str)})
+    for variable, column in variables.items():
+        values = pd.to_numeric(combined[variable], errors='coerce').to_numpy()
+        result[column] = np.where(values > ACS_MISSING_BELOW, values, np.nan)
+    return result.sort_values('zcta', ignore_index=True)
+
+
+def parse_crime(response, columns=CRIME_COLUMNS):
+    """Read a crime grade CSV and keep the configured columns under their crime_data names."""
+    crime = pd.read_csv(response['path'], usecols=list(columns), dtype=str)
+    crime = crime.rename(columns=columns)
+    crime['zcta'] = format_zcta(crime['zcta'])
+    return crime.dropna(subset=['zcta']).drop_duplicates('zcta')
+
+
+def nrel_requests(zcta_data, api_key, base_url=NREL_URL, decimals=NREL_COORDINATE_DECIMALS):
+    """Return (rounded coordinates per ZCTA, one (url, params) request per distinct rounded coordinate)."""
+    points = pd.DataFrame({
+        'zcta': zcta_data['zcta'],
+        'lat': zcta_data['latitude'].round(decimals),
+        'lon': zcta_data['longitude'].round(decimals),
+    }).dropna()
+    distinct = points[['lat', 'lon']].drop_duplicates(ignore_index=True)
+    requests_to_fetch = [(base_url, {'api_key': api_key, 'lat': lat, 'lon': lon})
+                         for lat, lon in distinct.itertuples(index=False)]
+    return points, distinct, requests_to_fetch
+
+
+def parse_nrel(response):
+    """Return the annual average GHI (peak sun hours per day) of an NREL solar resource response, or NaN."""
+    if response is None:
+        return np.nan
+    with open(response['path'], 'r') as f:
+        outputs = json.load(f).get('outputs') or {}
+    # avg_ghi is a string such as "no data" for coordinates outside the dataset
+    average = outputs.get('avg_ghi')
+    annual = average.get('annual') if isinstance(average, dict) else None
+    return float(annual) if isinstance(annual, (int, float)) else np.nan
+
+
+def save_fetched(dataset_name, df, cache, cache_key, fmt, csv_export, inputs):
+    """Write a fetched dataset as an artifact and record it in the stage cache; returns the artifact path."""
+    output_path = write_dataset(df, dataset_name, fmt=fmt, csv_export=csv_export, inputs=inputs)
+    logger.info(f"Saved {len(df)} rows of {dataset_name} to {output_path}")
+    if cache is not None:
+        cache.put(cache_key, {dataset_name: output_path})
+    return output_path
+
+
+def reuse_fetched(dataset_name, cache, cache_key, persist, csv_export):
+    """Return the cached artifact of unchanged responses (restored as the latest), or None."""
+    entry = cache.get(cache_key) if cache is not None else None
+    if entry is None:
+        return None
+    if not persist:
+        return read_dataset(entry['files'][dataset_name]['path'])
+    output_path = cache.restore(entry)[dataset_name]
+    logger.info(f"Responses unchanged. Reusing cached {dataset_name}: {output_path}")
+    df = read_dataset(output_path)
+    if csv_export:
+        export_csv(df, output_path)
+    return df
+
+
+def fetch_income_data(year=ACS_YEAR, variables=None, zctas=None, api_key=None, session=None, base_url=ACS_URL,
+                      fmt=None, csv_export=False, use_cache=True, persist=True):
+    """Fetch median household income (ACS table B19013) per ZCTA and store it as income_data.
+
+    variables maps ACS variables to output columns (default INCOME_VARIABLES). api_key defaults to
+    the CENSUS_API_KEY environment variable. Responses go through the HTTP cache, and unchanged
+    responses reuse the previous artifact instead of writing a new one.
+    """
+    logger.info(f"Fetching ACS {year} income data...")
+    variables = variables or INCOME_VARIABLES
+    session = session or CachedSession(HTTP_CACHE_FOLDER)
+    api_key = api_key or os.environ.get("CENSUS_API_KEY")
+    responses = session.fetch_many(acs_requests(variables, year, zctas, api_key, base_url))
+
+    cache = StageCache() if use_cache else None
+    cache_key = fingerprint("fetch_income_data", [], {'variables': variables, 'fmt': fmt or DEFAULT_FORMAT,
+                                                      'responses': responses_digest(responses)})
+    income_data = reuse_fetched("income_data", cache, cache_key, persist, csv_export)
+    if income_data is not None:
+        return income_data
+
+    income_data = apply_schema(parse_acs(responses, variables), 'income_data')
+    logger.info(f"Fetched income data for {len(income_data)} ZCTAs "
+                f"({income_data['median_household_income'].isna().sum()} without an estimate)")
+    if persist:
+        save_fetched("income_data", income_data, cache, cache_key, fmt, csv_export, [r['path'] for r in responses])
+    return income_data
+
+
+def fetch_crime_data(url=None, columns=None, session=None, fmt=None, csv_export=False, use_cache=True, persist=True):
+    """Download the crime grade CSV (default CRIME_DATA_URL) and store it as crime_data.
+
+    columns maps the provider's column names to zcta and crime_grade (default CRIME_COLUMNS).
+    """
+    url = url or CRIME_DATA_URL
+    if not url:
+        raise ValueError("No crime data URL; pass url or set the CRIME_DATA_URL environment variable")
+    logger.info("Fetching crime data...")
+    columns = columns or CRIME_COLUMNS
+    session = session or CachedSession(HTTP_CACHE_FOLDER, ttl=CRIME_TTL)
+    response = session.fetch(url)
+
+    cache = StageCache() if use_cache else None
+    cache_key = fingerprint("fetch_crime_data", [], {'columns': columns, 'fmt': fmt or DEFAULT_FORMAT,
+                                                     'responses': responses_digest([response])})
+    crime_data = reuse_fetched("crime_data", cache, cache_key, persist, csv_export)
+    if crime_data is not None:
+        return crime_data
+
+    crime_data = apply_schema(parse_crime(response, columns), 'crime_data')
+    logger.info(f"Fetched crime grades for {len(crime_data)} ZCTAs")
+    if persist:
+        save_fetched("crime_data", crime_data, cache, cache_key, fmt, csv_export, [response['path']])
+    return crime_data
+
+
+def fetch_sunlight_data(zcta_data=None, api_key=None, session=None, base_url=NREL_URL, fmt=None, csv_export=False,
+                        use_cache=True, persist=True):
+    """Fetch the average daily solar irradiance at every ZCTA's coordinates from NREL and store it as sunlight_data.
+
+    zcta_data defaults to the latest zcta_data artifact; api_key to the NREL_API_KEY environment
+    variable. ZCTAs whose request fails after its retries get missing values.
+    """
+    logger.info("Fetching sunlight data...")
+    if zcta_data is None:
+        zcta_file = get_latest_csv("zcta_data")
+        if not zcta_file:
+            raise FileNotFoundError("ZCTA data is required to fetch sunlight data")
+        zcta_data = read_dataset(zcta_file)
+    session = session or CachedSession(HTTP_CACHE_FOLDER, ttl=NREL_TTL)
+    api_key = api_key or os.environ.get("NREL_API_KEY", "DEMO_KEY")
+    points, distinct, requests_to_fetch = nrel_requests(zcta_data, api_key, base_url)
+    logger.info(f"Requesting {len(requests_to_fetch)} distinct coordinates for {len(points)} ZCTAs")
+    responses = session.fetch_many(requests_to_fetch, skip_errors=True)
+
+    cache = StageCache() if use_cache else None
+    cache_key = fingerprint("fetch_sunlight_data", [], {'fmt': fmt or DEFAULT_FORMAT,
+                                                        'responses': responses_digest(responses)},
+                            frames=[points])
+    sunlight_data = reuse_fetched("sunlight_data", cache, cache_key, persist, csv_export)
+    if sunlight_data is not None:
+        return sunlight_data
+
+    distinct['peak_sun_hours_per_day'] = [parse_nrel(response) for response in responses]
+    sunlight_data = points.merge(distinct, on=['lat', 'lon'], how='left')[['zcta', 'peak_sun_hours_per_day']]
+    sunlight_data['sunlight_hours_per_year'] = sunlight_data['peak_sun_hours_per_day'] * 365
+    sunlight_data = apply_schema(sunlight_data, 'sunlight_data')
+    logger.info(f"Fetched sunlight data for {sunlight_data['peak_sun_hours_per_day'].notna().sum()} "
+                f"of {len(sunlight_data)} ZCTAs")
+    if persist:
+        save_fetched("sunlight_data", sunlight_data, cache, cache_key, fmt, csv_export, [])
+    return sunlight_data
+
+
+FETCHERS = {
+    'income_data': fetch_income_data,
+    'crime_data': fetch_crime_data,
+    'sunlight_data': fetch_sunlight_data,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the income, crime and sunlight source data.")
+    parser.add_argument("datasets", nargs="*", default=list(FETCHERS), choices=list(FETCHERS),
+                        help="Datasets to fetch (default: all)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    for dataset_name in args.datasets:
+        FETCHERS[dataset_name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
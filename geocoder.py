@@ -0,0 +1,151 @@
+import os
+import sys
+import glob
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import shapely
+from get_zcta_data import read_zcta_polygons, SHAPEFILE_PATH, ZCTA_FIELD
+from stage_cache import fingerprint
+from zcta_keys import parse_zcta, format_zcta
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_FOLDER = os.path.join("automated data", "geocoder")
+# Longitude/latitude CRS the index and the query points use
+GEOCODER_CRS = "EPSG:4326"
+# Points outside every polygon are assigned the nearest ZCTA within this many degrees (about 5 km)
+MAX_NEAREST_DISTANCE = 0.05
+# Points geocoded per STRtree query, bounding the size of the intermediate arrays
+CHUNK_SIZE = 1_000_000
+
+
+def build_index(shapefile_path=SHAPEFILE_PATH, index_folder=INDEX_FOLDER):
+    """Write the ZCTA polygons of a shapefile as a WKB Parquet index and return its path.
+
+    The index file is named after a fingerprint of the shapefile, so an unchanged shapefile is
+    never read twice and a changed one gets a new index.
+    """
+    shapefile_files = sorted(glob.glob(os.path.splitext(shapefile_path)[0] + ".*"))
+    key = fingerprint("zcta_geocoder", shapefile_files, cache_folder=index_folder)
+    index_path = os.path.join(index_folder, f"zcta_polygons_{key[:16]}.parquet")
+    if os.path.exists(index_path):
+        return index_path
+    zcta_gdf = read_zcta_polygons(shapefile_path)
+    if zcta_gdf.crs is not None:
+        zcta_gdf = zcta_gdf.to_crs(GEOCODER_CRS)
+    polygons = pd.DataFrame({
+        'zcta': parse_zcta(zcta_gdf[ZCTA_FIELD]),
+        'wkb': shapely.to_wkb(zcta_gdf.geometry.to_numpy()),
+    })
+    os.makedirs(index_folder, exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    polygons.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Geocoder index with {len(polygons)} ZCTA polygons saved to {index_path}")
+    return index_path
+
+
+class ZctaGeocoder:
+    """Assign ZCTAs to batches of latitude/longitude points with an STRtree over the ZCTA polygons."""
+
+    def __init__(self, zctas, polygons):
+        self.zctas = pd.array(zctas, dtype="UInt32")
+        self.polygons = polygons
+        # Prepared polygons make the repeated point-in-polygon tests much cheaper
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+
+    @classmethod
+    def load(cls, index_path):
+        """Load a geocoder from an index written by build_index."""
+        polygons = pd.read_parquet(index_path)
+        return cls(polygons['zcta'], shapely.from_wkb(polygons['wkb'].to_numpy()))
+
+    @classmethod
+    def from_shapefile(cls, shapefile_path=SHAPEFILE_PATH, index_folder=INDEX_FOLDER):
+        """Load the geocoder for a shapefile, building its index first if needed."""
+        return cls.load(build_index(shapefile_path, index_folder))
+
+    def _geocode_chunk(self, latitudes, longitudes, max_distance):
+        count = len(latitudes)
+        positions = np.full(count, -1, dtype=np.intp)
+        distances = np.full(count, np.nan)
+        valid = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        points = shapely.points(longitudes[valid], latitudes[valid])
+
+        # Point-in-polygon; a point on a shared boundary takes the first polygon it touches
+        point_index, polygon_index = self.tree.query(points, predicate='intersects')
+        first = np.unique(point_index, return_index=True)[1]
+        positions[valid[point_index[first]]] = polygon_index[first]
+        distances[valid[point_index[first]]] = 0.0
+
+        # Nearest polygon for points that fall in gaps between polygons (water, unassigned land)
+        in_gap = np.flatnonzero(positions[valid] < 0)
+        if len(in_gap) and max_distance != 0:
+            (gap_index, polygon_index), gap_distances = self.tree.query_nearest(
+                points[in_gap], max_distance=max_distance, return_distance=True, all_matches=False)
+            positions[valid[in_gap[gap_index]]] = polygon_index
+            distances[valid[in_gap[gap_index]]] = gap_distances
+        return positions, distances
+
+    def geocode(self, latitudes, longitudes, max_distance=MAX_NEAREST_DISTANCE, chunk_size=CHUNK_SIZE):
+        """Return a DataFrame with the ZCTA, match method and distance (degrees) of every point.
+
+        method is 'contains' for points inside a ZCTA, 'nearest' for points matched to the nearest
+        ZCTA within max_distance (None for no limit, 0 to disable), and missing for points that
+        are unmatched or have no coordinates.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        positions = np.empty(len(latitudes), dtype=np.intp)
+        distances = np.empty(len(latitudes))
+        for start in range(0, len(latitudes), chunk_size):
+            stop = start + chunk_size
+            positions[start:stop], distances[start:stop] = self._geocode_chunk(
+                latitudes[start:stop], longitudes[start:stop], max_distance)
+        matched = positions >= 0
+        zctas = self.zctas.take(positions, allow_fill=True)
+        method = np.where(distances == 0.0, 'contains', 'nearest').astype(object)
+        method[~matched] = None
+        logger.info(f"Geocoded {matched.sum()} of {len(positions)} points "
+                    f"({(distances[matched] > 0).sum()} by nearest polygon)")
+        return pd.DataFrame({
+            'zcta': format_zcta(pd.Series(zctas)),
+            'geocode_method': pd.Series(method, dtype='string'),
+            'geocode_distance': distances,
+        })
+
+    def geocode_frame(self, df, latitude_column='latitude', longitude_column='longitude', **kwargs):
+        """Return a copy of df with the geocode columns of its latitude/longitude columns added."""
+        result = self.geocode(df[latitude_column].to_numpy(dtype=float, na_value=np.nan),
+                              df[longitude_column].to_numpy(dtype=float, na_value=np.nan), **kwargs)
+        result.index = df.index
+        return df.drop(columns=[col for col in result.columns if col in df.columns]).join(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign ZCTAs to the latitude/longitude points of a CSV.")
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--latitude-column", default="latitude")
+    parser.add_argument("--longitude-column", default="longitude")
+    parser.add_argument("--shapefile", default=SHAPEFILE_PATH)
+    parser.add_argument("--max-distance", type=float, default=MAX_NEAREST_DISTANCE,
+                        help="Degrees to search for the nearest ZCTA of points in gaps (0 disables)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    geocoder = ZctaGeocoder.from_shapefile(args.shapefile)
+    points = pd.read_csv(args.input_csv)
+    geocoded = geocoder.geocode_frame(points, args.latitude_column, args.longitude_column,
+                                      max_distance=args.max_distance)
+    geocoded.to_csv(args.output_csv, index=False)
+    logger.info(f"Geocoded points saved to {args.output_csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import sys
+import glob
+import logging
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+from catalog import register_artifact
+from storage import export_csv, vintage_name, COMPRESSION
+from stage_cache import StageCache, fingerprint
+from get_zcta_data import (shapefile_path, layer_fields, read_shapefile_fields, ZCTA_FIELD, ALAND_FIELD,
+                           AWATER_FIELD, CENTROID_CRS)
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Longitude/latitude CRS of the output, as map front ends expect
+GEOMETRY_CRS = "EPSG:4326"
+# Simplification tolerance in degrees (about 100 m); enough detail for ZCTA outlines on a map. Coverage
+# simplification (Visvalingam-Whyatt) removes triangles of roughly this square root of area
+SIMPLIFY_TOLERANCE = 0.001
+# Shards per worker process, so a shard of unusually complex polygons does not hold up the others
+SHARDS_PER_WORKER = 4
+# Rows per Parquet row group; with the rows in Hilbert order each group covers a compact area, so
+# readers skip groups by their bbox statistics
+ROW_GROUP_ROWS = 2000
+SQUARE_METERS_PER_SQKM = 1e6
+
+
+def process_shard(shard):
+    """Compute the geometry products of one shard of WKB polygons; runs in a worker process.
+
+    shard is (wkb array, number of shard polygons, source CRS, tolerance). The wkb array holds the
+    shard's polygons followed by their neighbors from other shards. Returns a DataFrame with the
+    equal-area polygon area, the vertex counts before and after simplification and the simplified
+    outline (WKB) in GEOMETRY_CRS, for the shard polygons only.
+    """
+    wkb, count, source_crs, tolerance = shard
+    polygons = shapely.from_wkb(wkb)
+    # Coordinates are reprojected as whole arrays rather than point by point
+    to_area = Transformer.from_crs(source_crs, CENTROID_CRS, always_xy=True)
+    to_output = Transformer.from_crs(source_crs, GEOMETRY_CRS, always_xy=True)
+    area = shapely.area(shapely.transform(polygons[:count], to_area.transform, interleaved=False))
+    outlines = shapely.transform(polygons, to_output.transform, interleaved=False)
+    # Coverage simplification simplifies every border shared by two ZCTAs once, as one edge, so
+    # neighbors keep meeting without gaps or overlaps. The neighbors from other shards are simplified
+    # along, so the shard's borders with them come out the same in both shards
+    simplified = shapely.coverage_simplify(outlines, tolerance)[:count]
+    return pd.DataFrame({
+        'area_sqkm': area / SQUARE_METERS_PER_SQKM,
+        'vertices': shapely.get_num_coordinates(polygons[:count]),
+        'simplified_vertices': shapely.get_num_coordinates(simplified),
+        'wkb': shapely.to_wkb(simplified),
+    })
+
+
+def read_polygons(shapefile):
+    """Read the ZCTA code, land/water area attributes and polygons of a shapefile under 2020-based names."""
+    fields = layer_fields(shapefile, (ZCTA_FIELD, ALAND_FIELD, AWATER_FIELD))
+    available = read_shapefile_fields(shapefile)
+    columns = [field for field, name in fields.items() if name in available]
+    return gpd.read_file(shapefile, columns=columns).rename(columns=fields)
+
+
+def build_geometry(zcta_gdf, tolerance=SIMPLIFY_TOLERANCE, workers=None):
+    """Return a GeoDataFrame of ZCTA areas, land fraction and simplified outlines in Hilbert curve order.
+
+    The polygons are sorted along a Hilbert curve and cut into shards of consecutive polygons, sent as
+    WKB (cheap to send between processes) to a process pool of workers (default: one per CPU). Each
+    shard carries the polygons of other shards that touch it, so shared borders are simplified alike
+    on both sides. land_area_sqkm and water_area_sqkm come from the TIGER ALAND/AWATER attributes
+    when present; area_sqkm is measured on the polygons in an equal-area projection.
+    """
+    workers = workers or os.cpu_count()
+    source_crs = zcta_gdf.crs or "EPSG:4269"
+    # Spatial sort: nearby ZCTAs end up in the same shards and row groups
+    order = np.argsort(zcta_gdf.geometry.hilbert_distance(), kind='stable')
+    zcta_gdf = zcta_gdf.iloc[order].reset_index(drop=True)
+    polygons = zcta_gdf.geometry.to_numpy()
+    wkb = shapely.to_wkb(polygons)
+    tree = shapely.STRtree(polygons)
+    shard_count = max(1, min(len(zcta_gdf), workers * SHARDS_PER_WORKER))
+    shards = []
+    for members in np.array_split(np.arange(len(polygons)), shard_count):
+        touching = np.unique(tree.query(polygons[members], predicate='intersects')[1])
+        neighbors = np.setdiff1d(touching, members)
+        shards.append((np.concatenate([wkb[members], wkb[neighbors]]), len(members), source_crs, tolerance))
+    if workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(process_shard, shards))
+    else:
+        results = [process_shard(shard) for shard in shards]
+    products = pd.concat(results, ignore_index=True)
+    logger.info(f"Simplified {len(products)} ZCTA outlines from {products['vertices'].sum()} to "
+                f"{products['simplified_vertices'].sum()} vertices")
+
+    missing = np.full(len(zcta_gdf), np.nan)
+    land = zcta_gdf[ALAND_FIELD].to_numpy(dtype=float) if ALAND_FIELD in zcta_gdf else missing
+    water = zcta_gdf[AWATER_FIELD].to_numpy(dtype=float) if AWATER_FIELD in zcta_gdf else missing
+    return gpd.GeoDataFrame({
+        'zcta': zcta_gdf[ZCTA_FIELD].to_numpy(),
+        'area_sqkm': products['area_sqkm'].to_numpy(),
+        'land_area_sqkm': land / SQUARE_METERS_PER_SQKM,
+        'water_area_sqkm': water / SQUARE_METERS_PER_SQKM,
+        'land_fraction': land / (land + water),
+    }, geometry=gpd.GeoSeries.from_wkb(products['wkb'].to_numpy(), crs=GEOMETRY_CRS))
+
+
+def attributes(geometry):
+    """Return the columns of a geometry GeoDataFrame other than its outlines, as a plain DataFrame."""
+    return pd.DataFrame(geometry.drop(columns=[geometry.geometry.name, 'bbox'], errors='ignore'))
+
+
+def write_geoparquet(geometry, path):
+    """Write a GeoDataFrame as GeoParquet with a bbox covering column and small row groups; returns path."""
+    # Written under a temporary name, so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    geometry.to_parquet(tmp_path, index=False, compression=COMPRESSION, write_covering_bbox=True,
+                        row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_zcta_geometry(vintage=None, tolerance=SIMPLIFY_TOLERANCE, workers=None, folder="automated data",
+                      csv_export=False, use_cache=True):
+    """Build the zcta_geometry GeoParquet artifact from the ZCTA shapefile and return it as a GeoDataFrame.
+
+    vintage selects the TIGER/Line year as in get_zcta_data. With use_cache=True an unchanged
+    shapefile and tolerance reuse the previous artifact. csv_export writes the attributes (without
+    outlines) as a CSV copy.
+    """
+    logger.info("Starting ZCTA geometry processing...")
+    shapefile = shapefile_path(vintage)
+    if not os.path.exists(shapefile):
+        raise FileNotFoundError(f"Shapefile not found at: {shapefile}")
+    dataset_name = vintage_name("zcta_geometry", vintage)
+
+    cache = StageCache() if use_cache else None
+    if cache is not None:
+        shapefile_files = sorted(glob.glob(os.path.splitext(shapefile)[0] + ".*"))
+        cache_key = fingerprint("get_zcta_geometry", shapefile_files, {'tolerance': tolerance, 'vintage': vintage})
+        entry = cache.get(cache_key)
+        if entry is not None:
+            output_path = cache.restore(entry)[dataset_name]
+            logger.info(f"Shapefile and parameters unchanged. Reusing cached ZCTA geometry: {output_path}")
+            geometry = gpd.read_parquet(output_path)
+            if csv_export:
+                export_csv(attributes(geometry), output_path)
+            return geometry
+
+    zcta_gdf = read_polygons(shapefile)
+    logger.info(f"Loaded {len(zcta_gdf)} ZCTA polygons from {shapefile}")
+    geometry = build_geometry(zcta_gdf, tolerance, workers)
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    os.makedirs(folder, exist_ok=True)
+    output_path = write_geoparquet(geometry, os.path.join(folder, f"{dataset_name}_{timestamp}.parquet"))
+    exports = [export_csv(attributes(geometry), output_path)] if csv_export else []
+    register_artifact(output_path, dataset_name, df=geometry, inputs=[shapefile], exports=exports,
+                      timestamp=timestamp, catalog_folder=folder)
+    logger.info(f"Saved geometry of {len(geometry)} ZCTAs to {output_path}")
+    if cache is not None:
+        cache.put(cache_key, {dataset_name: output_path}, catalog_folder=folder)
+    return geometry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute ZCTA areas and simplified outlines as GeoParquet.")
+    parser.add_argument("--vintage", type=int, help="TIGER/Line year (default: the SHAPEFILE_PATH shapefile)")
+    parser.add_argument("--tolerance", type=float, default=SIMPLIFY_TOLERANCE,
+                        help="Simplification tolerance in degrees")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    get_zcta_geometry(args.vintage, args.tolerance, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
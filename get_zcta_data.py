@@ -1,48 +1,163 @@
+import logging
 import geopandas as gpd
 import pandas as pd
+import pyogrio
 import os
-from tqdm import tqdm
-from datetime import datetime, timezone
+import re
+import glob
+from storage import write_dataset, read_dataset, export_csv, vintage_name, DEFAULT_FORMAT
+from stage_cache import StageCache, fingerprint
+from log_setup import configure_logging
 
+logger = logging.getLogger(__name__)
 
-def get_zcta_data():
-    print("Starting ZCTA data extraction...")
-    shapefile_path = os.path.join("manual data", "tl_2024_us_zcta520", "tl_2024_us_zcta520.shp")
+SHAPEFILE_PATH = os.path.join("manual data", "tl_2024_us_zcta520", "tl_2024_us_zcta520.shp")
+# Other TIGER/Line vintages sit next to it as tl_<year>_us_zcta5<census>/tl_<year>_us_zcta5<census>.shp
+VINTAGE_PATTERN = os.path.join("manual data", "tl_{vintage}_us_zcta5*", "tl_{vintage}_us_zcta5*.shp")
 
-    # Verify shapefile exists
-    print(f"Checking shapefile path: {shapefile_path}")
-    if not os.path.exists(shapefile_path):
-        raise FileNotFoundError(f"Shapefile not found at: {shapefile_path}")
-
-    # Read shapefile with progress bar
-    print("Reading ZCTA shapefile...")
-    zcta_gdf = gpd.read_file(shapefile_path)
-    print(f"Loaded {len(zcta_gdf)} ZCTA records from shapefile")
-
-    # Extract data with progress bar
-    print("Extracting ZCTA information...")
-    zcta_data = pd.DataFrame({
-        'zcta': zcta_gdf['ZCTA5CE20'],
-        'latitude': [p.y for p in tqdm(zcta_gdf.geometry.centroid, desc="Calculating centroids (latitude)")],
-        'longitude': [p.x for p in tqdm(zcta_gdf.geometry.centroid, desc="Calculating centroids (longitude)")]
+# TIGER/Line ZCTA attribute names for the 2020-based ZCTA5 layer; rows of other layers are renamed to these
+ZCTA_FIELD = "ZCTA5CE20"
+INTPTLAT_FIELD = "INTPTLAT20"
+INTPTLON_FIELD = "INTPTLON20"
+# Land and water area in square meters
+ALAND_FIELD = "ALAND20"
+AWATER_FIELD = "AWATER20"
+
+# Equal-area projection used when true polygon centroids are requested
+CENTROID_CRS = "EPSG:5070"
+
+
+def shapefile_path(vintage=None):
+    """Return the ZCTA shapefile of a TIGER/Line vintage year (SHAPEFILE_PATH when vintage is None)."""
+    if vintage is None:
+        return SHAPEFILE_PATH
+    matches = sorted(glob.glob(VINTAGE_PATTERN.format(vintage=vintage)))
+    if not matches:
+        raise FileNotFoundError(f"No {vintage} ZCTA shapefile matching {VINTAGE_PATTERN.format(vintage=vintage)}")
+    # A vintage published for several censuses (zcta510 and zcta520) uses the most recent one
+    return matches[-1]
+
+
+def layer_fields(shapefile_path, fields=(ZCTA_FIELD, INTPTLAT_FIELD, INTPTLON_FIELD)):
+    """Return {layer attribute: 2020-based name} of the given 2020-based fields for a shapefile's ZCTA layer.
+
+    2010-based layers (tl_<year>_us_zcta510) suffix their attributes with 10 instead of 20.
+    """
+    match = re.search(r"zcta5(\d\d)", os.path.basename(shapefile_path))
+    census = match.group(1) if match else "20"
+    return {f"{field[:-2]}{census}": field for field in fields}
+
+
+def read_shapefile_fields(shapefile_path):
+    """Return the attribute column names of a shapefile from its layer metadata only, under 2020-based names."""
+    fields = layer_fields(shapefile_path, (ZCTA_FIELD, INTPTLAT_FIELD, INTPTLON_FIELD, ALAND_FIELD, AWATER_FIELD))
+    return [fields.get(column, column) for column in pyogrio.read_info(shapefile_path)['fields']]
+
+
+def extract_internal_points(shapefile_path):
+    """Read ZCTA codes and Census internal points from the attribute table only (no geometry)."""
+    fields = layer_fields(shapefile_path)
+    attributes = gpd.read_file(
+        shapefile_path,
+        columns=list(fields),
+        ignore_geometry=True,
+    ).rename(columns=fields)
+    return pd.DataFrame({
+        'zcta': attributes[ZCTA_FIELD],
+        'latitude': pd.to_numeric(attributes[INTPTLAT_FIELD], errors='coerce'),
+        'longitude': pd.to_numeric(attributes[INTPTLON_FIELD], errors='coerce'),
     })
 
-    # Create data folder if it doesn't exist
-    data_folder = "automated data"
-    os.makedirs(data_folder, exist_ok=True)
 
-    # Generate CSV filename with UTC datetime
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    csv_filename = f"zcta_data_{timestamp}.csv"
-    csv_path = os.path.join(data_folder, csv_filename)
+def read_zcta_polygons(shapefile_path):
+    """Read the ZCTA code and polygon of every ZCTA in the shapefile (no other attributes)."""
+    fields = layer_fields(shapefile_path)
+    zcta_field = next(field for field, name in fields.items() if name == ZCTA_FIELD)
+    zcta_gdf = gpd.read_file(shapefile_path, columns=[zcta_field]).rename(columns=fields)
+    logger.info(f"Loaded {len(zcta_gdf)} ZCTA polygons from shapefile")
+    return zcta_gdf
+
+
+def extract_centroids(shapefile_path):
+    """Read ZCTA polygons and compute their centroids once, vectorized, in a projected CRS."""
+    zcta_gdf = read_zcta_polygons(shapefile_path)
+    source_crs = zcta_gdf.crs or "EPSG:4269"
+    centroids = zcta_gdf.geometry.to_crs(CENTROID_CRS).centroid.to_crs(source_crs)
+    return pd.DataFrame({
+        'zcta': zcta_gdf[ZCTA_FIELD].to_numpy(),
+        'latitude': centroids.y.to_numpy(),
+        'longitude': centroids.x.to_numpy(),
+    })
+
+
+def get_zcta_data(coordinates="internal_point", fmt=None, csv_export=False, use_cache=True, persist=True,
+                  vintage=None):
+    """Extract one row per ZCTA with a representative latitude/longitude.
+
+    coordinates="internal_point" uses the shapefile's INTPTLAT20/INTPTLON20 attributes and
+    skips loading geometry; it falls back to centroids when those fields are absent.
+    coordinates="centroid" always computes polygon centroids. The result is stored with
+    storage.write_dataset in the given format (Parquet by default). With use_cache=True an
+    unchanged shapefile and parameters reuse the previously extracted artifact. With persist=False
+    nothing is written and the DataFrame is only returned. vintage selects the TIGER/Line year
+    (see shapefile_path) and is written as zcta_data_<vintage>; by default SHAPEFILE_PATH is read.
+    """
+    logger.info(f"Starting ZCTA data extraction{'' if vintage is None else f' for {vintage}'}...")
+    dataset_name = vintage_name("zcta_data", vintage)
+    shapefile = shapefile_path(vintage)
+
+    # Verify shapefile exists
+    logger.debug(f"Checking shapefile path: {shapefile}")
+    if not os.path.exists(shapefile):
+        raise FileNotFoundError(f"Shapefile not found at: {shapefile}")
+    if coordinates not in ("internal_point", "centroid"):
+        raise ValueError(f"Unknown coordinates mode: {coordinates}")
+
+    # Reuse the cached output when the shapefile (and its sidecar files) and parameters are unchanged
+    cache = StageCache() if use_cache else None
+    if cache is not None:
+        shapefile_files = sorted(glob.glob(os.path.splitext(shapefile)[0] + ".*"))
+        params = {'coordinates': coordinates, 'fmt': fmt or DEFAULT_FORMAT}
+        if vintage is not None:
+            params['vintage'] = vintage
+        cache_key = fingerprint("get_zcta_data", shapefile_files, params)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            if not persist:
+                logger.info("Shapefile and parameters unchanged. Reusing cached ZCTA data.")
+                return read_dataset(entry['files'][dataset_name]['path'])
+            output_path = cache.restore(entry)[dataset_name]
+            logger.info(f"Shapefile and parameters unchanged. Reusing cached ZCTA data: {output_path}")
+            zcta_data = read_dataset(output_path)
+            if csv_export:
+                export_csv(zcta_data, output_path)
+            return zcta_data
+
+    if coordinates == "internal_point":
+        fields = read_shapefile_fields(shapefile)
+        if INTPTLAT_FIELD in fields and INTPTLON_FIELD in fields:
+            logger.info("Reading ZCTA internal points from shapefile attributes (geometry skipped)...")
+            zcta_data = extract_internal_points(shapefile)
+        else:
+            logger.warning(f"{INTPTLAT_FIELD}/{INTPTLON_FIELD} not in shapefile. Falling back to centroids.")
+            coordinates = "centroid"
+
+    if coordinates == "centroid":
+        logger.info(f"Reading ZCTA shapefile and computing centroids in {CENTROID_CRS}...")
+        zcta_data = extract_centroids(shapefile)
+    logger.info(f"Extracted coordinates for {len(zcta_data)} ZCTA records")
+    if not persist:
+        return zcta_data
 
-    # Save to CSV
-    print(f"Saving data to: {os.path.abspath(csv_path)}")
-    zcta_data.to_csv(csv_path, index=False)
-    print(f"Successfully extracted and saved data for {len(zcta_data)} ZCTAs to {csv_path}")
+    # Save as a timestamped artifact in the automated data folder
+    output_path = write_dataset(zcta_data, dataset_name, fmt=fmt, csv_export=csv_export, inputs=[shapefile])
+    logger.info(f"Successfully extracted and saved data for {len(zcta_data)} ZCTAs to {output_path}")
+    if cache is not None:
+        cache.put(cache_key, {dataset_name: output_path})
 
     return zcta_data
 
 
 if __name__ == "__main__":
-    get_zcta_data()
\ No newline at end of file
+    configure_logging()
+    get_zcta_data()
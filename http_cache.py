@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_FOLDER = os.path.join("automated data", "http_cache")
+# Parallel requests; also the size of the session's connection pool
+MAX_WORKERS = 8
+RETRIES = 5
+# Retries wait backoff * 2**attempt seconds (or the server's Retry-After)
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+TIMEOUT = 60
+# Query parameters that are credentials: they select no data, so they are left out of cache keys and metadata
+SECRET_PARAMS = ('key', 'api_key')
+
+
+def cache_key(url, params=None):
+    """Return the cache key of a GET request: a hash of the URL and its non-secret query parameters."""
+    public = sorted((name, str(value)) for name, value in (params or {}).items() if name not in SECRET_PARAMS)
+    return hashlib.sha256(json.dumps([url, public]).encode()).hexdigest()
+
+
+def _expires_at(response, ttl):
+    """Return when a response goes stale (epoch seconds), from Cache-Control/Expires or else ttl; None never."""
+    for directive in response.headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name == 'no-cache' or name == 'no-store':
+            return time.time()
+        if name == 'max-age' and value.isdigit():
+            return time.time() + int(value)
+    if 'Expires' in response.headers:
+        try:
+            return parsedate_to_datetime(response.headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+    return None if ttl is None else time.time() + ttl
+
+
+class CachedSession:
+    """A pooled requests session with retries and an on-disk response cache.
+
+    Every response body is stored under cache_folder with a metadata file holding its ETag,
+    Last-Modified, SHA-256 and expiry. A fresh entry is served without a request; a stale one is
+    revalidated with If-None-Match/If-Modified-Since, so an unchanged resource costs a 304 only.
+    ttl is the default lifetime in seconds when the server sends no caching headers (None: never
+    stale, for immutable resources like a published ACS vintage). Safe to share between threads.
+    """
+
+    def __init__(self, cache_folder=HTTP_CACHE_FOLDER, max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF,
+                 timeout=TIMEOUT, ttl=None):
+        self.cache_folder = cache_folder
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=['GET'], respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {'fresh': 0, 'revalidated': 0, 'downloaded': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def fetch(self, url, params=None, ttl=...):
+        """GET a URL through the cache and return its metadata: {'path' (the body file), 'sha256', 'etag', ...}.
+
+        ttl overrides the session default for this request. Raises requests.HTTPError once the
+        retries are exhausted.
+        """
+        ttl = self.ttl if ttl is ... else ttl
+        key = cache_key(url, params)
+        body_path = os.path.join(self.cache_folder, f"{key}.body")
+        meta_path = os.path.join(self.cache_folder, f"{key}.json")
+        meta = None
+        if os.path.exists(meta_path) and os.path.exists(body_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['expires_at'] is None or meta['expires_at'] > time.time():
+                self._count('fresh')
+                return meta
+
+        headers = {}
+        if meta is not None and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta is not None and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and meta is not None:
+            meta.update(fetched_at=time.time(), expires_at=_expires_at(response, ttl))
+            self._count('revalidated')
+        else:
+            response.raise_for_status()
+            os.makedirs(self.cache_folder, exist_ok=True)
+            # Written under temporary names, so a concurrent reader never sees a partial body
+            tmp_path = f"{body_path}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp_path, body_path)
+            meta = {
+                'url': url,
+                'params': {name: value for name, value in (params or {}).items() if name not in SECRET_PARAMS},
+                'path': body_path,
+                'sha256': hashlib.sha256(response.content).hexdigest(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'expires_at': _expires_at(response, ttl),
+            }
+            self._count('downloaded')
+        tmp_path = f"{meta_path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        return meta
+
+    def fetch_many(self, requests_to_fetch, ttl=..., skip_errors=False):
+        """Fetch (url, params) pairs with at most max_workers in flight; returns their metadata in order.
+
+        With skip_errors=True a request that still fails after its retries is logged and yields None.
+        """
+        def fetch_one(request):
+            url, params = request
+            try:
+                return self.fetch(url, params, ttl=ttl)
+            except requests.RequestException as e:
+                if not skip_errors:
+                    raise
+                # The exception text would include the full URL, credentials and all
+                status = e.response.status_code if e.response is not None else type(e).__name__
+                logger.warning(f"Fetching {url} (cache key {cache_key(url, params)[:12]}) failed: {status}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(fetch_one, requests_to_fetch))
+        logger.info(f"Fetched {len(results)} responses: {self.stats['downloaded']} downloaded, "
+                    f"{self.stats['revalidated']} revalidated, {self.stats['fresh']} from cache")
+        return results
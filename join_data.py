@@ -1,406 +1,463 @@
-import pandas as pd
 import os
-import glob
+import sys
+import logging
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from storage import (get_latest_csv, read_dataset, write_dataset, export_csv, dataset_columns, vintage_name,
+                     DEFAULT_FORMAT)
+from schemas import schema_columns, read_csv_typed, apply_schema
+from catalog import register_artifact, latest_artifact
+from join_engine import multi_join, regather
+from zcta_keys import parse_zcta, format_zcta
+from stage_cache import StageCache, fingerprint, input_hash, frame_hash
+from log_setup import configure_logging
+from profiling import call_profiled, profiled, peak_rss_mb, write_profile
+
+logger = logging.getLogger(__name__)
+
+# Sources joined onto zcta_data on the zcta key, in join order. Sources with a 'manual_file' are read
+# from the manual data folder; all others are the latest artifact of that dataset in automated data.
+# Only the columns declared for the source in schemas.SCHEMAS are read; 'columns' narrows them further and
+# 'drop_columns' leaves out columns that conflict with other sources.
+# 'code_columns' are other five-digit code columns that are normalized like zcta. 'fanout' is the
+# join_engine fanout mode for sources with many rows per ZCTA ('nest' keeps one row per ZCTA with
+# list-typed columns, so the many ZIPs per ZCTA do not multiply the rows of every later source).
+JOIN_SOURCES = [
+    {'name': 'zip_zcta_xref', 'manual_file': 'zip_zcta_xref.csv', 'columns': ['zcta', 'zip_code', 'source'],
+     'code_columns': ['zip_code'], 'fanout': 'nest'},
+    {'name': 'zcta_review', 'manual_file': 'zcta_review.csv', 'drop_columns': ['zip']},
+    {'name': 'income_data'},
+    {'name': 'crime_data'},
+    {'name': 'sunlight_data'},
+]
+# Threads used to load zcta_data and the sources concurrently
+LOAD_WORKERS = 8
+# ZCTAs whose merged rows are logged after the join; empty in production so no lookup is done
+SPOT_CHECK_ZCTAS = []
+
+
+def log_merge_info(df1_columns, df2_columns, df1_name, df2_name):
+    """Log column names of both sides of a merge and their common columns at debug level."""
+    common_columns = [col for col in df1_columns if col in df2_columns]
+    logger.debug(f"Preparing to merge {df1_name} with {df2_name}: columns in {df1_name}: {df1_columns}; "
+                 f"columns in {df2_name}: {df2_columns}; common columns: {common_columns}")
 
 
-def get_latest_csv(dataset_name, folder="automated data"):
-    """Find the most recent CSV file for a given dataset in the specified folder."""
-    pattern = os.path.join(folder, f"{dataset_name}_*.csv")
-    files = glob.glob(pattern)
-    if not files:
-        print(f"No CSV file found for {dataset_name} in {folder}")
-        return None
+def log_dataset_info(df, dataset_name):
+    """Log the column names, shape, and sample zcta values of a loaded dataset at debug level."""
+    sample_zctas = df['zcta'].head().tolist() if 'zcta' in df.columns else []
+    logger.debug(f"Dataset {dataset_name}: columns {list(df.columns)}, shape {df.shape}, "
+                 f"sample zcta values (first 5): {sample_zctas}")
 
-    # Extract timestamp from filename and find the most recent
-    def extract_timestamp(filepath):
-        filename = os.path.basename(filepath)
-        timestamp_str = filename.split('_')[-2] + '_' + filename.split('_')[-1].replace('.csv', '')
-        return datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
 
-    latest_file = max(files, key=extract_timestamp)
-    print(f"Found latest file for {dataset_name}: {latest_file}")
-    return latest_file
+def log_spot_checks(merged_data, zctas):
+    """Log the merged rows of the given ZCTAs, found with one vectorized lookup."""
+    matches = merged_data[merged_data['zcta'].isin(format_zcta(zctas))]
+    columns_to_log = [col for col in ['zcta', 'zip_code', 'city'] if col in merged_data.columns]
+    for zcta in format_zcta(zctas):
+        rows = matches[matches['zcta'] == zcta]
+        if rows.empty:
+            logger.info(f"ZCTA {zcta} not found in merged data.")
+        else:
+            logger.info(f"ZCTA {zcta} after merge: {rows[columns_to_log].to_dict('records')}")
+
+
+def source_path(source, data_folder="automated data", manual_folder="manual data", vintage=None):
+    """Resolve the file a configured join source is read from, or None if it does not exist.
+
+    With a vintage year, a catalogued <name>_<vintage> artifact is preferred over the latest <name>.
+    """
+    if 'manual_file' in source:
+        path = os.path.join(manual_folder, source['manual_file'])
+        if not os.path.exists(path):
+            logger.warning(f"{source['manual_file']} not found in manual data folder. Skipping merge.")
+            return None
+        return path
+    record = latest_artifact(vintage_name(source['name'], vintage), data_folder) if vintage is not None else None
+    path = record['path'] if record else get_latest_csv(source['name'], data_folder)
+    if not path:
+        logger.warning(f"{source['name']} not found. Skipping.")
+    return path
+
+
+def load_source(source, path):
+    """Load one configured join source from its resolved path with a normalized zcta column, or None.
+
+    Only the declared columns of the source (see schemas.SCHEMAS) are read, with their declared
+    dtypes. Safe to run in a worker thread: manual CSVs are parsed by the multithreaded pyarrow
+    reader, which releases the GIL, and the key normalization is done by the loader itself.
+    """
+    name = source['name']
+    logger.info(f"Loading {name} data...")
+    available = dataset_columns(path)
+
+    # Check that required columns exist
+    required_columns = source.get('columns', ['zcta'])
+    missing_columns = [col for col in required_columns if col not in available]
+    if missing_columns:
+        logger.warning(f"Missing required columns in {name}: {missing_columns}. Skipping merge.")
+        return None
+
+    # Read only the declared columns, leaving out columns that would conflict with other sources
+    columns = schema_columns(name, available, columns=source.get('columns'),
+                             exclude=source.get('drop_columns', []))
+    if 'manual_file' in source:
+        frame = read_csv_typed(path, name, columns)
+    else:
+        frame = apply_schema(read_dataset(path, columns=columns), name)
+
+    # Normalize zcta to compact integer keys (formatted back on output) and other codes to 5-digit strings
+    frame = frame.assign(zcta=parse_zcta(frame['zcta']),
+                         **{col: format_zcta(frame[col]) for col in source.get('code_columns', [])})
+    return frame
+
+
+def load_zcta_data(path=None, zcta_data=None):
+    """Read zcta_data from path (unless given in memory) with its zcta column normalized to integer keys."""
+    if zcta_data is None:
+        logger.info("Loading ZCTA data...")
+        zcta_data = apply_schema(read_dataset(path, columns=schema_columns('zcta_data', dataset_columns(path))),
+                                 'zcta_data')
+    return zcta_data.assign(zcta=parse_zcta(zcta_data['zcta']))
+
+
+def read_cached_join(files, vintage=None):
+    """Return (merged_data, lineage_data) from a join_data cache entry's or restore's {dataset: path} files."""
+    with open(files[vintage_name('join_lineage', vintage)], 'r') as f:
+        lineage_data = json.load(f)
+    return read_dataset(files[vintage_name('merged_data', vintage)]), lineage_data
+
+
+def incremental_join(zcta_hash, sources, source_files, vintage=None):
+    """Update the latest merged artifact for a change to a single source; returns (merged_data, lineage_data) or None.
+
+    The dataset entries of the previous join_lineage record the path and SHA-256 of every input.
+    When zcta_data and the set of sources are unchanged and exactly one source file differs, only that
+    source is loaded and its columns in the previous merged data are replaced with a re-gather on the
+    merged zcta keys; the change is recorded as a delta operation in the carried-over lineage.
+    Returns None whenever a full join is needed: no previous lineage (or one without input hashes),
+    zero or several changed inputs, a changed column set, or a source whose new version has several
+    rows per ZCTA in 'expand' mode (that would change the number of merged rows).
+    """
+    merged_record = latest_artifact(vintage_name("merged_data", vintage))
+    lineage_record = latest_artifact(vintage_name("join_lineage", vintage))
+    if merged_record is None or lineage_record is None or merged_record['timestamp'] != lineage_record['timestamp']:
+        logger.info("No previous merged data with lineage; running a full join.")
+        return None
+    with open(lineage_record['path'], 'r') as f:
+        previous_lineage = json.load(f)
+    recorded = {entry['name']: entry for entry in previous_lineage if entry['type'] == 'dataset'}
+    merges = {entry['input2']: entry for entry in previous_lineage if entry['type'] == 'merge'}
+    present = [(source, path) for source, path in zip(sources, source_files) if path]
+    if ('zcta_data' not in recorded or recorded['zcta_data'].get('sha256') != zcta_hash
+            or sorted(recorded) != sorted(['zcta_data'] + [source['name'] for source, _ in present])):
+        logger.info("ZCTA data or the set of sources changed; running a full join.")
+        return None
+    changed = [(source, path) for source, path in present if recorded[source['name']].get('sha256') != input_hash(path)]
+    if len(changed) != 1 or 'added_columns' not in merges.get(changed[0][0]['name'], {}):
+        logger.info(f"{len(changed)} sources changed; running a full join.")
+        return None
+    source, path = changed[0]
+    name = source['name']
+    previous = recorded[name]
+    merge = merges[name]
+
+    frame, load_profile = call_profiled(load_source, source, path)
+    if frame is None or list(frame.columns) != previous['columns']:
+        logger.info(f"Columns of {name} changed; running a full join.")
+        return None
+    if merge['fanout']['mode'] == 'expand' and merge['fanout']['max_fanout'] > 1:
+        logger.info(f"The previous {name} fanned out to several rows per ZCTA; running a full join.")
+        return None
 
+    logger.info(f"Only {name} changed; updating its columns in {merged_record['path']}")
+    merged_data = read_dataset(merged_record['path'])
+    with profiled() as delta_profile:
+        try:
+            columns, step = regather(parse_zcta(merged_data['zcta']),
+                                     {'name': name, 'frame': frame, 'fanout': source.get('fanout', 'expand')})
+        except ValueError as e:
+            logger.info(f"{e}; running a full join.")
+            return None
+        # Incoming columns map to the output names in order, so each replaced column keeps its position
+        incoming = [column for column in frame.columns if column != 'zcta']
+        for column, output_name in zip(incoming, merge['added_columns']):
+            merged_data[output_name] = columns[column]
+    delta_profile.update(rows_in=step['rows_in'], rows_out=step['rows_out'],
+                         match_rate=step['matched_rows'] / step['rows_out'] if step['rows_out'] else 0.0)
+    logger.info(f"Number of zcta values matched with {name}: {step['matched_rows']}/{step['rows_out']}")
+
+    # Carry the lineage over with the new version of the source and the delta that applied it
+    current = {'path': path, 'sha256': input_hash(path)}
+    lineage_data = []
+    for entry in previous_lineage:
+        if entry is previous:
+            entry = dict(entry, shape=frame.shape, path=path, sha256=current['sha256'], profile=load_profile)
+        elif entry is merge:
+            entry = dict(entry, fanout=step['fanout'])
+        lineage_data.append(entry)
+    lineage_data.append({
+        'type': 'operation',
+        'name': f"delta_{name}",
+        'details': f"Replaced columns: {', '.join(merge['added_columns'])}",
+        'input': name,
+        'output': 'merged_data_final',
+        'delta': {
+            'source': name,
+            'previous': {'path': previous.get('path'), 'sha256': previous['sha256']},
+            'current': current,
+            'base': {'path': merged_record['path'], 'sha256': merged_record['sha256']},
+            'columns': merge['added_columns'],
+        },
+        'profile': delta_profile
+    })
+    return merged_data, lineage_data
 
-def print_merge_info(df1, df2, df1_name, df2_name):
-    """Print column names of both DataFrames and their common columns before merging."""
-    df1_columns = list(df1.columns)
-    df2_columns = list(df2.columns)
-    common_columns = [col for col in df1_columns if col in df2_columns]
 
-    print(f"\nPreparing to merge {df1_name} with {df2_name}:")
-    print(f"Columns in {df1_name}: {df1_columns}")
-    print(f"Columns in {df2_name}: {df2_columns}")
-    print(f"Common columns: {common_columns}\n")
+def save_join(merged_data, lineage_data, input_files, fmt=None, csv_export=False, cache=None, cache_key=None,
+              vintage=None):
+    """Write the merged data with its lineage and profile, and store them in the stage cache under cache_key.
 
+    With a vintage year the artifacts are named merged_data_<vintage>, join_lineage_<vintage>, ...
+    """
+    # Create automated data folder if it doesn't exist
+    data_folder = "automated data"
+    os.makedirs(data_folder, exist_ok=True)
 
-def print_dataset_info(df, dataset_name):
-    """Print the column names, shape, and sample data of a loaded dataset."""
-    print(f"Dataset {dataset_name} info:")
-    print(f"Columns: {list(df.columns)}")
-    print(f"Shape: {df.shape}")
-    # Print sample zcta values (first 5 rows)
-    if 'zcta' in df.columns and not df.empty:
-        sample_zctas = df['zcta'].head().tolist()
-        print(f"Sample zcta values (first 5): {sample_zctas}")
-    print()
+    # Create automated data lineage folder if it doesn't exist
+    lineage_folder = "automated data lineage"
+    os.makedirs(lineage_folder, exist_ok=True)
 
+    # Generate UTC timestamp shared by the merged data and its lineage
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
 
-def join_data():
-    print("Starting data merging process...")
+    # Save lineage data to JSON in automated data lineage folder
+    lineage_filename = f"{vintage_name('join_lineage', vintage)}_{timestamp}.json"
+    lineage_file = os.path.join(lineage_folder, lineage_filename)
+    with open(lineage_file, 'w') as f:
+        json.dump(lineage_data, f, indent=4)
+    logger.info(f"Lineage data saved to: {lineage_file}")
+    register_artifact(lineage_file, vintage_name("join_lineage", vintage), rows=len(lineage_data), inputs=input_files,
+                      timestamp=timestamp)
+
+    # Save the per-step profile of this run next to its lineage
+    profile_file = os.path.join(lineage_folder, f"{vintage_name('join_profile', vintage)}_{timestamp}.json")
+    write_profile(lineage_data, "join_data", profile_file)
+    logger.info(f"Profile saved to: {profile_file}")
+    register_artifact(profile_file, vintage_name("join_profile", vintage), inputs=[lineage_file], timestamp=timestamp)
+
+    # Save merged data
+    output_path = write_dataset(merged_data, vintage_name("merged_data", vintage), folder=data_folder, fmt=fmt,
+                                timestamp=timestamp, csv_export=csv_export, inputs=input_files)
+    logger.info(f"Merged data saved to {output_path}")
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, {vintage_name('merged_data', vintage): output_path,
+                              vintage_name('join_lineage', vintage): lineage_file})
+
+
+def join_data(zcta_data=None, fmt=None, csv_export=False, sources=None, use_cache=True, persist=True,
+              spot_check_zctas=None, debug_csv=None, incremental=False, vintage=None):
+    """Left-join every configured source onto zcta_data in a single pass and return (merged_data, lineage_data).
+
+    zcta_data defaults to the latest zcta_data artifact; the pipeline runner passes it in memory instead.
+    sources defaults to JOIN_SOURCES; each source is indexed once on zcta by join_engine.multi_join.
+    With use_cache=True, unchanged inputs and parameters reuse the previous merged artifact.
+    With persist=False the merged data and its lineage are returned without being written.
+    spot_check_zctas (default SPOT_CHECK_ZCTAS) are logged after the join, and debug_csv, when given,
+    is the path of a CSV of zcta_data joined with zip_zcta_xref only.
+    With incremental=True, a change to a single source only replaces that source's columns in the
+    previous merged artifact (see incremental_join); anything else falls back to the full join.
+    With a vintage year, zcta_data and the outputs are the <name>_<vintage> datasets and sources
+    prefer their <name>_<vintage> artifact (see source_path).
+    Returns (None, None) when no ZCTA data is available.
+    """
+    logger.info("Starting data merging process...")
+    sources = JOIN_SOURCES if sources is None else sources
+    spot_check_zctas = SPOT_CHECK_ZCTAS if spot_check_zctas is None else spot_check_zctas
+    debug = logger.isEnabledFor(logging.DEBUG)
 
     # Collect lineage data for visualization
     lineage_data = []
-
-    # Load datasets if they exist
-    datasets = {}
-
-    # ZCTA data
-    zcta_file = get_latest_csv("zcta_data")
+    input_files = []
+
+    # ZCTA data, from the latest artifact unless it was handed over in memory
+    zcta_file = None
+    if zcta_data is None:
+        zcta_file = get_latest_csv(vintage_name("zcta_data", vintage))
+        if not zcta_file:
+            logger.error("ZCTA data is required. Exiting.")
+            return None, None
+    source_files = [source_path(source, vintage=vintage) for source in sources]
+
+    # Reuse the cached output when every input and the parameters are unchanged
+    cache = StageCache() if use_cache else None
+    cache_key = None
+    if cache is not None:
+        params = {'sources': sources, 'fmt': fmt or DEFAULT_FORMAT}
+        if vintage is not None:
+            params['vintage'] = vintage
+        cache_key = fingerprint("join_data", [zcta_file] + source_files, params,
+                                frames=[] if zcta_data is None else [zcta_data])
+        entry = cache.get(cache_key)
+        if entry is not None:
+            if not persist:
+                logger.info("Inputs unchanged. Reusing cached merged data.")
+                return read_cached_join({name: item['path'] for name, item in entry['files'].items()}, vintage)
+            restored = cache.restore(entry)
+            logger.info(f"Inputs unchanged. Reusing cached merged data: {restored['merged_data']}")
+            merged_data, lineage_data = read_cached_join(restored, vintage)
+            if csv_export:
+                export_csv(merged_data, restored['merged_data'])
+            return merged_data, lineage_data
+
+    # Input identity recorded in lineage, which incremental runs compare against
+    zcta_hash = input_hash(zcta_file) if zcta_file else frame_hash(zcta_data)
+    if incremental:
+        delta = incremental_join(zcta_hash, sources, source_files, vintage)
+        if delta is not None:
+            merged_data, lineage_data = delta
+            if persist:
+                input_files = [path for path in [zcta_file] + source_files if path]
+                save_join(merged_data, lineage_data, input_files, fmt, csv_export, cache, cache_key, vintage)
+            return merged_data, lineage_data
+
+    # Load zcta_data and every configured source that exists concurrently; the loads are independent,
+    # so the load time is bounded by the largest file rather than the sum of all of them
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        zcta_future = executor.submit(call_profiled, load_zcta_data, zcta_file, zcta_data)
+        source_futures = [executor.submit(call_profiled, load_source, source, path) if path else None
+                          for source, path in zip(sources, source_files)]
+        zcta_data, zcta_profile = zcta_future.result()
+        loads = [future.result() if future else (None, None) for future in source_futures]
     if zcta_file:
-        print("Loading ZCTA data...")
-        datasets['zcta_data'] = pd.read_csv(zcta_file)
-        # Ensure zcta is a string
-        datasets['zcta_data']['zcta'] = datasets['zcta_data']['zcta'].astype(str).str.strip()
-        print_dataset_info(datasets['zcta_data'], "zcta_data")
-        lineage_data.append({
-            'type': 'dataset',
-            'name': 'zcta_data',
-            'shape': datasets['zcta_data'].shape,
-            'columns': list(datasets['zcta_data'].columns)
-        })
-    else:
-        print("ZCTA data is required. Exiting.")
-        return
-
-    # ACS income data
-    income_file = get_latest_csv("income_data")
-    if income_file:
-        print("Loading ACS income data...")
-        datasets['income_data'] = pd.read_csv(income_file)
-        # Ensure zcta is a string
-        datasets['income_data']['zcta'] = datasets['income_data']['zcta'].astype(str).str.strip()
-        print_dataset_info(datasets['income_data'], "income_data")
-        lineage_data.append({
-            'type': 'dataset',
-            'name': 'income_data',
-            'shape': datasets['income_data'].shape,
-            'columns': list(datasets['income_data'].columns)
-        })
-    else:
-        print("ACS income data not found. Skipping.")
-
-    # Crime data
-    crime_file = get_latest_csv("crime_data")
-    if crime_file:
-        print("Loading crime data...")
-        datasets['crime_data'] = pd.read_csv(crime_file)
-        # Ensure zcta is a string
-        datasets['crime_data']['zcta'] = datasets['crime_data']['zcta'].astype(str).str.strip()
-        print_dataset_info(datasets['crime_data'], "crime_data")
-        lineage_data.append({
-            'type': 'dataset',
-            'name': 'crime_data',
-            'shape': datasets['crime_data'].shape,
-            'columns': list(datasets['crime_data'].columns)
-        })
-    else:
-        print("Crime data not found. Skipping.")
-
-    # Sunlight data
-    sunlight_file = get_latest_csv("sunlight_data")
-    if sunlight_file:
-        print("Loading sunlight data...")
-        datasets['sunlight_data'] = pd.read_csv(sunlight_file)
-        # Ensure zcta is a string
-        datasets['sunlight_data']['zcta'] = datasets['sunlight_data']['zcta'].astype(str).str.strip()
-        print_dataset_info(datasets['sunlight_data'], "sunlight_data")
-        lineage_data.append({
-            'type': 'dataset',
-            'name': 'sunlight_data',
-            'shape': datasets['sunlight_data'].shape,
-            'columns': list(datasets['sunlight_data'].columns)
-        })
-    else:
-        print("Sunlight data not found. Skipping.")
-
-    # Load zip_zcta_xref.csv
-    xref_file = os.path.join("manual data", "zip_zcta_xref.csv")
-    if os.path.exists(xref_file):
-        print("Loading zip_zcta_xref data...")
-        xref_data = pd.read_csv(xref_file)
-        # Ensure zcta is a string and remove .0 suffix
-        xref_data['zcta'] = pd.to_numeric(xref_data['zcta'], errors='coerce').fillna(0).astype(int).astype(str)
-        xref_data['zcta'] = xref_data['zcta'].replace('0', pd.NA)  # Replace dummy 0 with NA for rows that were NaN
-        print_dataset_info(xref_data, "zip_zcta_xref")
-        lineage_data.append({
-            'type': 'dataset',
-            'name': 'zip_zcta_xref',
-            'shape': xref_data.shape,
-            'columns': list(xref_data.columns)
-        })
-        # Check if required columns exist (updated to expect 'zip_code')
-        required_columns = ['zcta', 'zip_code', 'source']
-        missing_columns = [col for col in required_columns if col not in xref_data.columns]
-        if missing_columns:
-            print(f"Missing required columns in zip_zcta_xref.csv: {missing_columns}. Skipping merge.")
-            xref_data = None
-        else:
-            print("Columns in zip_zcta_xref.csv (after validation):", list(xref_data.columns))
-            # Log sample rows to inspect data
-            print("Sample rows from zip_zcta_xref (first 5):")
-            print(xref_data.head().to_string(index=False))
-    else:
-        print(f"zip_zcta_xref.csv not found in manual data folder. Skipping merge.")
-        xref_data = None
-
-    # Load zcta_review.csv
-    review_file = os.path.join("manual data", "zcta_review.csv")
-    if os.path.exists(review_file):
-        print("Loading zcta_review data...")
-        review_data = pd.read_csv(review_file)
-        # Ensure zcta is a string
-        review_data['zcta'] = review_data['zcta'].astype(str).str.strip()
-        # Drop the zip column from zcta_review to avoid duplicates
-        if 'zip' in review_data.columns:
-            print("Dropping 'zip' column from zcta_review to avoid conflict with zip_zcta_xref.")
-            review_data = review_data.drop(columns=['zip'])
-        print_dataset_info(review_data, "zcta_review")
+        input_files.append(zcta_file)
+    if debug:
+        log_dataset_info(zcta_data, "zcta_data")
+    lineage_data.append({
+        'type': 'dataset',
+        'name': 'zcta_data',
+        'shape': zcta_data.shape,
+        'columns': list(zcta_data.columns),
+        'path': zcta_file,
+        'sha256': zcta_hash,
+        'profile': zcta_profile
+    })
+
+    loaded_sources = []
+    for source, path, (frame, profile) in zip(sources, source_files, loads):
+        if frame is None:
+            continue
+        logger.info(f"Loaded {source['name']}: {len(frame)} rows in {profile['wall_seconds']:.3f}s")
+        if debug:
+            log_dataset_info(frame, source['name'])
+        input_files.append(path)
+        loaded_sources.append({'name': source['name'], 'frame': frame, 'fanout': source.get('fanout', 'expand')})
         lineage_data.append({
             'type': 'dataset',
-            'name': 'zcta_review',
-            'shape': review_data.shape,
-            'columns': list(review_data.columns)
+            'name': source['name'],
+            'shape': frame.shape,
+            'columns': list(frame.columns),
+            'path': path,
+            'sha256': input_hash(path),
+            'profile': profile
         })
-        # Check if 'zcta' column exists
-        if 'zcta' not in review_data.columns:
-            print("Missing 'zcta' column in zcta_review.csv. Skipping merge.")
-            review_data = None
-        else:
-            # Ensure zcta formatting is consistent
-            review_data['zcta'] = pd.to_numeric(review_data['zcta'], errors='coerce').fillna(0).astype(int).astype(str)
-            review_data['zcta'] = review_data['zcta'].replace('0', pd.NA)
-    else:
-        print(f"zcta_review.csv not found in manual data folder. Skipping merge.")
-        review_data = None
 
-    # Merge datasets
-    print("Merging datasets...")
-    zcta_data = datasets['zcta_data']
-    print(f"Initial shape of merged_data: {zcta_data.shape}")
+    # Merge datasets in one pass
+    logger.info(f"Merging {len(loaded_sources)} sources onto zcta_data of shape {zcta_data.shape}...")
     current_output = 'merged_data_1'
+    current_columns = list(zcta_data.columns)
     lineage_data.append({
         'type': 'output',
         'name': current_output,
         'shape': zcta_data.shape,
-        'columns': list(zcta_data.columns)
+        'columns': current_columns
     })
-
-    # Merge with zip_zcta_xref.csv on zcta
-    if xref_data is not None:
-        # Keep zip_code as-is (do not rename to zip)
-        xref_subset = xref_data[['zcta', 'zip_code', 'source']]
-        print_merge_info(zcta_data, xref_subset, current_output, "zip_zcta_xref")
-        # Check for overlapping zcta values using merge to count matches accurately
-        merged_with_zip = zcta_data.merge(xref_subset, on='zcta', how='left')
-        merged_with_zip.to_csv('merged_with_zip.csv', index=False)
-        matched_zctas = merged_with_zip['zip_code'].notnull().sum()
-        total_zctas = len(merged_with_zip)
-        print(f"Number of zcta values matched with zip_zcta_xref: {matched_zctas}/{total_zctas}")
-        # Log non-matching zcta values
-        non_matching = merged_with_zip[merged_with_zip['zip_code'].isnull()]['zcta'].head().tolist()
-        if non_matching:
-            print(f"Sample zcta values with no match in zip_zcta_xref (first 5): {non_matching}")
-        merged_data = merged_with_zip
-        # Log sample merged rows
-        print("Sample rows after merge with zip_zcta_xref (first 5):")
-        print(merged_data.head().to_string(index=False))
-        # Check for specific ZCTA
-        zcta_47660 = merged_data[merged_data['zcta'] == '47660']
-        if not zcta_47660.empty:
-            columns_to_log = ['zcta', 'zip_code'] if 'zip_code' in merged_data.columns else ['zcta']
-            print(f"ZCTA 47660 after merge with zip_zcta_xref: {zcta_47660[columns_to_log].to_dict('records')}")
-        else:
-            print("ZCTA 47660 not found in merged data after zip_zcta_xref merge.")
-        next_output = 'merged_data_2'
+    if debug:
+        for source in loaded_sources:
+            log_merge_info(current_columns, list(source['frame'].columns), current_output, source['name'])
+            current_columns = current_columns + [col for col in source['frame'].columns if col != 'zcta']
+    merged_data, steps = multi_join(zcta_data, loaded_sources, key='zcta')
+    merged_data['zcta'] = format_zcta(merged_data['zcta'])
+
+    # Record each join as its own lineage step; output names follow the source's position in the list
+    source_positions = {source['name']: position for position, source in enumerate(sources)}
+    for step in steps:
+        logger.info(f"Number of zcta values matched with {step['name']}: {step['matched_rows']}/{step['rows_out']}")
+        if debug and step['unmatched_sample']:
+            unmatched_sample = format_zcta(step['unmatched_sample']).tolist()
+            logger.debug(f"Sample zcta values with no match in {step['name']} (first 5): {unmatched_sample}")
+        fanout = step['fanout']
+        logger.info(f"Fan-out of {step['name']} ({fanout['mode']}): {fanout['source_rows']} rows over "
+                    f"{fanout['source_keys']} keys, max {fanout['max_fanout']} / mean {fanout['mean_fanout']:.2f} rows "
+                    f"per matched zcta, rows {step['rows_in']} -> {step['rows_out']}")
+        position = source_positions[step['name']]
+        next_output = 'merged_data_final' if position == len(sources) - 1 else f"merged_data_{position + 2}"
         lineage_data.append({
             'type': 'merge',
             'input1': current_output,
-            'input2': 'zip_zcta_xref',
+            'input2': step['name'],
             'join_key': 'zcta',
-            'output': next_output
+            'output': next_output,
+            'added_columns': step['added_columns'],
+            'fanout': fanout,
+            'profile': {
+                'wall_seconds': step['wall_seconds'],
+                'cpu_seconds': step['cpu_seconds'],
+                'peak_rss_mb': peak_rss_mb(),
+                'rows_in': step['rows_in'],
+                'rows_out': step['rows_out'],
+                'match_rate': step['matched_rows'] / step['rows_out'] if step['rows_out'] else 0.0,
+            }
         })
         lineage_data.append({
             'type': 'output',
             'name': next_output,
-            'shape': merged_data.shape,
-            'columns': list(merged_data.columns)
+            'shape': (step['rows_out'], len(step['columns'])),
+            'columns': step['columns']
         })
         current_output = next_output
-    else:
-        print("Skipping merge with zip_zcta_xref due to missing data or columns.")
-    print(f"Shape after zip_zcta_xref merge attempt: {merged_data.shape}")
-
-    # Merge with zcta_review.csv on zcta
-    if review_data is not None:
-        print_merge_info(merged_data, review_data, current_output, "zcta_review")
-        # Check for overlapping zcta values using merge to count matches accurately
-        merged_with_review = merged_data.merge(review_data, on='zcta', how='left')
-        matched_zctas = merged_with_review['city'].notnull().sum()
-        total_zctas = len(merged_with_review)
-        print(f"Number of zcta values matched with zcta_review: {matched_zctas}/{total_zctas}")
-        # Log non-matching zcta values
-        non_matching = merged_with_review[merged_with_review['city'].isnull()]['zcta'].head().tolist()
-        if non_matching:
-            print(f"Sample zcta values with no match in zcta_review (first 5): {non_matching}")
-        merged_data = merged_with_review
-        # Log sample merged rows
-        print("Sample rows after merge with zcta_review (first 5):")
-        print(merged_data.head().to_string(index=False))
-        # Check for specific ZCTA
-        zcta_47660 = merged_data[merged_data['zcta'] == '47660']
-        if not zcta_47660.empty:
-            columns_to_log = ['zcta', 'zip_code', 'city'] if 'zip_code' in merged_data.columns else ['zcta', 'city']
-            print(f"ZCTA 47660 after merge with zcta_review: {zcta_47660[columns_to_log].to_dict('records')}")
-        else:
-            print("ZCTA 47660 not found in merged data after zcta_review merge.")
-        next_output = 'merged_data_3'
-        lineage_data.append({
-            'type': 'merge',
-            'input1': current_output,
-            'input2': 'zcta_review',
-            'join_key': 'zcta',
-            'output': next_output
-        })
-        lineage_data.append({
-            'type': 'output',
-            'name': next_output,
-            'shape': merged_data.shape,
-            'columns': list(merged_data.columns)
-        })
-        current_output = next_output
-    else:
-        print("Skipping merge with zcta_review: review_data is None or 'zcta' column missing in zcta_review.csv.")
-    print(f"Shape after zcta_review merge attempt: {merged_data.shape}")
-
-    # Merge with other datasets
-    if 'income_data' in datasets:
-        print_merge_info(merged_data, datasets['income_data'], current_output, "income_data")
-        # Check for overlapping zcta values using merge to count matches accurately
-        merged_with_income = merged_data.merge(datasets['income_data'], on='zcta', how='left')
-        matched_zctas = merged_with_income['median_household_income'].notnull().sum()
-        total_zctas = len(merged_with_income)
-        print(f"Number of zcta values matched with income_data: {matched_zctas}/{total_zctas}")
-        merged_data = merged_with_income
-        next_output = 'merged_data_4'
-        lineage_data.append({
-            'type': 'merge',
-            'input1': current_output,
-            'input2': 'income_data',
-            'join_key': 'zcta',
-            'output': next_output
-        })
-        lineage_data.append({
-            'type': 'output',
-            'name': next_output,
-            'shape': merged_data.shape,
-            'columns': list(merged_data.columns)
-        })
-        current_output = next_output
-    else:
-        print("Skipping merge with income_data: dataset not found.")
-    print(f"Shape after income_data merge attempt: {merged_data.shape}")
-
-    if 'crime_data' in datasets:
-        print_merge_info(merged_data, datasets['crime_data'], current_output, "crime_data")
-        # Check for overlapping zcta values using merge to count matches accurately
-        merged_with_crime = merged_data.merge(datasets['crime_data'], on='zcta', how='left')
-        matched_zctas = merged_with_crime['crime_grade'].notnull().sum()
-        total_zctas = len(merged_with_crime)
-        print(f"Number of zcta values matched with crime_data: {matched_zctas}/{total_zctas}")
-        merged_data = merged_with_crime
-        next_output = 'merged_data_5'
-        lineage_data.append({
-            'type': 'merge',
-            'input1': current_output,
-            'input2': 'crime_data',
-            'join_key': 'zcta',
-            'output': next_output
-        })
-        lineage_data.append({
-            'type': 'output',
-            'name': next_output,
-            'shape': merged_data.shape,
-            'columns': list(merged_data.columns)
-        })
-        current_output = next_output
-    else:
-        print("Skipping merge with crime_data: dataset not found.")
-    print(f"Shape after crime_data merge attempt: {merged_data.shape}")
-
-    if 'sunlight_data' in datasets:
-        print_merge_info(merged_data, datasets['sunlight_data'], current_output, "sunlight_data")
-        # Check for overlapping zcta values using merge to count matches accurately
-        merged_with_sunlight = merged_data.merge(datasets['sunlight_data'], on='zcta', how='left')
-        matched_zctas = merged_with_sunlight['sunlight_hours_per_year'].notnull().sum()
-        total_zctas = len(merged_with_sunlight)
-        print(f"Number of zcta values matched with sunlight_data: {matched_zctas}/{total_zctas}")
-        merged_data = merged_with_sunlight
-        next_output = 'merged_data_final'
-        lineage_data.append({
-            'type': 'merge',
-            'input1': current_output,
-            'input2': 'sunlight_data',
-            'join_key': 'zcta',
-            'output': next_output
-        })
+        logger.debug(f"Shape after {step['name']} merge: {(step['rows_out'], len(step['columns']))}")
+    if current_output != 'merged_data_final':
+        # The last configured source was skipped; the final output is the last merge result
         lineage_data.append({
             'type': 'output',
-            'name': next_output,
+            'name': 'merged_data_final',
             'shape': merged_data.shape,
             'columns': list(merged_data.columns)
         })
-    else:
-        print("Skipping merge with sunlight_data: dataset not found.")
-        # If sunlight_data is the last merge, set the final output name
-        next_output = 'merged_data_final'
-        lineage_data.append({
-            'type': 'output',
-            'name': next_output,
-            'shape': merged_data.shape,
-            'columns': list(merged_data.columns)
-        })
-    print(f"Shape after sunlight_data merge attempt: {merged_data.shape}")
 
-    # Create automated data folder if it doesn't exist
-    data_folder = "automated data"
-    os.makedirs(data_folder, exist_ok=True)
+    if debug:
+        logger.debug(f"Sample rows after merge (first 5):\n{merged_data.head().to_string(index=False)}")
+    if spot_check_zctas:
+        log_spot_checks(merged_data, spot_check_zctas)
+    xref_sources = [source for source in loaded_sources if source['name'] == 'zip_zcta_xref']
+    if debug_csv and xref_sources:
+        # Debug copy of zcta_data joined with zip_zcta_xref only
+        merged_with_zip, _ = multi_join(zcta_data, xref_sources, key='zcta')
+        merged_with_zip['zcta'] = format_zcta(merged_with_zip['zcta'])
+        merged_with_zip.to_csv(debug_csv, index=False)
+        logger.info(f"Debug ZIP join saved to {debug_csv}")
 
-    # Create automated data lineage folder if it doesn't exist
-    lineage_folder = "automated data lineage"
-    os.makedirs(lineage_folder, exist_ok=True)
-    print(f"Permissions for {lineage_folder}:")
-    os.system(f"ls -ld '{lineage_folder}'")
+    if not persist:
+        return merged_data, lineage_data
 
-    # Generate CSV filename with UTC datetime
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    csv_filename = f"merged_data_{timestamp}.csv"
-    csv_path = os.path.join(data_folder, csv_filename)
+    save_join(merged_data, lineage_data, input_files, fmt, csv_export, cache, cache_key, vintage)
+    return merged_data, lineage_data
 
-    # Save lineage data to JSON in automated data lineage folder
-    lineage_filename = f"join_lineage_{timestamp}.json"
-    lineage_file = os.path.join(lineage_folder, lineage_filename)
-    with open(lineage_file, 'w') as f:
-        json.dump(lineage_data, f, indent=4)
-    print(f"Lineage data saved to: {lineage_file}")
 
-    # Save merged data to CSV
-    print(f"Saving merged data to: {os.path.abspath(csv_path)}")
-    merged_data.to_csv(csv_path, index=False)
-    print(f"Merged data saved to {csv_path}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join every configured source onto the ZCTA data.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="When a single source changed, only replace its columns in the previous merged data")
+    parser.add_argument("--vintage", type=int, help="Join zcta_data_<vintage> instead of the latest zcta_data")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    join_data(incremental=args.incremental, vintage=args.vintage)
+    return 0
 
 
 if __name__ == "__main__":
-    join_data()
\ No newline at end of file
+    sys.exit(main())
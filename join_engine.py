@@ -0,0 +1,223 @@
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.extensions import take
+
+# How a source whose key repeats (one ZCTA, many rows) is joined:
+# 'expand' adds one output row per match like DataFrame.merge; 'nest' keeps one row per base row
+# and turns every source column into an offsets-encoded list column.
+FANOUT_MODES = ('expand', 'nest')
+
+
+class KeyIndex:
+    """Hash index over one source's key column, built once and probed with positional lookups.
+
+    Rows sharing a key are stored contiguously (in their original order) so one-to-many
+    matches can be expanded without rehashing.
+    """
+
+    def __init__(self, keys):
+        codes, uniques = pd.factorize(pd.Series(keys), sort=False)
+        self.uniques = pd.Index(uniques)
+        valid = codes >= 0
+        self.counts = np.bincount(codes[valid], minlength=len(uniques))
+        # Stable sort groups rows by key while keeping source order within each key; missing keys sort last
+        self.order = np.argsort(np.where(valid, codes, len(uniques)), kind='stable')
+        self.starts = np.cumsum(self.counts) - self.counts
+        self.is_unique = len(self.counts) == 0 or self.counts.max() <= 1
+
+    def lookup(self, keys):
+        """Return the key code for each probe key, or -1 when the key is absent from the source."""
+        return self.uniques.get_indexer(pd.Series(keys))
+
+    def match_counts(self, codes):
+        """Return how many source rows match each probe code (0 for absent keys)."""
+        counts = np.zeros(len(codes), dtype=np.intp)
+        matched = codes >= 0
+        counts[matched] = self.counts[codes[matched]]
+        return counts
+
+    def positions(self, codes, offsets):
+        """Return the source row for each (code, offset-within-key) pair, or -1 for absent keys."""
+        if len(self.counts) == 0:
+            return np.full(len(codes), -1, dtype=np.intp)
+        safe_codes = np.where(codes >= 0, codes, 0)
+        return np.where(codes >= 0, self.order[self.starts[safe_codes] + offsets], -1)
+
+
+def gather(series, positions):
+    """Take values by position; position -1 yields a missing value (ints are promoted like a left merge)."""
+    if isinstance(series.dtype, np.dtype):
+        return take(series.to_numpy(), positions, allow_fill=True)
+    return series.array.take(positions, allow_fill=True)
+
+
+def expansion(repeats):
+    """Return (row, offset) arrays that repeat row i repeats[i] times with offsets 0..repeats[i]-1."""
+    rows = np.repeat(np.arange(len(repeats)), repeats)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return rows, offsets
+
+
+def nest(series, index, codes):
+    """Collapse all matches of each probe code into one offsets-encoded list value (null when unmatched)."""
+    counts = index.match_counts(codes)
+    rows, offsets = expansion(counts)
+    values = gather(series, index.positions(codes[rows], offsets))
+    list_offsets = pa.array(np.concatenate([[0], np.cumsum(counts)]), type=pa.int32())
+    list_array = pa.ListArray.from_arrays(list_offsets, pa.array(values, from_pandas=True),
+                                          mask=pa.array(codes < 0))
+    # Object column of per-key arrays; Parquet/Arrow storage writes it back as a native list column
+    return pd.Series(list_array.to_pandas(), dtype=object)
+
+
+def fanout_stats(index, counts, mode):
+    """Summarize how a source's rows fan out over the base rows it matched."""
+    matched_counts = counts[counts > 0]
+    return {
+        'mode': mode,
+        'source_rows': int(index.counts.sum()),
+        'source_keys': len(index.uniques),
+        'matched_base_rows': len(matched_counts),
+        'unmatched_base_rows': int((counts == 0).sum()),
+        'max_fanout': int(matched_counts.max()) if len(matched_counts) else 0,
+        'mean_fanout': float(matched_counts.mean()) if len(matched_counts) else 0.0,
+    }
+
+
+def multi_join(base, sources, key='zcta'):
+    """Left-join several sources onto base in one pass and return (result, steps).
+
+    Each source is a dict with 'name', 'frame' (a DataFrame containing the key column) and an
+    optional 'fanout' mode (see FANOUT_MODES, default 'expand'). Every source is indexed once on the
+    shared key and probed once per base row; one-to-many expansion is deferred until every source
+    has been probed, and the wide output is assembled at the end with a single gather per column.
+    Row order, one-to-many expansion and _x/_y suffixes for overlapping columns follow a chain of
+    DataFrame.merge(..., how='left') calls in the same order. Missing keys never match.
+
+    steps holds one dict per source with the row counts, match count, a sample of unmatched keys,
+    fan-out statistics and the output columns of that join, as if the chain had been materialized,
+    plus the wall and CPU seconds spent indexing, probing, expanding and gathering that source and the
+    names its columns have in the final result ('added_columns').
+    """
+    base_keys = base[key]
+    base_count = len(base)
+    # Each output column is described as (output name, source number or None for base, source column)
+    output_columns = [(column, None, column) for column in base.columns]
+    probes = []
+    steps = []
+    # Rows each base row would have in the chained-merge result so far
+    rows_per_base = np.ones(base_count, dtype=np.intp)
+    # [wall, CPU] seconds spent on each source
+    timings = []
+
+    for source_number, source in enumerate(sources):
+        start = (time.perf_counter(), time.thread_time())
+        mode = source.get('fanout', 'expand')
+        if mode not in FANOUT_MODES:
+            raise ValueError(f"Unknown fanout mode for {source['name']}: {mode}")
+        frame = source['frame']
+        index = KeyIndex(frame[key])
+        codes = index.lookup(base_keys)
+        counts = index.match_counts(codes)
+        probes.append((index, codes, mode))
+
+        rows_in = int(rows_per_base.sum())
+        if mode == 'expand':
+            rows_per_base = rows_per_base * np.maximum(counts, 1)
+
+        # Overlapping non-key columns get _x (existing) and _y (incoming) suffixes, as in DataFrame.merge
+        incoming = [column for column in frame.columns if column != key]
+        overlap = {name for name, _, _ in output_columns if name != key} & set(incoming)
+        output_columns = [(f"{name}_x" if name in overlap else name, origin, column)
+                          for name, origin, column in output_columns]
+        output_columns += [(f"{column}_y" if column in overlap else column, source_number, column)
+                           for column in incoming]
+        names = [name for name, _, _ in output_columns]
+        if len(set(names)) != len(names):
+            raise pd.errors.MergeError(f"Joining {source['name']} would create duplicate columns: {names}")
+
+        steps.append({
+            'name': source['name'],
+            'rows_in': rows_in,
+            'rows_out': int(rows_per_base.sum()),
+            'matched_rows': int(rows_per_base[codes >= 0].sum()),
+            'unmatched_sample': base_keys.take(np.flatnonzero(codes < 0)[:5]).tolist(),
+            'fanout': fanout_stats(index, counts, mode),
+            'columns': names,
+        })
+        timings.append([time.perf_counter() - start[0], time.thread_time() - start[1]])
+
+    # Expand fanned-out sources once, in source order, now that every source has been probed
+    base_positions = np.arange(base_count)
+    source_offsets = {}
+    for source_number, (index, codes, mode) in enumerate(probes):
+        if mode != 'expand' or index.is_unique:
+            continue
+        start = (time.perf_counter(), time.thread_time())
+        rows, offsets = expansion(np.maximum(index.match_counts(codes[base_positions]), 1))
+        base_positions = base_positions[rows]
+        source_offsets = {number: previous[rows] for number, previous in source_offsets.items()}
+        source_offsets[source_number] = offsets
+        timings[source_number][0] += time.perf_counter() - start[0]
+        timings[source_number][1] += time.thread_time() - start[1]
+
+    # Assemble the wide table once
+    data = {}
+    for name, origin, column in output_columns:
+        if origin is None:
+            data[name] = gather(base[column], base_positions)
+            continue
+        start = (time.perf_counter(), time.thread_time())
+        index, codes, mode = probes[origin]
+        series = sources[origin]['frame'][column]
+        if mode == 'nest':
+            data[name] = gather(nest(series, index, codes), base_positions)
+        else:
+            offsets = source_offsets.get(origin, np.zeros(len(base_positions), dtype=np.intp))
+            data[name] = gather(series, index.positions(codes[base_positions], offsets))
+        timings[origin][0] += time.perf_counter() - start[0]
+        timings[origin][1] += time.thread_time() - start[1]
+    for source_number, (step, (wall, cpu)) in enumerate(zip(steps, timings)):
+        step['wall_seconds'] = wall
+        step['cpu_seconds'] = cpu
+        step['added_columns'] = [name for name, origin, _ in output_columns if origin == source_number]
+    result = pd.DataFrame(data, columns=[name for name, _, _ in output_columns])
+    return result, steps
+
+
+def regather(keys, source, key='zcta'):
+    """Join one source onto rows with the given keys and return ({column: values}, step), without a full join.
+
+    Used to replace a single source's columns in an existing result. Only sources that cannot
+    change the number of rows qualify: 'nest' sources and 'expand' sources with at most one row per
+    key; a ValueError is raised for others. step has the same fields as a multi_join step.
+    """
+    start = (time.perf_counter(), time.thread_time())
+    mode = source.get('fanout', 'expand')
+    frame = source['frame']
+    index = KeyIndex(frame[key])
+    if mode == 'expand' and not index.is_unique:
+        raise ValueError(f"{source['name']} has several rows per {key}; it can only be joined in full")
+    codes = index.lookup(keys)
+    counts = index.match_counts(codes)
+    offsets = np.zeros(len(codes), dtype=np.intp)
+    columns = {}
+    for column in frame.columns:
+        if column == key:
+            continue
+        if mode == 'nest':
+            columns[column] = nest(frame[column], index, codes)
+        else:
+            columns[column] = gather(frame[column], index.positions(codes, offsets))
+    step = {
+        'name': source['name'],
+        'rows_in': len(codes),
+        'rows_out': len(codes),
+        'matched_rows': int((codes >= 0).sum()),
+        'fanout': fanout_stats(index, counts, mode),
+        'wall_seconds': time.perf_counter() - start[0],
+        'cpu_seconds': time.thread_time() - start[1],
+    }
+    return columns, step
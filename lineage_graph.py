@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from graphviz import Digraph
+from catalog import register_artifact, latest_artifact, CATALOG_FOLDER
+from profiling import profile_label, slowest_steps
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+LINEAGE_FOLDER = "automated data lineage"
+RENDER_FORMATS = ('png', 'svg')
+# Lineages with more entries than this are drawn in summary mode unless a mode is requested
+SUMMARY_ENTRIES = 60
+# Seconds dot may spend on one layout before the render is abandoned (the .dot file is kept)
+RENDER_TIMEOUT = 300
+
+# One background thread renders graphs in submission order; its thread is joined at interpreter exit,
+# so a pending render still completes after the data has been delivered
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lineage-render")
+
+
+def graph_key(lineage_data, summary, timings=True):
+    """Hash a lineage graph as drawn without timings, plus which steps are highlighted as slowest.
+
+    Timings differ on every run, so they are left out: reruns on unchanged data share a key (and keep
+    the timings of the first render) unless a different set of steps becomes the slowest.
+    """
+    untimed = build_graph(lineage_data, summary=summary, timings=False).source
+    slowest = [id(entry) for entry in slowest_steps(lineage_data)] if timings and not summary else []
+    positions = [position for position, entry in enumerate(lineage_data) if id(entry) in slowest]
+    return hashlib.sha256(json.dumps({'graph': untimed, 'slowest': positions}).encode()).hexdigest()
+
+
+def add_full_nodes(dot, lineage_data, timings=True):
+    """Draw every lineage entry with its columns, details and (with timings) timings; the slowest steps in red."""
+    slowest = [id(entry) for entry in slowest_steps(lineage_data)] if timings else []
+    for entry in lineage_data:
+        highlight = {'color': 'red', 'penwidth': '2.5'} if id(entry) in slowest else {}
+        timing = f"\\n{profile_label(entry['profile'])}" if timings and 'profile' in entry else ""
+        if entry['type'] == 'dataset':
+            label = f"{entry['name']}\\nShape: {entry['shape']}\\nColumns: {', '.join(entry['columns'])}{timing}"
+            dot.node(entry['name'], label=label, shape='box', style='filled', fillcolor='lightblue', **highlight)
+        elif entry['type'] == 'merge':
+            node_id = f"merge_{entry['output']}"
+            label = f"Merge\\nJoin on: {entry['join_key']}{timing}"
+            dot.node(node_id, label=label, shape='ellipse', style='filled', fillcolor='lightgreen')
+            dot.edge(entry['input1'], node_id, **highlight)
+            dot.edge(entry['input2'], node_id, **highlight)
+            dot.edge(node_id, entry['output'], **highlight)
+        elif entry['type'] == 'operation':
+            node_id = f"op_{entry['name']}"
+            label = f"{entry['name']}\\n{entry['details']}{timing}"
+            dot.node(node_id, label=label, shape='ellipse', style='filled', fillcolor='lightgreen')
+            dot.edge(entry['input'], node_id, **highlight)
+            dot.edge(node_id, entry['output'], **highlight)
+        elif entry['type'] == 'output':
+            label = f"{entry['name']}\\nShape: {entry['shape']}\\nColumns: {', '.join(entry['columns'])}"
+            dot.node(entry['name'], label=label, shape='box', style='filled', fillcolor='lightyellow')
+
+
+def add_summary_nodes(dot, lineage_data):
+    """Draw a compact lineage: a chain of merges becomes one join node and nodes list column counts only.
+
+    Intermediate merge results are not drawn; every merge input feeds the join node, which leads to
+    the output of the last merge in the chain.
+    """
+    merges = [entry for entry in lineage_data if entry['type'] == 'merge']
+    intermediate = {entry['output'] for entry in merges[:-1]}
+    if merges:
+        sources = [merges[0]['input1']] + [entry['input2'] for entry in merges]
+        dot.node('join', label=f"Join {len(sources)} datasets\\non: {merges[0]['join_key']}", shape='ellipse',
+                 style='filled', fillcolor='lightgreen')
+        for source in sources:
+            dot.edge(source, 'join')
+        dot.edge('join', merges[-1]['output'])
+    for entry in lineage_data:
+        if entry['type'] in ('dataset', 'output') and entry['name'] not in intermediate:
+            fillcolor = 'lightblue' if entry['type'] == 'dataset' else 'lightyellow'
+            label = f"{entry['name']}\\n{entry['shape'][0]} rows x {len(entry['columns'])} columns"
+            dot.node(entry['name'], label=label, shape='box', style='filled', fillcolor=fillcolor)
+        elif entry['type'] == 'operation':
+            node_id = f"op_{entry['name']}"
+            dot.node(node_id, label=entry['name'], shape='ellipse', style='filled', fillcolor='lightgreen')
+            dot.edge(entry['input'], node_id)
+            dot.edge(node_id, entry['output'])
+
+
+def build_graph(lineage_data, fmt='png', summary=False, timings=True):
+    """Return the Graphviz Digraph of a lineage list, in full or summary mode (summary graphs never show timings)."""
+    dot = Digraph(comment='Data Lineage Graph', format=fmt)
+    dot.attr(rankdir='LR')  # Left to right layout
+    if summary:
+        add_summary_nodes(dot, lineage_data)
+    else:
+        add_full_nodes(dot, lineage_data, timings)
+    return dot
+
+
+def render_lineage(lineage_data, fmt='png', summary=None, folder=LINEAGE_FOLDER, catalog_folder=CATALOG_FOLDER,
+                   timings=True):
+    """Write the lineage graph as data_lineage_<hash>.dot and render it with dot; returns the rendered path.
+
+    The file name is graph_key of the lineage, so a graph that was drawn before is not laid out again.
+    summary=None picks summary mode for lineages longer than SUMMARY_ENTRIES; timings=False leaves step
+    timings and the slowest-step highlight out of full graphs. Returns None when the dot executable is
+    missing or fails; the .dot file is kept for rendering by hand.
+    """
+    if fmt not in RENDER_FORMATS:
+        raise ValueError(f"Unknown lineage graph format: {fmt}")
+    if summary is None:
+        summary = len(lineage_data) > SUMMARY_ENTRIES
+    key = graph_key(lineage_data, summary, timings)
+    graph_path = os.path.join(folder, f"data_lineage_{'summary_' if summary else ''}{key[:16]}")
+    rendered = f"{graph_path}.{fmt}"
+    if os.path.exists(rendered):
+        logger.info(f"Lineage graph unchanged, already rendered: {rendered}")
+        return rendered
+
+    logger.info(f"Rendering data lineage graph with {len(lineage_data)} entries: {rendered}")
+    if logger.isEnabledFor(logging.DEBUG):
+        for entry in lineage_data:
+            logger.debug(f"Lineage entry: {entry}")
+    os.makedirs(folder, exist_ok=True)
+    dot = build_graph(lineage_data, fmt, summary, timings)
+    dot.save(f"{graph_path}.dot")
+    try:
+        # Rendered under a temporary name, so an existing file always holds a complete graph
+        tmp_path = f"{graph_path}.tmp.{fmt}"
+        subprocess.run(['dot', f"-T{fmt}", f"{graph_path}.dot", '-o', tmp_path], check=True,
+                       capture_output=True, timeout=RENDER_TIMEOUT)
+        os.replace(tmp_path, rendered)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Error rendering Graphviz graph: {e}. Ensure Graphviz is installed and the 'dot' "
+                       f"executable is in your PATH, or render the .dot file manually using: "
+                       f"dot -T{fmt} {graph_path}.dot -o {rendered}")
+        rendered = None
+    register_artifact(f"{graph_path}.dot", "data_lineage_unified", rows=len(lineage_data),
+                      exports=[rendered] if rendered else [], catalog_folder=catalog_folder)
+    if rendered:
+        logger.info(f"Unified data lineage graph saved to: {rendered}")
+    return rendered
+
+
+def render_lineage_async(lineage_data, fmt='png', summary=None, folder=LINEAGE_FOLDER, catalog_folder=CATALOG_FOLDER,
+                         timings=True):
+    """Queue render_lineage on the background render thread and return its Future.
+
+    Folders are resolved now, so a caller that changes directory afterwards does not move the output.
+    """
+    return _executor.submit(render_lineage, list(lineage_data), fmt, summary, os.path.abspath(folder),
+                            os.path.abspath(catalog_folder), timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a data lineage graph.")
+    parser.add_argument("lineage", nargs="?",
+                        help="Lineage JSON file (default: the latest cleaned_lineage, else join_lineage)")
+    parser.add_argument("--format", choices=RENDER_FORMATS, default='svg')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--summary", action="store_true", default=None, help="Collapse merges, omit column lists")
+    mode.add_argument("--full", dest="summary", action="store_false", help="Draw every entry in full")
+    parser.add_argument("--no-timings", dest="timings", action="store_false",
+                        help="Leave step timings and the slowest-step highlight out")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    lineage_file = args.lineage
+    if lineage_file is None:
+        record = latest_artifact("cleaned_lineage") or latest_artifact("join_lineage")
+        if record is None:
+            logger.error("No lineage file found. Run the pipeline first or pass a lineage JSON file.")
+            return 1
+        lineage_file = record['path']
+    with open(lineage_file, 'r') as f:
+        lineage_data = json.load(f)
+    return 0 if render_lineage(lineage_data, args.format, args.summary, timings=args.timings) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
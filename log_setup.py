@@ -0,0 +1,18 @@
+import logging
+
+# Verbosity levels of the pipeline's loggers. 'quiet' is the production mode: only warnings and errors
+# are logged, and diagnostics that cost real work (sample dumps, per-source summaries) are skipped.
+VERBOSITY_LEVELS = {
+    'quiet': logging.WARNING,
+    'info': logging.INFO,
+    'debug': logging.DEBUG,
+}
+DEFAULT_VERBOSITY = 'info'
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging(verbosity=DEFAULT_VERBOSITY):
+    """Send log records of the given verbosity ('quiet', 'info' or 'debug') to stderr."""
+    if verbosity not in VERBOSITY_LEVELS:
+        raise ValueError(f"Unknown verbosity: {verbosity}")
+    logging.basicConfig(format=LOG_FORMAT, level=VERBOSITY_LEVELS[verbosity], force=True)
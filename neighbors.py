@@ -0,0 +1,137 @@
+import os
+import pickle
+import logging
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from storage import get_latest_csv, read_dataset
+from stage_cache import fingerprint
+
+logger = logging.getLogger(__name__)
+
+INDEX_FOLDER = os.path.join("automated data", "neighbors")
+EARTH_RADIUS_MILES = 3958.8
+LATITUDE_COLUMN = 'zcta_latitude'
+LONGITUDE_COLUMN = 'zcta_longitude'
+
+
+def unit_vectors(latitudes, longitudes):
+    """Convert latitude/longitude degrees to 3D unit vectors, where chord length tracks great-circle distance."""
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(latitudes) * np.cos(longitudes),
+                            np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)])
+
+
+def miles_to_chord(miles):
+    return 2 * np.sin(np.asarray(miles, dtype=float) / (2 * EARTH_RADIUS_MILES))
+
+
+def chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0, 1))
+
+
+class ZctaNeighbors:
+    """Radius and k-nearest-neighbor queries over ZCTA points with a KD-tree on unit vectors.
+
+    A KD-tree over 3D unit vectors answers great-circle (haversine) queries exactly, because the
+    straight-line chord between two points on the sphere grows monotonically with their arc distance.
+    """
+
+    def __init__(self, table):
+        # One point per ZCTA; rows without coordinates cannot be neighbors
+        table = table.dropna(subset=[LATITUDE_COLUMN, LONGITUDE_COLUMN]).drop_duplicates('zcta')
+        self.table = table.reset_index(drop=True)
+        self.tree = cKDTree(unit_vectors(self.table[LATITUDE_COLUMN], self.table[LONGITUDE_COLUMN]))
+        # Trees over the ZCTAs that have a value in a column, built on first use
+        self._subset_trees = {}
+
+    @classmethod
+    def from_cleaned_data(cls, path=None, index_folder=INDEX_FOLDER):
+        """Load the index of a cleaned_data artifact (default: the latest), building and caching it if needed."""
+        path = path or get_latest_csv("cleaned_data")
+        if path is None:
+            raise FileNotFoundError("No cleaned_data artifact to build the neighbor index from")
+        key = fingerprint("zcta_neighbors", [path], cache_folder=index_folder)
+        index_path = os.path.join(index_folder, f"zcta_neighbors_{key[:16]}.pkl")
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                return pickle.load(f)
+        neighbors = cls(read_dataset(path))
+        os.makedirs(index_folder, exist_ok=True)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(neighbors, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+        logger.info(f"Neighbor index over {len(neighbors.table)} ZCTAs saved to {index_path}")
+        return neighbors
+
+    def _tree(self, require):
+        """Return (tree, table positions) over all ZCTAs, or only those with a value in column require."""
+        if require is None:
+            return self.tree, np.arange(len(self.table))
+        if require not in self._subset_trees:
+            positions = np.flatnonzero(self.table[require].notna().to_numpy())
+            self._subset_trees[require] = (cKDTree(self.tree.data[positions]), positions)
+        return self._subset_trees[require]
+
+    def _result(self, query, positions, chords):
+        return pd.DataFrame({
+            'query': query,
+            'zcta': self.table['zcta'].to_numpy()[positions],
+            'distance_miles': chord_to_miles(chords),
+        })
+
+    def within(self, latitudes, longitudes, radius_miles, require=None):
+        """Return every ZCTA within radius_miles of each query point, one row per (query, ZCTA) pair.
+
+        query is the position of the query point; require limits matches to ZCTAs with a value in that column.
+        """
+        tree, positions = self._tree(require)
+        points = unit_vectors(latitudes, longitudes)
+        matches = tree.query_ball_point(points, r=miles_to_chord(radius_miles), return_sorted=True)
+        lengths = np.fromiter((len(match) for match in matches), dtype=np.intp, count=len(matches))
+        found = np.fromiter((index for match in matches for index in match), dtype=np.intp, count=lengths.sum())
+        query = np.repeat(np.arange(len(points)), lengths)
+        chords = np.linalg.norm(tree.data[found] - points[query], axis=1)
+        result = self._result(query, positions[found], chords)
+        return result.sort_values(['query', 'distance_miles'], kind='stable', ignore_index=True)
+
+    def nearest(self, latitudes, longitudes, k=5, require=None):
+        """Return the k nearest ZCTAs of each query point, nearest first, one row per (query, ZCTA) pair.
+
+        The result has no rows when no ZCTA has a value in column require.
+        """
+        tree, positions = self._tree(require)
+        points = unit_vectors(latitudes, longitudes)
+        k = min(k, tree.n)
+        if k == 0:
+            none = np.empty(0, dtype=np.intp)
+            return self._result(none, positions[none], np.empty(0))
+        chords, found = tree.query(points, k=k)
+        chords = np.asarray(chords).reshape(len(points), k)
+        found = np.asarray(found).reshape(len(points), k)
+        query = np.repeat(np.arange(len(points)), k)
+        return self._result(query, positions[found.ravel()], chords.ravel())
+
+    def aggregate(self, latitudes, longitudes, column, radius_miles=None, k=None, func='mean', exclude_self=False):
+        """Aggregate column over the neighbors of each query point; returns one value per query point.
+
+        Neighbors are the ZCTAs within radius_miles or the k nearest ones with a value in column.
+        With exclude_self=True a ZCTA at distance zero (the query point's own ZCTA) is left out.
+        """
+        if (radius_miles is None) == (k is None):
+            raise ValueError("Pass exactly one of radius_miles and k")
+        if radius_miles is not None:
+            pairs = self.within(latitudes, longitudes, radius_miles, require=column)
+        else:
+            pairs = self.nearest(latitudes, longitudes, k=k + int(exclude_self), require=column)
+        if exclude_self:
+            pairs = pairs[pairs['distance_miles'] > 0]
+            if k is not None:
+                pairs = pairs.groupby('query', sort=False).head(k)
+        values = self.table.set_index('zcta')[column]
+        pairs = pairs.assign(value=values.reindex(pairs['zcta']).to_numpy())
+        aggregated = pairs.groupby('query')['value'].agg(func)
+        return aggregated.reindex(np.arange(len(np.atleast_1d(latitudes)))).to_numpy()
@@ -0,0 +1,92 @@
+import os
+import re
+import sys
+import glob
+import shutil
+import logging
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from catalog import register_artifact
+from storage import COMPRESSION
+from schemas import apply_schema
+from get_zcta_data import get_zcta_data, shapefile_path, VINTAGE_PATTERN
+from join_data import join_data
+from clean_data import clean_data, CLEANED_COLUMNS
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+PANEL_NAME = "cleaned_panel"
+# Hive-style partition key of the panel: <panel>.parquet/year=<vintage>/part-0.parquet
+PARTITION_COLUMN = "year"
+
+
+def available_vintages():
+    """Return the vintage years that have a ZCTA shapefile in manual data, oldest first."""
+    shapefiles = glob.glob(VINTAGE_PATTERN.format(vintage="*"))
+    return sorted({int(re.search(r"tl_(\d{4})_", os.path.basename(path)).group(1)) for path in shapefiles})
+
+
+def build_vintage(vintage, panel_folder, coordinates="internal_point"):
+    """Run the ZCTA, join and clean stages for one vintage in memory and write its panel partition.
+
+    Runs in a worker process. Every vintage's partition has all CLEANED_COLUMNS with their declared
+    dtypes (columns of missing sources are null), so the partitions read back as one table.
+    Returns the number of rows written.
+    """
+    zcta_data = get_zcta_data(coordinates=coordinates, persist=False, vintage=vintage)
+    merged_data, lineage_data = join_data(zcta_data=zcta_data, persist=False, vintage=vintage)
+    cleaned_data, _ = clean_data(merged_data=merged_data, lineage_data=lineage_data, persist=False,
+                                 graph_format=None, vintage=vintage)
+    partition = apply_schema(cleaned_data.reindex(columns=CLEANED_COLUMNS), 'cleaned_data')
+    partition_folder = os.path.join(panel_folder, f"{PARTITION_COLUMN}={vintage}")
+    os.makedirs(partition_folder, exist_ok=True)
+    partition.to_parquet(os.path.join(partition_folder, "part-0.parquet"), index=False, compression=COMPRESSION)
+    logger.info(f"Wrote {len(partition)} rows of the {vintage} vintage")
+    return len(partition)
+
+
+def build_panel(vintages=None, workers=None, coordinates="internal_point", folder="automated data"):
+    """Build the cleaned data of several TIGER/Line vintages in parallel and write them as one panel dataset.
+
+    vintages defaults to available_vintages(). Each vintage runs in its own process (at most workers
+    at a time) and writes one partition of a Hive-partitioned Parquet dataset keyed by year, which
+    is registered in the catalog as cleaned_panel and read back with read_dataset. Returns its path.
+    """
+    vintages = sorted(set(vintages or available_vintages()))
+    if not vintages:
+        raise FileNotFoundError(f"No ZCTA shapefiles matching {VINTAGE_PATTERN.format(vintage='*')}")
+    shapefiles = [shapefile_path(vintage) for vintage in vintages]
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    panel_path = os.path.join(folder, f"{PANEL_NAME}_{timestamp}.parquet")
+    # Partitions are written under a temporary name, so a failed vintage never leaves a partial panel behind
+    tmp_path = f"{panel_path}.tmp"
+    logger.info(f"Building vintages {vintages} with {workers or len(vintages)} processes...")
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers or len(vintages), len(vintages))) as executor:
+            rows = list(executor.map(build_vintage, vintages, [tmp_path] * len(vintages),
+                                     [coordinates] * len(vintages)))
+        os.replace(tmp_path, panel_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    register_artifact(panel_path, PANEL_NAME, rows=sum(rows), inputs=shapefiles, timestamp=timestamp,
+                      catalog_folder=folder)
+    logger.info(f"Saved {sum(rows)} rows of {len(vintages)} vintages to {panel_path}")
+    return panel_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a year-partitioned panel of several TIGER/Line vintages.")
+    parser.add_argument("--vintages", type=int, nargs="+", help="Vintage years (default: every shapefile found)")
+    parser.add_argument("--workers", type=int, help="Processes building vintages in parallel (default: one each)")
+    parser.add_argument("--coordinates", choices=["internal_point", "centroid"], default="internal_point")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    build_panel(args.vintages, args.workers, args.coordinates)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import sys
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from get_zcta_data import get_zcta_data
+from join_data import join_data
+from clean_data import clean_data
+from log_setup import configure_logging, VERBOSITY_LEVELS, DEFAULT_VERBOSITY
+
+logger = logging.getLogger(__name__)
+
+
+def zcta_stage(upstream, persist):
+    """Extract ZCTA coordinates from the shapefile."""
+    return get_zcta_data(persist=persist)
+
+
+def join_stage(upstream, persist):
+    """Join every source onto the in-memory ZCTA data; returns (merged_data, lineage_data)."""
+    return join_data(zcta_data=upstream['zcta_data'], persist=persist)
+
+
+def clean_stage(upstream, persist):
+    """Clean the in-memory merged data, extending its lineage; returns (cleaned_data, lineage_data)."""
+    merged_data, lineage_data = upstream['merged_data']
+    if merged_data is None:
+        logger.error("Merged data is required. Exiting.")
+        return None, None
+    return clean_data(merged_data=merged_data, lineage_data=lineage_data, persist=persist)
+
+
+# Stages of the pipeline, named after the dataset each one produces. A stage receives the outputs of
+# the stages it depends on by name and whether its own output should be written to automated data.
+PIPELINE_STAGES = [
+    {'name': 'zcta_data', 'function': zcta_stage, 'depends_on': []},
+    {'name': 'merged_data', 'function': join_stage, 'depends_on': ['zcta_data']},
+    {'name': 'cleaned_data', 'function': clean_stage, 'depends_on': ['merged_data']},
+]
+
+
+def check_stages(stages):
+    """Raise ValueError if a stage depends on an unknown stage or the dependencies form a cycle."""
+    names = [stage['name'] for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names: {names}")
+    for stage in stages:
+        unknown = [name for name in stage['depends_on'] if name not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage['name']} depends on unknown stages: {unknown}")
+    resolved = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if set(stage['depends_on']) <= resolved]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {[stage['name'] for stage in remaining]}")
+        resolved.update(stage['name'] for stage in ready)
+        remaining = [stage for stage in remaining if stage['name'] not in resolved]
+
+
+def run_pipeline(stages=None, persist=('cleaned_data',), max_workers=4):
+    """Run a DAG of stages in one process and return {stage name: output}.
+
+    Outputs are handed to dependent stages in memory instead of being written and rediscovered on
+    disk, and only the stages named in persist write their artifacts. Every stage whose dependencies
+    have finished is started right away, so independent stages run concurrently in a thread pool.
+    """
+    stages = PIPELINE_STAGES if stages is None else stages
+    check_stages(stages)
+    outputs = {}
+    pending = {stage['name']: stage for stage in stages}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Start every stage whose dependencies are all done
+            for name, stage in list(pending.items()):
+                if all(dependency in outputs for dependency in stage['depends_on']):
+                    upstream = {dependency: outputs[dependency] for dependency in stage['depends_on']}
+                    logger.info(f"Starting stage {name}")
+                    running[executor.submit(stage['function'], upstream, name in persist)] = name
+                    del pending[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                # Re-raise a failed stage's exception; stages already running finish before the pool exits
+                outputs[name] = future.result()
+                logger.info(f"Finished stage {name}")
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ZCTA pipeline in one process.")
+    parser.add_argument("--persist", nargs="*", default=['cleaned_data'],
+                        help="Stages whose artifacts are written (default: cleaned_data)")
+    parser.add_argument("--verbosity", choices=list(VERBOSITY_LEVELS), default=DEFAULT_VERBOSITY,
+                        help="'quiet' logs warnings only and skips all diagnostic work")
+    args = parser.parse_args(argv)
+    configure_logging(args.verbosity)
+    run_pipeline(persist=args.persist)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+# Number of slowest profiled steps whose edges are highlighted in the lineage graph
+SLOWEST_EDGES = 3
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def frame_memory_mb(df):
+    """Return the deep memory usage of a DataFrame in MiB."""
+    return float(df.memory_usage(index=False, deep=True).sum()) / 2 ** 20
+
+
+@contextmanager
+def profiled():
+    """Time the enclosed block and yield a dict that is filled with its profile on exit.
+
+    CPU time is measured for the current thread only, so steps running concurrently in a thread
+    pool are not charged for each other's work. Peak RSS is the process peak at the end of the step.
+    """
+    profile = {}
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    yield profile
+    profile['wall_seconds'] = time.perf_counter() - start_wall
+    profile['cpu_seconds'] = time.thread_time() - start_cpu
+    profile['peak_rss_mb'] = peak_rss_mb()
+
+
+def call_profiled(function, *args):
+    """Call function(*args) and return (result, profile); a DataFrame result's memory is added to the profile."""
+    with profiled() as profile:
+        result = function(*args)
+    if hasattr(result, 'memory_usage'):
+        profile['rows_out'] = len(result)
+        profile['memory_mb'] = frame_memory_mb(result)
+    return result, profile
+
+
+def profile_label(profile):
+    """Format the profile of a lineage entry as extra Graphviz label lines."""
+    lines = [f"{profile['wall_seconds']:.3f}s wall / {profile['cpu_seconds']:.3f}s CPU"]
+    if 'rows_in' in profile or 'rows_out' in profile:
+        lines.append(f"rows {profile.get('rows_in', '-')} -> {profile.get('rows_out', '-')}")
+    if 'match_rate' in profile:
+        lines.append(f"match rate {profile['match_rate']:.1%}")
+    if 'memory_mb' in profile:
+        lines.append(f"{profile['memory_mb']:.1f} MiB frame / {profile['peak_rss_mb']:.0f} MiB peak RSS")
+    return "\\n".join(lines)
+
+
+def slowest_steps(lineage_data, count=SLOWEST_EDGES):
+    """Return the lineage entries with the largest wall time, slowest first."""
+    profiled_entries = [entry for entry in lineage_data if 'profile' in entry]
+    return sorted(profiled_entries, key=lambda entry: entry['profile']['wall_seconds'], reverse=True)[:count]
+
+
+def write_profile(lineage_data, stage_name, path):
+    """Write the profiled steps of a lineage list as a machine-readable profile JSON and return it."""
+    steps = []
+    for entry in lineage_data:
+        if 'profile' not in entry:
+            continue
+        name = entry.get('output') if entry['type'] == 'merge' else entry['name']
+        steps.append({'type': entry['type'], 'name': name, **entry['profile']})
+    profile = {
+        'stage': stage_name,
+        'total_wall_seconds': sum(step['wall_seconds'] for step in steps),
+        'total_cpu_seconds': sum(step['cpu_seconds'] for step in steps),
+        'peak_rss_mb': peak_rss_mb(),
+        'steps': steps,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=4)
+    return profile
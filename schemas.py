@@ -0,0 +1,85 @@
+import pandas as pd
+
+# Declared column dtypes of every dataset the pipeline reads, applied on read instead of inferring them.
+# Low-cardinality text is categorical, counts are nullable ints, and free text is a string dtype.
+# zcta keys are read as they are stored (float in the manual CSVs, which drop leading zeros, and
+# five-digit strings in pipeline artifacts) and normalized by zcta_keys.parse_zcta afterwards.
+SCHEMAS = {
+    'zcta_data': {
+        'zcta': 'string',
+        'latitude': 'float64',
+        'longitude': 'float64',
+    },
+    'zip_zcta_xref': {
+        'zcta': 'float64',
+        'zip_code': 'UInt32',
+        'source': 'category',
+    },
+    'zcta_review': {
+        'zip': 'UInt32',
+        'city': 'category',
+        'stusab': 'category',
+        'latitude': 'float64',
+        'longitude': 'float64',
+        'INTPTLAT': 'float64',
+        'INTPTLONG': 'float64',
+        'zcta': 'float64',
+        'point map url\n': 'string',
+        'zip map url': 'string',
+        'result': 'Int64',
+        'notes': 'string',
+        'census_reporter_check': 'category',
+    },
+    'income_data': {
+        'zcta': 'string',
+        'median_household_income': 'Int64',
+    },
+    'crime_data': {
+        'zcta': 'string',
+        'crime_grade': 'category',
+    },
+    'sunlight_data': {
+        'zcta': 'string',
+        'peak_sun_hours_per_day': 'float64',
+        'sunlight_hours_per_year': 'float64',
+        'shortest_daylight_hours': 'float64',
+    },
+    'cleaned_data': {
+        'zcta': 'string',
+        'zip': 'string',
+        'city': 'category',
+        'stusab': 'category',
+        'zcta_latitude': 'float64',
+        'zcta_longitude': 'float64',
+        'city_latitude': 'float64',
+        'city_longitude': 'float64',
+        'median_household_income': 'Int64',
+        'crime_grade': 'category',
+        'sunlight_hours_per_year': 'float64',
+        'zcta_review_notes': 'string',
+    },
+}
+
+
+def schema_columns(dataset_name, available, columns=None, exclude=()):
+    """Return the declared columns of a dataset to read from a file with the given available columns.
+
+    columns narrows the read to a subset (in that order); excluded and absent columns are left out.
+    """
+    schema = SCHEMAS[dataset_name]
+    wanted = columns if columns is not None else list(schema)
+    return [col for col in wanted if col in available and col not in exclude]
+
+
+def read_csv_typed(path, dataset_name, columns):
+    """Read only the given columns of a CSV with their declared dtypes, using the multithreaded pyarrow parser."""
+    schema = SCHEMAS[dataset_name]
+    return pd.read_csv(path, engine='pyarrow', usecols=columns,
+                       dtype={col: schema[col] for col in columns if col in schema})
+
+
+def apply_schema(df, dataset_name):
+    """Cast the columns of df that have a declared dtype in the dataset's schema; others are left as they are."""
+    schema = SCHEMAS[dataset_name]
+    casts = {col: dtype for col, dtype in schema.items() if col in df.columns and str(df[col].dtype) != dtype}
+    return df.astype(casts) if casts else df
@@ -0,0 +1,391 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import glob
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from catalog import latest_artifact, CATALOG_FOLDER
+from storage import read_dataset
+from zcta_keys import parse_zcta, ZCTA_MAX
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SERVING_FOLDER = os.path.join("automated data", "serving")
+XREF_PATH = os.path.join("manual data", "zip_zcta_xref.csv")
+DEFAULT_PORT = 8765
+RELOAD_INTERVAL = 5.0
+MANIFEST_FILE = "manifest.json"
+# Pointer to the published snapshot that workers attach to
+CURRENT_FILE = "CURRENT"
+# Published snapshots kept on disk, the current one included
+KEEP_SNAPSHOTS = 2
+
+
+def build_snapshot(cleaned, key, xref_path=XREF_PATH, folder=SERVING_FOLDER):
+    """Write the memory-mappable snapshot of a cleaned table (DataFrame or artifact path) and return its folder.
+
+    The folder holds one .npy file per column array, the ZCTA -> row and ZIP -> ZCTA index arrays
+    (five-digit codes index them directly, -1 means absent) and a manifest.json with the column
+    layout and the string dictionaries. Numbers are a values array plus a validity mask, and text
+    is int32 codes into the column's dictionary. Existing snapshots are reused.
+    """
+    snapshot = os.path.join(folder, f"cleaned_{key[:16]}")
+    if os.path.exists(os.path.join(snapshot, MANIFEST_FILE)):
+        return snapshot
+    table = read_dataset(cleaned) if isinstance(cleaned, str) else cleaned
+
+    # One row per ZCTA: the first cleaned row of each
+    keys = parse_zcta(table['zcta'])
+    keep = keys.notna().to_numpy() & ~keys.duplicated().to_numpy()
+    table = table[keep].reset_index(drop=True)
+    arrays = {'rows': np.full(ZCTA_MAX + 1, -1, dtype=np.int32), 'zips': np.full(ZCTA_MAX + 1, -1, dtype=np.int32)}
+    arrays['rows'][keys[keep].to_numpy(dtype=np.int64)] = np.arange(len(table), dtype=np.int32)
+
+    if xref_path and os.path.exists(xref_path):
+        xref = pd.read_csv(xref_path, usecols=['zcta', 'zip_code'], engine='pyarrow')
+        zip_keys = parse_zcta(xref['zip_code'])
+        zcta_keys = parse_zcta(xref['zcta'])
+        valid = zip_keys.notna().to_numpy() & zcta_keys.notna().to_numpy()
+        # A ZIP split across ZCTAs resolves to the first listed one
+        first = valid & ~zip_keys.where(valid).duplicated().to_numpy()
+        arrays['zips'][zip_keys[first].to_numpy(dtype=np.int64)] = zcta_keys[first].to_numpy(dtype=np.int64)
+
+    columns = []
+    for index, name in enumerate(table.columns):
+        series = table[name]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            valid = series.notna().to_numpy()
+            dtype = float if pd.api.types.is_float_dtype(series.dtype) else getattr(series.dtype, 'numpy_dtype', series.dtype)
+            arrays[f"values_{index}"] = series.to_numpy(dtype=dtype, na_value=0)
+            arrays[f"valid_{index}"] = valid
+            columns.append({'name': name, 'kind': 'number', 'values': f"values_{index}", 'valid': f"valid_{index}"})
+        else:
+            codes, uniques = pd.factorize(series)
+            arrays[f"codes_{index}"] = codes.astype(np.int32)
+            columns.append({'name': name, 'kind': 'text', 'codes': f"codes_{index}",
+                            'dictionary': [str(value) for value in uniques]})
+
+    # Write into a temporary folder and rename it, so readers never see a partial snapshot
+    os.makedirs(folder, exist_ok=True)
+    tmp_snapshot = f"{snapshot}.tmp{os.getpid()}"
+    os.makedirs(tmp_snapshot, exist_ok=True)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(tmp_snapshot, f"{array_name}.npy"), array)
+    with open(os.path.join(tmp_snapshot, MANIFEST_FILE), 'w') as f:
+        json.dump({'rows': len(table), 'columns': columns}, f)
+    try:
+        os.replace(tmp_snapshot, snapshot)
+    except OSError:
+        # Another process published the same snapshot first
+        shutil.rmtree(tmp_snapshot, ignore_errors=True)
+    logger.info(f"Serving snapshot of {len(table)} ZCTAs saved to {snapshot}")
+    return snapshot
+
+
+def publish_snapshot(cleaned, key, xref_path=XREF_PATH, folder=SERVING_FOLDER, keep=KEEP_SNAPSHOTS):
+    """Build the snapshot of a cleaned table and make it the current one; returns the snapshot folder.
+
+    The CURRENT pointer file is replaced atomically, so attaching workers see either the old or the
+    new snapshot. Older snapshots beyond the newest keep are deleted; processes that still map
+    their files keep reading them until they attach to the new one. Republishing the current
+    snapshot returns right away, without reading the table or the xref.
+    """
+    snapshot = os.path.join(folder, f"cleaned_{key[:16]}")
+    if current_snapshot(folder) == snapshot and os.path.exists(os.path.join(snapshot, MANIFEST_FILE)):
+        return snapshot
+    snapshot = build_snapshot(cleaned, key, xref_path, folder)
+    pointer_path = os.path.join(folder, CURRENT_FILE)
+    if current_snapshot(folder) != snapshot:
+        tmp_path = f"{pointer_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({'snapshot': os.path.basename(snapshot), 'sha256': key}, f)
+        os.replace(tmp_path, pointer_path)
+        logger.info(f"Published serving snapshot {snapshot}")
+
+    snapshots = sorted(glob.glob(os.path.join(folder, "cleaned_*", MANIFEST_FILE)), key=os.path.getmtime, reverse=True)
+    for manifest_path in snapshots[keep:]:
+        if os.path.dirname(manifest_path) != snapshot:
+            shutil.rmtree(os.path.dirname(manifest_path), ignore_errors=True)
+    return snapshot
+
+
+def current_snapshot(folder=SERVING_FOLDER):
+    """Return the folder of the currently published snapshot, or None."""
+    pointer_path = os.path.join(folder, CURRENT_FILE)
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, 'r') as f:
+        return os.path.join(folder, json.load(f)['snapshot'])
+
+
+def attach(folder=SERVING_FOLDER):
+    """Attach to the currently published snapshot without copying it; returns a ZctaLookupTable or None."""
+    snapshot = current_snapshot(folder)
+    return ZctaLookupTable(snapshot) if snapshot else None
+
+
+class ZctaLookupTable:
+    """Read-only ZCTA table over a memory-mapped snapshot with O(1) lookups by ZCTA or ZIP code.
+
+    Every array is a read-only memory map, so processes attached to the same snapshot share its
+    physical pages and attaching costs almost nothing however many workers there are.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        with open(os.path.join(snapshot, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+
+        def load(array_name):
+            # A plain ndarray view of the memory map indexes faster than np.memmap and shares the same pages
+            return np.asarray(np.load(os.path.join(snapshot, f"{array_name}.npy"), mmap_mode='r'))
+
+        self.rows = load('rows')
+        self.zips = load('zips')
+        self.columns = {}
+        for column in manifest['columns']:
+            if column['kind'] == 'number':
+                self.columns[column['name']] = ('number', load(column['values']), load(column['valid']))
+            else:
+                self.columns[column['name']] = ('text', load(column['codes']), column['dictionary'])
+        # Arrow copies of the text dictionaries, made on first gather
+        self._dictionaries = {}
+        self.size = manifest['rows']
+
+    def column(self, name):
+        """Return a column as a pandas Series; text columns are categoricals over the shared codes."""
+        kind, values, extra = self.columns[name]
+        if kind == 'number' and values.dtype.kind in 'iu':
+            return pd.Series(pd.arrays.IntegerArray(values, ~extra), name=name)
+        if kind == 'number':
+            return pd.Series(values, name=name).where(extra)
+        return pd.Series(pd.Categorical.from_codes(values, categories=pd.Index(extra, dtype=object)), name=name)
+
+    def frame(self):
+        """Return the whole table as a DataFrame (a private copy, unlike the lookups)."""
+        return pd.DataFrame({name: self.column(name) for name in self.columns})
+
+    def _row_of(self, code, index):
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return -1
+        return index.item(code) if 0 <= code <= ZCTA_MAX else -1
+
+    def _record(self, row):
+        record = {}
+        for name, (kind, values, extra) in self.columns.items():
+            # ndarray.item returns a Python scalar without creating a NumPy scalar first
+            if kind == 'number':
+                record[name] = values.item(row) if extra.item(row) else None
+            else:
+                code = values.item(row)
+                record[name] = extra[code] if code >= 0 else None
+        return record
+
+    def _records(self, positions):
+        """Return one dict per position, or None for negative positions, gathering each column once."""
+        positions = np.asarray(positions, dtype=np.int64)
+        found = positions >= 0
+        rows = positions[found]
+        columns = {}
+        for name, (kind, values, extra) in self.columns.items():
+            if kind == 'number':
+                column = values[rows].tolist()
+                columns[name] = [value if valid else None for value, valid in zip(column, extra[rows])]
+            else:
+                columns[name] = [extra[code] if code >= 0 else None for code in values[rows].tolist()]
+        records = iter([dict(zip(columns, row)) for row in zip(*columns.values())])
+        return [next(records) if hit else None for hit in found]
+
+    def lookup(self, zcta):
+        """Return the record of one ZCTA (int or string code), or None if it is unknown."""
+        row = self._row_of(zcta, self.rows)
+        return self._record(row) if row >= 0 else None
+
+    def _codes(self, values):
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+            return np.where((values >= 0) & (values <= ZCTA_MAX), values, -1).astype(np.int64)
+        values = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+        return parse_zcta(values).to_numpy(dtype=np.int64, na_value=-1)
+
+    def _index(self, codes, index):
+        return np.where(codes >= 0, np.asarray(index)[np.maximum(codes, 0)], -1)
+
+    def positions(self, zctas):
+        """Return the table row of every ZCTA code in an array (-1 if unknown)."""
+        return self._index(np.asarray(zctas, dtype=np.int64), self.rows)
+
+    def zctas_of_zips(self, zip_codes):
+        """Return the ZCTA code of every ZIP code in a batch (or int array of codes) as an int64 array (-1 if unknown)."""
+        return self._index(self._codes(zip_codes), self.zips)
+
+    def gather(self, positions):
+        """Return the columns of the given rows as an Arrow table, with nulls where a position is -1."""
+        positions = np.asarray(positions, dtype=np.int64)
+        missing = positions < 0
+        rows = np.maximum(positions, 0)
+        arrays = {}
+        for name, (kind, values, extra) in self.columns.items():
+            if kind == 'number':
+                arrays[name] = pa.array(values[rows], mask=missing | ~extra[rows])
+            else:
+                if name not in self._dictionaries:
+                    self._dictionaries[name] = pa.array(extra, type=pa.string())
+                codes = values[rows]
+                arrays[name] = self._dictionaries[name].take(pa.array(codes, mask=missing | (codes < 0)))
+        return pa.table(arrays)
+
+    def lookup_many(self, zctas):
+        """Return a list with the record (or None) of every ZCTA in a batch, in order."""
+        return self._records(self._index(self._codes(zctas), self.rows))
+
+    def zcta_of_zip(self, zip_code):
+        """Return the ZCTA code a ZIP code belongs to, or None."""
+        zcta = self._row_of(zip_code, self.zips)
+        return zcta if zcta >= 0 else None
+
+    def lookup_zip(self, zip_code):
+        """Return the record of the ZCTA a ZIP code belongs to, or None."""
+        zcta = self.zcta_of_zip(zip_code)
+        return self.lookup(zcta) if zcta is not None else None
+
+    def lookup_zips(self, zip_codes):
+        """Return a list with the ZCTA record (or None) of every ZIP code in a batch, in order."""
+        return self._records(self.positions(self.zctas_of_zips(zip_codes)))
+
+
+def latest_snapshot(catalog_folder=CATALOG_FOLDER, serving_folder=SERVING_FOLDER, xref_path=XREF_PATH):
+    """Return (snapshot folder, catalog record) of the latest cleaned_data artifact, or (None, None) if there is none.
+
+    The snapshot is built if needed but not published: only clean_data moves the CURRENT pointer
+    and prunes old snapshots, so readers of another catalog never repoint attached workers.
+    """
+    record = latest_artifact("cleaned_data", catalog_folder=catalog_folder)
+    if record is None:
+        return None, None
+    return build_snapshot(record['path'], record['sha256'], xref_path, serving_folder), record
+
+
+class LookupService:
+    """Serve the latest cleaned_data artifact and swap in a new snapshot when a newer artifact is registered."""
+
+    def __init__(self, catalog_folder=CATALOG_FOLDER, serving_folder=SERVING_FOLDER, xref_path=XREF_PATH):
+        self.catalog_folder = catalog_folder
+        self.serving_folder = serving_folder
+        self.xref_path = xref_path
+        self.table = None
+        self.sha256 = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refresh()
+
+    def refresh(self):
+        """Load the latest cleaned artifact if it changed; returns True when a new snapshot was swapped in."""
+        snapshot, record = latest_snapshot(self.catalog_folder, self.serving_folder, self.xref_path)
+        if record is None:
+            if self.table is None:
+                logger.warning("No cleaned_data artifact to serve yet")
+            return False
+        if record['sha256'] == self.sha256:
+            return False
+        with self._lock:
+            # Requests in flight keep using the table they already hold
+            self.table = ZctaLookupTable(snapshot)
+            self.sha256 = record['sha256']
+        logger.info(f"Serving {record['path']}")
+        return True
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        """Poll the catalog for new cleaned artifacts in a daemon thread."""
+        def poll():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"Reloading the cleaned data failed: {e}")
+        thread = threading.Thread(target=poll, name="lookup-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_handler(service):
+    """Return an HTTP handler class answering /zcta/<code>, /zip/<code> and batched ?codes=a,b,c lookups."""
+
+    class LookupHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            table = service.table
+            if table is None:
+                self._send(503, {'error': "no cleaned data loaded"})
+                return
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split('/') if part]
+            codes = parse_qs(url.query).get('codes', [''])[0].split(',')
+            if len(parts) == 2 and parts[0] == 'zcta':
+                record = table.lookup(parts[1])
+                self._send(200 if record else 404, record or {'error': f"unknown ZCTA {parts[1]}"})
+            elif len(parts) == 2 and parts[0] == 'zip':
+                record = table.lookup_zip(parts[1])
+                self._send(200 if record else 404, record or {'error': f"unknown ZIP {parts[1]}"})
+            elif parts == ['zcta'] and url.query:
+                self._send(200, dict(zip(codes, table.lookup_many(codes))))
+            elif parts == ['zip'] and url.query:
+                self._send(200, dict(zip(codes, table.lookup_zips(codes))))
+            else:
+                self._send(404, {'error': "use /zcta/<code>, /zip/<code> or /zcta?codes=a,b,c"})
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return LookupHandler
+
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """Return a threading HTTP server for the service (call serve_forever on it)."""
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ZCTA and ZIP lookups over the latest cleaned data.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="Seconds between checks for a new cleaned_data artifact")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    service = LookupService()
+    service.watch(args.reload_interval)
+    server = serve(service, args.host, args.port)
+    logger.info(f"Serving lookups on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import logging
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import pandas as pd
+from datetime import datetime, timezone
+from catalog import file_hash, latest_artifact, register_artifact, folder_lock, CATALOG_FOLDER, TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = os.path.join("automated data", "stage_cache")
+INDEX_FILENAME = "index.json"
+# Content hashes of input files, reused while a file's size and mtime are unchanged
+FILE_HASHES_FILENAME = "file_hashes.json"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Lock file guarding the index and file hash memo of a cache folder across processes
+LOCK_FILENAME = "cache.lock"
+
+_cache_lock = threading.Lock()
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path, data):
+    # Per-process temporary name, so processes sharing the folder never replace each other's half-written file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def input_hash(path, cache_folder=CACHE_FOLDER):
+    """Return the SHA-256 of an input file, rehashing only when its size or mtime changed."""
+    stat = os.stat(path)
+    memo_path = os.path.join(cache_folder, FILE_HASHES_FILENAME)
+    key = os.path.abspath(path)
+    with folder_lock(_cache_lock, cache_folder, LOCK_FILENAME):
+        memo = _read_json(memo_path)
+    entry = memo.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+    digest = file_hash(path)
+    with folder_lock(_cache_lock, cache_folder, LOCK_FILENAME):
+        memo = _read_json(memo_path)
+        memo[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        _write_json_atomic(memo_path, memo)
+    return digest
+
+
+def frame_hash(df):
+    """Return a SHA-256 of a DataFrame's column names, dtypes and values (for in-memory stage inputs)."""
+    digest = hashlib.sha256()
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            # Object columns may hold unhashable values such as nested ZIP lists
+            values = values.astype(str)
+        digest.update(f"{column}:{df[column].dtype}".encode())
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint(stage_name, input_paths, params=None, frames=None, cache_folder=CACHE_FOLDER):
+    """Fingerprint a stage run from the contents of its input files, in-memory input frames and parameters."""
+    digest = hashlib.sha256()
+    digest.update(stage_name.encode())
+    digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    for path in input_paths:
+        digest.update(input_hash(path, cache_folder).encode() if path else b'<missing>')
+    for frame in frames or []:
+        digest.update(frame_hash(frame).encode())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Size-bounded, least-recently-used store of stage outputs keyed by fingerprint.
+
+    Each entry holds copies of the artifacts a stage produced, by dataset name, so a later run
+    with the same fingerprint can republish them without recomputing.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(folder, INDEX_FILENAME)
+
+    def get(self, key):
+        """Return the cache entry for a fingerprint (marking it recently used), or None on a miss."""
+        with folder_lock(_cache_lock, self.folder, LOCK_FILENAME):
+            index = _read_json(self.index_path)
+            entry = index.get(key)
+            if entry is None:
+                return None
+            if not all(os.path.exists(item['path']) for item in entry['files'].values()):
+                del index[key]
+                _write_json_atomic(self.index_path, index)
+                return None
+            entry['last_used'] = time.time()
+            _write_json_atomic(self.index_path, index)
+        return entry
+
+    def put(self, key, artifacts, catalog_folder=CATALOG_FOLDER):
+        """Copy the given {dataset_name: artifact_path} files into the cache under a fingerprint.
+
+        The artifacts' catalog records (rows and schema) are kept so a restore can re-register them.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        files = {}
+        for dataset_name, path in artifacts.items():
+            cache_path = os.path.join(self.folder, f"{key}_{dataset_name}{os.path.splitext(path)[1]}")
+            shutil.copyfile(path, cache_path)
+            record = latest_artifact(dataset_name, catalog_folder=catalog_folder) or {}
+            files[dataset_name] = {
+                'path': cache_path,
+                'sha256': file_hash(cache_path),
+                'folder': os.path.dirname(path),
+                'rows': record.get('rows'),
+                'schema': record.get('schema'),
+            }
+        entry = {
+            'files': files,
+            'catalog_folder': catalog_folder,
+            'size': sum(os.path.getsize(item['path']) for item in files.values()),
+            'last_used': time.time(),
+        }
+        with folder_lock(_cache_lock, self.folder, LOCK_FILENAME):
+            index = _read_json(self.index_path)
+            index[key] = entry
+            self._evict(index)
+            _write_json_atomic(self.index_path, index)
+        return entry
+
+    def _evict(self, index):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = sum(entry['size'] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            for item in index[key]['files'].values():
+                if os.path.exists(item['path']):
+                    os.remove(item['path'])
+            total -= index[key]['size']
+            logger.info(f"Evicted stage cache entry {key[:12]}")
+            del index[key]
+
+    def restore(self, entry):
+        """Make the cached artifacts the latest of their datasets and return {dataset_name: path}.
+
+        An artifact that is already the catalog's latest version is left in place; otherwise the
+        cached copy is republished under a new timestamp and registered in the catalog.
+        """
+        timestamp = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        restored = {}
+        for dataset_name, item in entry['files'].items():
+            record = latest_artifact(dataset_name, catalog_folder=entry['catalog_folder'])
+            if record is not None and record['sha256'] == item['sha256']:
+                restored[dataset_name] = record['path']
+                continue
+            os.makedirs(item['folder'], exist_ok=True)
+            path = os.path.join(item['folder'], f"{dataset_name}_{timestamp}{os.path.splitext(item['path'])[1]}")
+            shutil.copyfile(item['path'], path)
+            register_artifact(path, dataset_name, rows=item['rows'], schema=item['schema'], timestamp=timestamp,
+                              catalog_folder=entry['catalog_folder'])
+            restored[dataset_name] = path
+        return restored
@@ -0,0 +1,163 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+from datetime import datetime, timezone
+from catalog import register_artifact, latest_artifact, find_latest_by_name
+
+logger = logging.getLogger(__name__)
+
+# Supported on-disk formats and their file extensions
+FORMAT_EXTENSIONS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv': '.csv',
+}
+DEFAULT_FORMAT = "parquet"
+COMPRESSION = "zstd"
+
+# Key columns that must stay strings when parsed from CSV so leading zeros survive
+STRING_COLUMNS = {'zcta': str, 'zip': str, 'zip_code': str}
+
+
+def is_list_value(value):
+    """Return whether a cell holds a list, as the 'nest' fan-out of join_engine produces."""
+    return isinstance(value, (list, np.ndarray))
+
+
+def encode_list_columns(df):
+    """Return df with its list-valued columns (such as the nested zip_code of merged_data) as JSON array text.
+
+    CSV has no list type; JSON keeps the element types and tells an empty list ('[]') from a null
+    (empty cell). read_dataset decodes the columns again.
+    """
+    encoded = {}
+    for column in df.columns[df.dtypes == object]:
+        first = df[column].first_valid_index()
+        if first is not None and is_list_value(df[column][first]):
+            encoded[column] = df[column].map(
+                lambda value: json.dumps(np.asarray(value).tolist()) if is_list_value(value) else value)
+    return df.assign(**encoded) if encoded else df
+
+
+def decode_list_columns(df):
+    """Turn the JSON array columns written by encode_list_columns back into columns of object arrays."""
+    for column in df.columns[df.dtypes == object]:
+        text = df[column].dropna()
+        if len(text) and text.str.startswith('[').all() and text.str.endswith(']').all():
+            df[column] = df[column].map(
+                lambda value: np.array(json.loads(value), dtype=object) if isinstance(value, str) else None)
+    return df
+
+
+def write_csv(df, path):
+    """Write a DataFrame as CSV, with list-valued columns encoded as JSON arrays."""
+    encode_list_columns(df).to_csv(path, index=False)
+
+
+def format_from_path(path):
+    """Infer the storage format of a file from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, fmt_extension in FORMAT_EXTENSIONS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f"Unsupported file extension for {path}")
+
+
+def write_dataset(df, dataset_name, folder="automated data", fmt=None, timestamp=None, csv_export=False,
+                  inputs=None):
+    """Write a DataFrame as a timestamped artifact, register it in the catalog and return its path.
+
+    fmt is one of 'parquet', 'arrow' (Arrow IPC/Feather) or 'csv'. With csv_export=True a CSV
+    copy with the same timestamp is written next to a Parquet/Arrow artifact. inputs lists the
+    upstream files the artifact was built from.
+    """
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown storage format: {fmt}")
+    os.makedirs(folder, exist_ok=True)
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(folder, f"{dataset_name}_{timestamp}{FORMAT_EXTENSIONS[fmt]}")
+
+    logger.info(f"Saving {dataset_name} ({fmt}) to: {os.path.abspath(path)}")
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False, compression=COMPRESSION)
+    elif fmt == 'arrow':
+        df.reset_index(drop=True).to_feather(path, compression=COMPRESSION)
+    else:
+        write_csv(df, path)
+
+    exports = []
+    if csv_export and fmt != 'csv':
+        csv_path = os.path.join(folder, f"{dataset_name}_{timestamp}.csv")
+        logger.info(f"Exporting CSV copy to: {os.path.abspath(csv_path)}")
+        write_csv(df, csv_path)
+        exports.append(csv_path)
+
+    register_artifact(path, dataset_name, df=df, inputs=inputs, exports=exports, timestamp=timestamp,
+                      catalog_folder=folder)
+    return path
+
+
+def export_csv(df, path):
+    """Write a CSV copy next to an existing artifact unless one is already there; returns the CSV path."""
+    csv_path = os.path.splitext(path)[0] + '.csv'
+    if not os.path.exists(csv_path):
+        logger.info(f"Exporting CSV copy to: {os.path.abspath(csv_path)}")
+        write_csv(df, csv_path)
+    return csv_path
+
+
+def read_dataset(path, columns=None):
+    """Read an artifact written by write_dataset, optionally pruned to the given columns."""
+    fmt = format_from_path(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    if fmt == 'arrow':
+        return pd.read_feather(path, columns=columns)
+    return decode_list_columns(pd.read_csv(path, usecols=columns, dtype=STRING_COLUMNS))
+
+
+def dataset_columns(path):
+    """Return the column names of an artifact or CSV without reading its data."""
+    fmt = format_from_path(path)
+    if fmt == 'parquet':
+        # A directory is a partitioned dataset; its partition keys are columns too
+        return pq.ParquetDataset(path).schema.names if os.path.isdir(path) else pq.read_schema(path).names
+    if fmt == 'arrow':
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def vintage_name(dataset_name, vintage=None):
+    """Return the dataset name of one vintage year of a dataset (the plain name when vintage is None)."""
+    return dataset_name if vintage is None else f"{dataset_name}_{vintage}"
+
+
+def get_latest_file(dataset_name, folder="automated data", formats=None):
+    """Find the most recent artifact for a dataset across the given storage formats.
+
+    The catalog in the folder is consulted first; artifacts written before the catalog existed
+    are found by their filename timestamp.
+    """
+    formats = formats or list(FORMAT_EXTENSIONS)
+    record = latest_artifact(dataset_name, catalog_folder=folder)
+    if record is not None and record['format'] in formats:
+        latest_file = record['path']
+    else:
+        latest_file = find_latest_by_name(dataset_name, folder, [FORMAT_EXTENSIONS[fmt] for fmt in formats])
+    if latest_file is None:
+        logger.warning(f"No file found for {dataset_name} in {folder}")
+        return None
+    logger.debug(f"Found latest file for {dataset_name}: {latest_file}")
+    return latest_file
+
+
+def get_latest_csv(dataset_name, folder="automated data"):
+    """Find the most recent artifact for a dataset (Parquet, Arrow IPC or CSV)."""
+    return get_latest_file(dataset_name, folder)
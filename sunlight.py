@@ -0,0 +1,177 @@
+import sys
+import logging
+import argparse
+import calendar
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from storage import get_latest_csv, read_dataset, write_dataset, export_csv, DEFAULT_FORMAT
+from schemas import apply_schema
+from stage_cache import StageCache, fingerprint
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Solar geometry and clear-sky radiation follow FAO Irrigation and Drainage Paper 56, chapter 3
+# Solar constant, MJ/m2/min
+SOLAR_CONSTANT = 0.0820
+# Clear-sky transmissivity at sea level; Rso = (0.75 + 2e-5 * elevation in m) * Ra
+CLEAR_SKY_TRANSMISSIVITY = 0.75
+MJ_PER_KWH = 3.6
+SUNLIGHT_YEAR = 2024
+# ZCTAs evaluated at a time; bounds the (ZCTAs x days) temporaries to a few MB each
+ZCTA_BLOCK = 4096
+
+
+def solar_geometry(days, days_in_year):
+    """Return (declination, inverse relative Earth-Sun distance) for day-of-year numbers (1-based)."""
+    angle = 2 * np.pi * days / days_in_year
+    return 0.409 * np.sin(angle - 1.39), 1 + 0.033 * np.cos(angle)
+
+
+def sunset_hour_angle(latitudes, declination):
+    """Return (sin latitude, cos latitude, sunset hour angle, its sine) as (latitudes x days) arrays.
+
+    The hour angle comes from its cosine -tan(latitude) * tan(declination), clipped to [-1, 1] for
+    polar day and polar night; its sine is derived from the same cosine, leaving one arccos per element.
+    """
+    latitude = np.radians(np.asarray(latitudes, dtype=float))[:, None]
+    sin_latitude, cos_latitude = np.sin(latitude), np.cos(latitude)
+    cos_sunset = np.clip(-(sin_latitude / cos_latitude) * np.tan(declination), -1, 1)
+    return sin_latitude, cos_latitude, np.arccos(cos_sunset), np.sqrt(1 - cos_sunset ** 2)
+
+
+def radiation_factor(elevation):
+    """Return the factor that turns extraterrestrial radiation terms into clear-sky kWh/m2 at an elevation (m)."""
+    transmissivity = CLEAR_SKY_TRANSMISSIVITY + 2e-5 * np.asarray(elevation, dtype=float)
+    return transmissivity * 24 * 60 / np.pi * SOLAR_CONSTANT / MJ_PER_KWH
+
+
+def days_in(year):
+    return 366 if calendar.isleap(year) else 365
+
+
+def daily_sunlight(latitudes, year=SUNLIGHT_YEAR, elevation=0.0):
+    """Return (daylength hours, clear-sky radiation in kWh/m2) per latitude (degrees) and day of year.
+
+    Both are (len(latitudes), days in year) arrays. Latitudes beyond the polar circles get 0 or 24
+    hours of daylight on the days the sun never rises or sets.
+    """
+    declination, distance = solar_geometry(np.arange(1, days_in(year) + 1), days_in(year))
+    sin_latitude, cos_latitude, sunset, sin_sunset = sunset_hour_angle(latitudes, declination)
+    extraterrestrial = distance * (sunset * sin_latitude * np.sin(declination)
+                                   + cos_latitude * np.cos(declination) * sin_sunset)
+    return 24 / np.pi * sunset, np.reshape(radiation_factor(elevation), (-1, 1)) * extraterrestrial
+
+
+def yearly_sunlight(latitudes, year=SUNLIGHT_YEAR, elevation=0.0):
+    """Return (shortest daylength in hours, clear-sky kWh/m2 summed over the year) per latitude.
+
+    Latitudes are evaluated ZCTA_BLOCK at a time, and the sums over days are matrix-vector products
+    instead of materialized (latitudes x days) radiation arrays.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    declination, distance = solar_geometry(np.arange(1, days_in(year) + 1), days_in(year))
+    sine_weights = distance * np.sin(declination)
+    cosine_weights = distance * np.cos(declination)
+    shortest = np.empty(len(latitudes))
+    insolation = np.empty(len(latitudes))
+    for start in range(0, len(latitudes), ZCTA_BLOCK):
+        block = slice(start, start + ZCTA_BLOCK)
+        sin_latitude, cos_latitude, sunset, sin_sunset = sunset_hour_angle(latitudes[block], declination)
+        shortest[block] = 24 / np.pi * sunset.min(axis=1)
+        insolation[block] = (sin_latitude[:, 0] * (sunset @ sine_weights)
+                             + cos_latitude[:, 0] * (sin_sunset @ cosine_weights))
+    return shortest, radiation_factor(elevation) * insolation
+
+
+def _yearly_sunlight_task(task):
+    return yearly_sunlight(*task)
+
+
+def sunlight_hours(latitudes, years=(SUNLIGHT_YEAR,), elevation=0.0, workers=1):
+    """Average yearly_sunlight over several years and return a DataFrame of per-latitude sunlight columns.
+
+    peak_sun_hours_per_day is the mean daily clear-sky insolation in kWh/m2 (hours of 1 kW/m2 sun),
+    sunlight_hours_per_year its yearly total and shortest_daylight_hours the daylength of the shortest day.
+    With workers > 1 the years are computed in a process pool.
+    """
+    tasks = [(latitudes, year, elevation) for year in years]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(_yearly_sunlight_task, tasks))
+    else:
+        results = [_yearly_sunlight_task(task) for task in tasks]
+    days = sum(days_in(year) for year in years)
+    insolation = sum(result[1] for result in results)
+    return pd.DataFrame({
+        'peak_sun_hours_per_day': insolation / days,
+        'sunlight_hours_per_year': insolation / len(years),
+        'shortest_daylight_hours': np.minimum.reduce([result[0] for result in results]),
+    })
+
+
+def get_sunlight_data(zcta_data=None, years=(SUNLIGHT_YEAR,), workers=1, fmt=None, csv_export=False,
+                      use_cache=True, persist=True):
+    """Compute clear-sky sunlight for every ZCTA from its latitude and store it as sunlight_data.
+
+    zcta_data defaults to the latest zcta_data artifact. The values are astronomical (no clouds or
+    terrain) and averaged over the given years. With use_cache=True unchanged coordinates and
+    parameters reuse the previous artifact; with persist=False nothing is written.
+    """
+    logger.info("Computing sunlight data...")
+    zcta_file = None
+    if zcta_data is None:
+        zcta_file = get_latest_csv("zcta_data")
+        if not zcta_file:
+            raise FileNotFoundError("ZCTA data is required to compute sunlight data")
+        zcta_data = read_dataset(zcta_file)
+    years = sorted(set(years))
+
+    cache = StageCache() if use_cache else None
+    if cache is not None:
+        cache_key = fingerprint("get_sunlight_data", [zcta_file] if zcta_file else [],
+                                {'years': years, 'fmt': fmt or DEFAULT_FORMAT},
+                                frames=[] if zcta_file else [zcta_data[['zcta', 'latitude']]])
+        entry = cache.get(cache_key)
+        if entry is not None:
+            if not persist:
+                logger.info("Coordinates and parameters unchanged. Reusing cached sunlight data.")
+                return read_dataset(entry['files']['sunlight_data']['path'])
+            output_path = cache.restore(entry)['sunlight_data']
+            logger.info(f"Coordinates and parameters unchanged. Reusing cached sunlight data: {output_path}")
+            sunlight_data = read_dataset(output_path)
+            if csv_export:
+                export_csv(sunlight_data, output_path)
+            return sunlight_data
+
+    located = zcta_data.dropna(subset=['latitude'])
+    sunlight_data = sunlight_hours(located['latitude'].to_numpy(), years, workers=workers)
+    sunlight_data.insert(0, 'zcta', located['zcta'].to_numpy())
+    sunlight_data = apply_schema(sunlight_data, 'sunlight_data')
+    logger.info(f"Computed sunlight for {len(sunlight_data)} ZCTAs over {len(years)} year(s)")
+    if not persist:
+        return sunlight_data
+
+    output_path = write_dataset(sunlight_data, "sunlight_data", fmt=fmt, csv_export=csv_export,
+                                inputs=[zcta_file] if zcta_file else None)
+    logger.info(f"Saved sunlight data to {output_path}")
+    if cache is not None:
+        cache.put(cache_key, {'sunlight_data': output_path})
+    return sunlight_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute clear-sky sunlight hours for every ZCTA.")
+    parser.add_argument("--years", type=int, nargs="+", default=[SUNLIGHT_YEAR])
+    parser.add_argument("--workers", type=int, default=1, help="Processes computing years in parallel")
+    parser.add_argument("--csv-export", action="store_true")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    get_sunlight_data(years=args.years, workers=args.workers, csv_export=args.csv_export)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
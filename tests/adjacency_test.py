@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from adjacency import ZctaAdjacency, build_adjacency, impute_data
+
+
+def write_grid(folder):
+    """Write a 3x3 grid of unit squares as ZCTAs 00001 (bottom left) to 00009 (top right)."""
+    path = folder / "zcta.shp"
+    boxes = [shapely.box(x, y, x + 1, y + 1) for y in range(3) for x in range(3)]
+    gpd.GeoDataFrame({'ZCTA5CE20': [f"{code:05d}" for code in range(1, 10)]},
+                     geometry=boxes, crs="EPSG:4326").to_file(path)
+    return str(path)
+
+
+def test_queen_and_rook_neighbors_are_stored_as_a_reusable_csr_matrix(tmp_path):
+    shapefile = write_grid(tmp_path)
+    queen_path = build_adjacency(shapefile, str(tmp_path / "adjacency"))
+    rook = ZctaAdjacency.from_shapefile(shapefile, str(tmp_path / "adjacency"), contiguity='rook')
+    queen = ZctaAdjacency.load(queen_path)
+
+    assert build_adjacency(shapefile, str(tmp_path / "adjacency")) == queen_path
+    assert queen.zctas.tolist() == list(range(1, 10))
+    neighbors = np.asarray(queen.matrix.sum(axis=1)).ravel()
+    assert neighbors.tolist() == [3, 5, 3, 5, 8, 5, 3, 5, 3]
+    assert np.asarray(rook.matrix.sum(axis=1)).ravel().tolist() == [2, 3, 2, 3, 4, 3, 2, 3, 2]
+    assert (queen.matrix != queen.matrix.T).nnz == 0
+
+
+def test_missing_values_are_filled_from_neighbors_with_provenance_in_lineage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shapefile = write_grid(tmp_path)
+    # ZCTAs 1, 2 and 4 are missing; 1 has no observed neighbor in the rook graph until its neighbors are filled
+    income = [None, None, 30000, None, 50000, 60000, 70000, 80000, 90000]
+    data = pd.DataFrame({
+        'zcta': [f"{code:05d}" for code in range(1, 10)] + ['99999'],
+        'median_household_income': pd.array(income + [None], dtype='Int64'),
+    })
+
+    imputed, lineage = impute_data(data, [], columns=['median_household_income'], max_hops=2, contiguity='rook',
+                                   shapefile=shapefile, persist=False)
+
+    values = imputed['median_household_income']
+    assert values.dtype == 'Int64'
+    # ZCTA 2: mean of 3 and 5; ZCTA 4: mean of 5 and 7; ZCTA 1: mean of the filled 2 and 4
+    assert values[:4].tolist() == [50000, 40000, 30000, 60000]
+    assert values[4:9].tolist() == income[4:]
+    assert values.isna().tolist()[-1]
+    entry = lineage[0]
+    assert entry['name'] == 'fill_median_household_income'
+    assert entry['provenance'] == {'1': [2, 4], '2': [1]}
+    assert entry['adjacency']['sha256']
+    assert lineage[-1]['name'] == 'imputed_data'
+
+    # ZCTA 3 has no data row: it is filled on the graph on the way, but only data rows are reported
+    _, lineage = impute_data(data[data['zcta'] != '00003'], [], columns=['median_household_income'], max_hops=2,
+                             contiguity='rook', shapefile=shapefile, persist=False)
+    assert lineage[0]['provenance'] == {'1': [2, 4], '2': [1]}
+    assert lineage[0]['details'].startswith("Filled 3 missing values")
+
+    smoothed, _ = impute_data(data, [], columns=['median_household_income'], method='smooth', weight=0.5,
+                              contiguity='rook', shapefile=shapefile, persist=False)
+    # ZCTA 5 (50000) with known neighbors 6 and 8 (mean 70000)
+    assert smoothed['median_household_income'][4] == 60000
+    assert smoothed['median_household_income'][:2].isna().all()
@@ -0,0 +1,24 @@
+import pandas as pd
+from benchmarks.synthetic import generate_inputs
+from benchmarks.run_benchmarks import find_regressions
+from storage import get_latest_csv, read_dataset
+
+
+def test_synthetic_inputs_have_leading_zeros_fanout_and_misses(tmp_path):
+    rows = generate_inputs(str(tmp_path), scale=0.05, seed=1)
+    zcta_data = read_dataset(get_latest_csv("zcta_data", str(tmp_path / "automated data")))
+    xref = pd.read_csv(tmp_path / "manual data" / "zip_zcta_xref.csv")
+    income = read_dataset(get_latest_csv("income_data", str(tmp_path / "automated data")))
+
+    assert rows['zcta_data'] == len(zcta_data) == int(33791 * 0.05)
+    assert zcta_data['zcta'].str.startswith('0').any()
+    assert xref.groupby('zcta').size().max() > 1
+    assert not set(zcta_data['zcta']) <= set(income['zcta'])
+    assert not set(income['zcta']) <= set(zcta_data['zcta'])
+
+
+def test_find_regressions_flags_slower_and_larger_stages():
+    baselines = {'1': {'join_data': {'wall_seconds': 1.0, 'peak_rss_mb': 100.0}}}
+    assert find_regressions({'1': {'join_data': {'wall_seconds': 1.1, 'peak_rss_mb': 110.0}}}, baselines) == []
+    regressions = find_regressions({'1': {'join_data': {'wall_seconds': 2.0, 'peak_rss_mb': 200.0}}}, baselines)
+    assert len(regressions) == 2
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from catalog import compact, latest_artifact, read_catalog, register_artifact
+from storage import write_dataset, get_latest_file
+
+
+def test_latest_and_compaction(tmp_path):
+    folder = str(tmp_path)
+    df = pd.DataFrame({'zcta': ['00601', '02115']})
+    paths = [write_dataset(df, "zcta_data", folder=folder, timestamp=f"2024010{day}_000000") for day in (1, 2, 3)]
+    # Stray files without a parseable timestamp must not break discovery
+    open(os.path.join(folder, "zcta_data_backup.csv"), 'w').close()
+
+    record = latest_artifact("zcta_data", catalog_folder=folder)
+    assert record['path'] == paths[-1]
+    assert record['rows'] == 2 and record['schema'] == {'zcta': 'object'}
+    assert get_latest_file("zcta_data", folder=folder) == paths[-1]
+
+    deleted = compact(keep=1, catalog_folder=folder)
+    assert sorted(deleted) == sorted(paths[:-1])
+    assert [entry['path'] for entry in read_catalog(folder)] == [paths[-1]]
+    assert latest_artifact("zcta_data", catalog_folder=folder)['path'] == paths[-1]
+
+
+def register_many(folder, worker, count=20):
+    for number in range(count):
+        path = os.path.join(folder, f"data_{worker}_{number}.csv")
+        with open(path, 'w') as f:
+            f.write(f"{worker},{number}\n")
+        register_artifact(path, f"data_{worker}_{number}", rows=1, catalog_folder=folder)
+
+
+def test_processes_registering_concurrently_lose_no_records(tmp_path):
+    folder = str(tmp_path)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(register_many, [folder] * 4, range(4)))
+    assert len(read_catalog(folder)) == 80
+    assert all(latest_artifact(f"data_{worker}_{number}", catalog_folder=folder) is not None
+               for worker in range(4) for number in range(20))
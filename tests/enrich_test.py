@@ -0,0 +1,74 @@
+import os
+import pytest
+import pandas as pd
+import pyarrow as pa
+from storage import write_dataset
+import enrich
+from enrich import enrich_listings, enrich_chunk, rebatch
+from zcta_keys import parse_zcta_codes
+
+
+def write_inputs(tmp_path):
+    folder = str(tmp_path / "data")
+    cleaned = pd.DataFrame({'zcta': ['00601', '10001'], 'city': ['Adjuntas', 'New York'],
+                            'median_household_income': [12000, 91000]})
+    write_dataset(cleaned, "cleaned_data", folder=folder, timestamp="20240101_000000")
+    xref_path = tmp_path / "xref.csv"
+    pd.DataFrame({'zcta': [601.0, 601.0, 10001.0], 'zip_code': [601, 631, 10118]}).to_csv(xref_path, index=False)
+    return folder, xref_path
+
+
+def test_streamed_enrichment_matches_zip_lookup(tmp_path):
+    folder, xref_path = write_inputs(tmp_path)
+    listings_path = tmp_path / "listings.csv"
+    pd.DataFrame({'listing_id': range(5), 'zip_code': ['00631', '10118', '99999', 'n/a', '601'],
+                  'city': ['a', 'b', 'c', 'd', 'e']}).to_csv(listings_path, index=False)
+
+    output_path = str(tmp_path / "enriched.parquet")
+    stats = enrich_listings(str(listings_path), output_path, chunk_rows=2, workers=2, catalog_folder=folder,
+                            serving_folder=str(tmp_path / "serving"), xref_path=str(xref_path))
+    enriched = pd.read_parquet(output_path)
+    assert stats == {'rows': 5, 'matched': 3}
+    assert enriched['listing_id'].tolist() == [0, 1, 2, 3, 4]
+    assert enriched['zcta'].tolist() == ['00601', '10001', None, None, '00601']
+    assert enriched['city'].tolist() == ['a', 'b', 'c', 'd', 'e']
+    assert enriched['city_zcta'].tolist() == ['Adjuntas', 'New York', None, None, 'Adjuntas']
+    assert enriched['median_household_income'].tolist()[:2] == [12000, 91000]
+
+
+def test_empty_listings_give_an_empty_enriched_file_and_failures_leave_no_partial_output(tmp_path, monkeypatch):
+    folder, xref_path = write_inputs(tmp_path)
+    listings_path = tmp_path / "listings.csv"
+    listings_path.write_text("listing_id,zip_code\n")
+    output_path = str(tmp_path / "enriched.parquet")
+    stats = enrich_listings(str(listings_path), output_path, catalog_folder=folder,
+                            serving_folder=str(tmp_path / "serving"), xref_path=str(xref_path))
+    enriched = pd.read_parquet(output_path)
+    assert stats == {'rows': 0, 'matched': 0}
+    assert enriched.empty and enriched.columns.tolist() == ['listing_id', 'zip_code', 'zcta', 'city',
+                                                            'median_household_income']
+
+    # The second chunk fails after the first was written to the temporary file
+    listings_path.write_text("listing_id,zip_code\n1,00601\n2,10118\n")
+    calls = []
+
+    def failing_enrich_chunk(table, chunk, zip_column):
+        calls.append(chunk.num_rows)
+        if len(calls) == 2:
+            raise RuntimeError("enrichment failed")
+        return enrich_chunk(table, chunk, zip_column)
+
+    monkeypatch.setattr(enrich, 'enrich_chunk', failing_enrich_chunk)
+    failed_path = str(tmp_path / "failed.parquet")
+    with pytest.raises(RuntimeError):
+        enrich_listings(str(listings_path), failed_path, chunk_rows=1, catalog_folder=folder,
+                        serving_folder=str(tmp_path / "serving"), xref_path=str(xref_path))
+    assert calls == [1, 1]
+    assert not os.path.exists(failed_path) and not os.path.exists(f"{failed_path}.tmp")
+
+
+def test_rebatch_and_code_parsing():
+    batches = pa.table({'a': range(7)}).to_batches(max_chunksize=3)
+    assert [table.num_rows for table in rebatch(batches, chunk_rows=4)] == [4, 3]
+    codes = parse_zcta_codes(pa.array(['00601', ' 2115 ', '601.0', 'abc', '100000', None]))
+    assert codes.tolist() == [601, 2115, 601, -1, -1, -1]
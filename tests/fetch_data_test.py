@@ -0,0 +1,82 @@
+import json
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import fetch_data
+from catalog import read_catalog
+from http_cache import CachedSession
+from fetch_data import fetch_income_data, fetch_sunlight_data
+
+ESTIMATES = {'B19013_001E': {'00601': 17526, '00602': -666666666, '10001': 96787},
+             'B01003_001E': {'00601': 16834, '00602': 37642, '10001': 27004}}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        StandIn.requests_seen.append(query)
+        if url.path == '/acs':
+            variables = query['get'].split(',')
+            zctas = query['for'].split(':')[1].split(',')
+            rows = [variables + ['zip code tabulation area']]
+            rows += [[str(ESTIMATES[variable][zcta]) for variable in variables] + [zcta] for zcta in zctas]
+            body = rows
+        elif float(query['lat']) > 30:
+            body = {'outputs': {'avg_ghi': {'annual': 4.5}}}
+        elif float(query['lat']) > 0:
+            body = {'outputs': {'avg_ghi': 'no data'}}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_fetchers_batch_parse_and_reuse_unchanged_responses(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fetch_data, 'ACS_MAX_VARIABLES', 1)
+    monkeypatch.setattr(fetch_data, 'ACS_ZCTA_BATCH', 2)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        session = CachedSession(str(tmp_path / "http_cache"), backoff=0, retries=0)
+        variables = {'B19013_001E': 'median_household_income', 'B01003_001E': 'population'}
+        income = fetch_income_data(variables=variables, zctas=['601', '10001', '00602'], api_key='secret',
+                                   session=session, base_url=f"{base}/acs")
+        # Two variable batches times two ZCTA batches
+        assert len(StandIn.requests_seen) == 4
+        assert income['zcta'].tolist() == ['00601', '00602', '10001']
+        assert income['median_household_income'].tolist()[::2] == [17526, 96787]
+        assert income['median_household_income'].isna().tolist() == [False, True, False]
+        assert income['population'].tolist() == [16834, 37642, 27004]
+        # The API key never reaches the cache metadata
+        assert 'secret' not in "".join(path.read_text() for path in (tmp_path / "http_cache").glob("*.json"))
+
+        zcta_data = pd.DataFrame({'zcta': ['00601', '00602', '10001', '99999'],
+                                  'latitude': [40.001, 40.004, 10.0, -5.0],
+                                  'longitude': [-70.0, -70.0, -70.0, -70.0]})
+        sunlight = fetch_sunlight_data(zcta_data, api_key='secret', session=session, base_url=f"{base}/nrel")
+        # The first two ZCTAs round to the same coordinates and share a request
+        assert len(StandIn.requests_seen) == 7
+        assert sunlight['peak_sun_hours_per_day'].tolist()[:2] == [4.5, 4.5]
+        assert sunlight['peak_sun_hours_per_day'].isna().tolist() == [False, False, True, True]
+
+        artifacts = len(read_catalog())
+        fetch_income_data(variables=variables, zctas=['601', '10001', '00602'], session=session,
+                          base_url=f"{base}/acs")
+        assert len(StandIn.requests_seen) == 7 and len(read_catalog()) == artifacts
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,32 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from geocoder import ZctaGeocoder, build_index
+
+
+def write_shapefile(folder):
+    path = folder / "zcta.shp"
+    gpd.GeoDataFrame({'ZCTA5CE20': ['00601', '02115']},
+                     geometry=[shapely.box(0, 0, 1, 1), shapely.box(2, 0, 3, 1)], crs="EPSG:4326").to_file(path)
+    return path
+
+
+def test_points_inside_polygons_get_their_zcta_and_gaps_the_nearest_one(tmp_path):
+    index_path = build_index(str(write_shapefile(tmp_path)), str(tmp_path / "index"))
+    geocoder = ZctaGeocoder.load(index_path)
+
+    latitudes = np.array([0.5, 0.5, 0.5, 0.5, np.nan])
+    longitudes = np.array([0.5, 2.5, 1.2, 10.0, 0.5])
+    result = geocoder.geocode(latitudes, longitudes, max_distance=0.5)
+
+    assert result['zcta'].tolist()[:3] == ['00601', '02115', '00601']
+    assert result['zcta'].isna().tolist() == [False, False, False, True, True]
+    assert result['geocode_method'].tolist()[:3] == ['contains', 'contains', 'nearest']
+    assert np.isclose(result['geocode_distance'][2], 0.2)
+
+
+def test_index_is_reused_for_an_unchanged_shapefile(tmp_path):
+    shapefile_path = str(write_shapefile(tmp_path))
+    first = build_index(shapefile_path, str(tmp_path / "index"))
+    assert build_index(shapefile_path, str(tmp_path / "index")) == first
+    assert len(ZctaGeocoder.load(first).zctas) == 2
@@ -0,0 +1,72 @@
+import json
+import os
+import numpy as np
+import geopandas as gpd
+import pyarrow.parquet as pq
+import shapely
+from catalog import latest_artifact
+from geometry import build_geometry, get_zcta_geometry
+
+
+def test_sharded_geometry_is_written_as_spatially_sorted_geoparquet(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("manual data/tl_2024_us_zcta520")
+    angles = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    circle = shapely.Polygon(np.c_[-66.7 + 0.1 * np.cos(angles), 18.2 + 0.1 * np.sin(angles)])
+    # Smaller than the tolerance: plain Douglas-Peucker would collapse it
+    speck = shapely.box(-73.9, 40.7, -73.9 + 1e-4, 40.7 + 1e-4)
+    gpd.GeoDataFrame({'ZCTA5CE20': ['00601', '10001', '00602'], 'ALAND20': [3e7, 1e4, 2e7],
+                      'AWATER20': [1e7, 0, 0]},
+                     geometry=[circle, speck, shapely.box(-66.6, 18.3, -66.5, 18.4)], crs="EPSG:4269").to_file(
+        "manual data/tl_2024_us_zcta520/tl_2024_us_zcta520.shp")
+
+    geometry = get_zcta_geometry(workers=2)
+    path = latest_artifact("zcta_geometry")['path']
+    # The two Puerto Rico ZCTAs are neighbors on the Hilbert curve
+    order = geometry['zcta'].tolist()
+    assert abs(order.index('00601') - order.index('00602')) == 1
+    row = geometry.set_index('zcta').loc['00601']
+    assert row['land_area_sqkm'] == 30 and row['land_fraction'] == 0.75
+    # An ellipse of 0.1 degrees of latitude (11.1 km) by 0.1 degrees of longitude at 18.2 N (10.6 km)
+    assert abs(row['area_sqkm'] - 368) < 3
+    assert shapely.get_num_coordinates(row['geometry']) < 200
+    assert not geometry.geometry.is_empty.any() and geometry.geometry.is_valid.all()
+
+    metadata = json.loads(pq.read_schema(path).metadata[b'geo'])
+    assert 'covering' in metadata['columns']['geometry']
+    assert gpd.read_parquet(path, bbox=(-74, 40, -73, 41))['zcta'].tolist() == ['10001']
+    # Unchanged inputs reuse the artifact
+    assert get_zcta_geometry()['zcta'].tolist() == geometry['zcta'].tolist()
+    assert latest_artifact("zcta_geometry")['path'] == path
+
+
+def brick_coverage(columns=6, rows=6, size=0.05, step=10, noise=0.004):
+    """Bricks in rows offset by half a brick with noisy shared borders, so every long side has a T-junction."""
+    rng = np.random.default_rng(0)
+    xs = np.arange((columns + 1) * step + 1) * size / step
+    # One noisy line per row boundary, shared by the bricks above and below it; still at the brick corners
+    envelope = np.sin(np.pi * np.arange(len(xs)) / (step / 2)) ** 2
+    boundaries = [np.c_[xs, row * size + rng.uniform(-noise, noise, len(xs)) * envelope] for row in range(rows + 1)]
+    bricks = []
+    for row in range(rows):
+        for column in range(columns):
+            start = (row % 2) * step // 2 + column * step
+            bottom = boundaries[row][start:start + step + 1]
+            top = boundaries[row + 1][start:start + step + 1][::-1]
+            bricks.append(shapely.Polygon(np.concatenate([bottom, top])))
+    return bricks
+
+
+def test_shared_borders_are_simplified_alike_across_shards(tmp_path):
+    bricks = brick_coverage()
+    zcta_gdf = gpd.GeoDataFrame({'ZCTA5CE20': [f"{code:05d}" for code in range(len(bricks))]}, geometry=bricks,
+                                crs="EPSG:4326")
+    # One worker still cuts the bricks into SHARDS_PER_WORKER shards
+    outlines = build_geometry(zcta_gdf, tolerance=0.002, workers=1).geometry.to_numpy()
+
+    assert shapely.get_num_coordinates(outlines).sum() < shapely.get_num_coordinates(bricks).sum()
+    # Simplifying each outline on its own leaves slivers between the bricks; shared borders leave none
+    union = shapely.union_all(outlines)
+    assert shapely.coverage_is_valid(outlines)
+    assert union.geom_type == 'Polygon' and not union.interiors
+    assert np.isclose(shapely.area(outlines).sum(), union.area)
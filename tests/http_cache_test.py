@@ -0,0 +1,52 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from http_cache import CachedSession
+
+
+class StandIn(BaseHTTPRequestHandler):
+    hits = {}
+
+    def do_GET(self):
+        StandIn.hits[self.path] = StandIn.hits.get(self.path, 0) + 1
+        if self.path == '/flaky' and StandIn.hits[self.path] < 3:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b'payload'
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_retries_revalidation_and_fresh_entries(tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        session = CachedSession(str(tmp_path), backoff=0, ttl=0)
+        flaky = session.fetch(f"{base}/flaky")
+        assert StandIn.hits['/flaky'] == 3 and open(flaky['path'], 'rb').read() == b'payload'
+
+        first = session.fetch(f"{base}/etag")
+        second = session.fetch(f"{base}/etag")
+        assert first['sha256'] == second['sha256'] and second['etag'] == '"v1"'
+        assert session.stats['revalidated'] == 1
+
+        # A response that never goes stale is served without a request
+        never_stale = CachedSession(str(tmp_path), ttl=None)
+        never_stale.fetch(f"{base}/etag", ttl=None)
+        hits = StandIn.hits['/etag']
+        never_stale.fetch(f"{base}/etag")
+        assert StandIn.hits['/etag'] == hits and never_stale.stats['fresh'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
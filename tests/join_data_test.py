@@ -0,0 +1,26 @@
+import time
+from benchmarks.synthetic import generate_inputs
+from storage import write_dataset, get_latest_csv, read_dataset
+from join_data import join_data
+
+
+def test_incremental_join_replaces_only_the_changed_source(tmp_path, monkeypatch):
+    generate_inputs(str(tmp_path), scale=0.01, seed=2)
+    monkeypatch.chdir(tmp_path)
+    join_data(use_cache=False)
+    crime = read_dataset(get_latest_csv("crime_data"))
+    write_dataset(crime.assign(crime_grade='F').iloc[:-3], "crime_data", timestamp="20300101_000000")
+    # Artifacts are named by the second they were written in
+    time.sleep(1)
+
+    merged, lineage = join_data(incremental=True)
+    assert lineage[-1]['name'] == 'delta_crime_data'
+    assert lineage[-1]['delta']['columns'] == ['crime_grade']
+    assert lineage[-1]['delta']['current']['path'].endswith("crime_data_20300101_000000.parquet")
+    crime_entry = next(entry for entry in lineage if entry['name'] == 'crime_data' and entry['type'] == 'dataset')
+    assert crime_entry['sha256'] == lineage[-1]['delta']['current']['sha256']
+
+    full, _ = join_data(use_cache=False, persist=False)
+    assert list(merged.columns) == list(full.columns)
+    assert merged['crime_grade'].astype(str).tolist() == full['crime_grade'].astype(str).tolist()
+    assert merged['zcta'].tolist() == full['zcta'].tolist()
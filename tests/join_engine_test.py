@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import pandas as pd
+from join_engine import multi_join, regather
+
+
+def test_matches_chained_left_merges():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = rng.integers(0, 8)
+        base = pd.DataFrame({'zcta': rng.choice(list('abcdefgh'), n, replace=False),
+                             'latitude': rng.random(n)})
+        sources = []
+        for number in range(4):
+            m = rng.integers(0, 10)
+            frame = pd.DataFrame({'zcta': rng.choice(list('abcdefghij'), m, replace=number % 2 == 0),
+                                  f'value_{number}': rng.integers(0, 9, m)})
+            if number == 1:
+                frame['latitude'] = rng.random(m)
+            sources.append({'name': f'source_{number}', 'frame': frame})
+
+        expected = base
+        for source in sources:
+            expected = expected.merge(source['frame'], on='zcta', how='left')
+        result, steps = multi_join(base, sources)
+
+        pd.testing.assert_frame_equal(result, expected.reset_index(drop=True), check_dtype=False)
+        assert steps[-1]['columns'] == list(expected.columns)
+        assert steps[-1]['rows_out'] == len(expected)
+
+
+def test_nest_mode_keeps_one_row_per_key():
+    base = pd.DataFrame({'zcta': [1, 2, 3], 'latitude': [1.0, 2.0, 3.0]})
+    xref = pd.DataFrame({'zcta': [1, 1, 3], 'zip_code': ['00601', '00602', '00603']})
+    income = pd.DataFrame({'zcta': [3, 1], 'median_household_income': [50, 60]})
+    result, steps = multi_join(base, [{'name': 'xref', 'frame': xref, 'fanout': 'nest'},
+                                      {'name': 'income', 'frame': income}])
+
+    assert len(result) == 3
+    assert [None if value is None else list(value) for value in result['zip_code']] == [
+        ['00601', '00602'], None, ['00603']]
+    assert result['median_household_income'].tolist()[::2] == [60, 50]
+    assert steps[0]['fanout']['max_fanout'] == 2
+    assert steps[0]['fanout']['unmatched_base_rows'] == 1
+    assert steps[1]['rows_in'] == 3
+
+
+def test_regather_replaces_one_source_like_a_full_join():
+    base = pd.DataFrame({'zcta': [1, 2, 2, 3]})
+    source = pd.DataFrame({'zcta': [2, 3], 'grade': ['A', 'B']})
+    columns, step = regather(base['zcta'], {'name': 'grade_data', 'frame': source})
+    expected, _ = multi_join(base, [{'name': 'grade_data', 'frame': source}])
+    assert list(columns['grade']) == list(expected['grade'])
+    assert step['matched_rows'] == 3 and step['rows_out'] == 4
+    with pytest.raises(ValueError, match="several rows"):
+        regather(base['zcta'], {'name': 'grade_data', 'frame': pd.concat([source, source])})
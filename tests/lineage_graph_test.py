@@ -0,0 +1,54 @@
+import lineage_graph
+from lineage_graph import build_graph, render_lineage, render_lineage_async
+
+
+def lineage(wall_seconds):
+    return [
+        {'type': 'dataset', 'name': 'zcta_data', 'shape': [3, 2], 'columns': ['zcta', 'latitude']},
+        {'type': 'dataset', 'name': 'income_data', 'shape': [2, 2], 'columns': ['zcta', 'income']},
+        {'type': 'dataset', 'name': 'crime_data', 'shape': [2, 2], 'columns': ['zcta', 'grade']},
+        {'type': 'merge', 'input1': 'zcta_data', 'input2': 'income_data', 'join_key': 'zcta', 'output': 'merged_1',
+         'profile': {'wall_seconds': wall_seconds, 'cpu_seconds': wall_seconds}},
+        {'type': 'output', 'name': 'merged_1', 'shape': [3, 3], 'columns': ['zcta', 'latitude', 'income']},
+        {'type': 'merge', 'input1': 'merged_1', 'input2': 'crime_data', 'join_key': 'zcta', 'output': 'merged_final'},
+        {'type': 'output', 'name': 'merged_final', 'shape': [3, 4], 'columns': ['zcta', 'latitude', 'income', 'grade']},
+    ]
+
+
+def test_renders_are_keyed_by_lineage_and_run_in_the_background(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_dot(command, **kwargs):
+        calls.append(command)
+        with open(command[-1], 'w') as f:
+            f.write("<svg/>")
+
+    monkeypatch.setattr(lineage_graph.subprocess, 'run', fake_dot)
+    folder = str(tmp_path / "lineage")
+    catalog_folder = str(tmp_path / "data")
+    first = render_lineage(lineage(1.0), 'svg', folder=folder, catalog_folder=catalog_folder)
+    assert first.endswith(".svg") and open(first).read() == "<svg/>"
+    # Timings are left out of the key, so a rerun that only took a different time reuses the render
+    assert render_lineage(lineage(2.5), 'svg', folder=folder, catalog_folder=catalog_folder) == first
+    assert len(calls) == 1
+    # A different set of slowest steps is drawn differently
+    profiled = lineage(2.5)
+    profiled[5]['profile'] = {'wall_seconds': 0.5, 'cpu_seconds': 0.5}
+    assert render_lineage(profiled, 'svg', folder=folder, catalog_folder=catalog_folder) != first
+    untimed = render_lineage(lineage(2.5), 'svg', folder=folder, catalog_folder=catalog_folder, timings=False)
+    assert untimed != first and len(calls) == 3
+
+    summary = render_lineage_async(lineage(1.0), 'svg', summary=True, folder=folder,
+                                   catalog_folder=catalog_folder).result()
+    rerun = render_lineage_async(lineage(2.5), 'svg', summary=True, folder=folder,
+                                 catalog_folder=catalog_folder).result()
+    assert summary == rerun != first and len(calls) == 4
+
+
+def test_summary_collapses_merge_chains():
+    source = build_graph(lineage(1.0), summary=True).source
+    assert 'Join 3 datasets' in source and 'merged_1' not in source
+    assert 'merged_final [label="merged_final\\n3 rows x 4 columns"' in source
+    assert 'merged_1' in build_graph(lineage(1.0)).source
+    assert 'wall' in build_graph(lineage(1.0)).source and 'red' in build_graph(lineage(1.0)).source
+    assert 'wall' not in build_graph(lineage(1.0), timings=False).source
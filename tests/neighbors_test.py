@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from neighbors import ZctaNeighbors, chord_to_miles, miles_to_chord
+
+
+def sample_table():
+    # Points one degree of latitude apart (about 69 miles) along a meridian
+    return pd.DataFrame({
+        'zcta': ['00601', '00602', '00603', '00604'],
+        'zcta_latitude': [0.0, 1.0, 2.0, 3.0],
+        'zcta_longitude': [0.0, 0.0, 0.0, 0.0],
+        'median_household_income': [10.0, np.nan, 30.0, 40.0],
+    })
+
+
+def test_radius_and_nearest_queries_use_great_circle_miles():
+    neighbors = ZctaNeighbors(sample_table())
+    within = neighbors.within([0.0], [0.0], radius_miles=100)
+    assert within['zcta'].tolist() == ['00601', '00602']
+    assert np.isclose(within['distance_miles'][1], 69.09, atol=0.1)
+
+    nearest = neighbors.nearest([0.0, 3.0], [0.0, 0.0], k=2, require='median_household_income')
+    assert nearest['zcta'].tolist() == ['00601', '00603', '00604', '00603']
+    assert np.isclose(chord_to_miles(miles_to_chord(10.0)), 10.0)
+
+
+def test_aggregate_neighbor_values_excluding_self():
+    neighbors = ZctaNeighbors(sample_table())
+    means = neighbors.aggregate([0.0, 3.0], [0.0, 0.0], 'median_household_income', k=2, exclude_self=True)
+    assert means.tolist() == [35.0, 20.0]
+    within = neighbors.aggregate([0.0], [0.0], 'median_household_income', radius_miles=10)
+    assert within.tolist() == [10.0]
+
+
+def test_queries_over_a_column_without_values_find_no_neighbors():
+    table = sample_table().assign(median_household_income=np.nan)
+    neighbors = ZctaNeighbors(table)
+    assert neighbors.nearest([0.0], [0.0], k=2, require='median_household_income').empty
+    assert np.isnan(neighbors.aggregate([0.0, 1.0], [0.0, 0.0], 'median_household_income', k=2)).all()
+    assert np.isnan(neighbors.aggregate([0.0], [0.0], 'median_household_income', radius_miles=100)).all()
@@ -0,0 +1,43 @@
+import os
+import json
+import pandas as pd
+import geopandas as gpd
+import shapely
+from storage import write_dataset, read_dataset, get_latest_csv
+from stage_cache import CACHE_FOLDER, FILE_HASHES_FILENAME
+from panel import build_panel, available_vintages
+
+
+def write_vintage(folder, vintage, census, zctas):
+    layer = f"tl_{vintage}_us_zcta5{census}"
+    os.makedirs(folder / "manual data" / layer)
+    gpd.GeoDataFrame({f'ZCTA5CE{census}': zctas,
+                      f'INTPTLAT{census}': ['+18.18'] * len(zctas), f'INTPTLON{census}': ['-066.75'] * len(zctas)},
+                     geometry=[shapely.box(0, 0, 1, 1)] * len(zctas), crs="EPSG:4269").to_file(
+        folder / "manual data" / layer / f"{layer}.shp")
+
+
+def test_vintages_build_in_parallel_into_a_year_partitioned_panel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_vintage(tmp_path, 2019, "10", ['00601', '00602'])
+    write_vintage(tmp_path, 2023, "20", ['00601', '00602', '00603'])
+    income = pd.DataFrame({'zcta': ['00601', '00602'], 'median_household_income': [10000, 20000]})
+    write_dataset(income, "income_data", timestamp="20240101_000000")
+    # A vintage-specific source is preferred over the shared one
+    write_dataset(income.assign(median_household_income=[11000, 21000]), "income_data_2023",
+                  timestamp="20240101_000000")
+    assert available_vintages() == [2019, 2023]
+
+    panel_path = build_panel(workers=2)
+    assert get_latest_csv("cleaned_panel") == panel_path
+    panel = read_dataset(panel_path).sort_values(['year', 'zcta'], ignore_index=True)
+    assert panel['year'].astype(int).tolist() == [2019, 2019, 2023, 2023, 2023]
+    assert panel['zcta'].tolist() == ['00601', '00602', '00601', '00602', '00603']
+    assert panel['median_household_income'].tolist()[:4] == [10000, 20000, 11000, 21000]
+    assert panel['median_household_income'].isna().tolist()[-1]
+    assert panel['crime_grade'].isna().all()
+
+    # The vintage workers share the stage cache; the hashes both of them memoized are all kept
+    with open(os.path.join(CACHE_FOLDER, FILE_HASHES_FILENAME)) as f:
+        hashed = [os.path.basename(path) for path in json.load(f)]
+    assert {"tl_2019_us_zcta510.shp", "tl_2023_us_zcta520.shp"} <= set(hashed)
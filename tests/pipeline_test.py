@@ -0,0 +1,30 @@
+import threading
+import pytest
+from pipeline import run_pipeline, check_stages
+
+
+def test_run_pipeline_passes_outputs_and_runs_independent_stages_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def branch(value):
+        def stage(upstream, persist):
+            # Both branches must be running at the same time to get past the barrier
+            barrier.wait()
+            return value
+        return stage
+
+    stages = [
+        {'name': 'left', 'function': branch(1), 'depends_on': []},
+        {'name': 'right', 'function': branch(2), 'depends_on': []},
+        {'name': 'total', 'function': lambda upstream, persist: (upstream['left'] + upstream['right'], persist),
+         'depends_on': ['left', 'right']},
+    ]
+    outputs = run_pipeline(stages, persist=('total',))
+    assert outputs == {'left': 1, 'right': 2, 'total': (3, True)}
+
+
+def test_check_stages_rejects_cycles_and_unknown_dependencies():
+    with pytest.raises(ValueError, match="cycle"):
+        check_stages([{'name': 'a', 'depends_on': ['b']}, {'name': 'b', 'depends_on': ['a']}])
+    with pytest.raises(ValueError, match="unknown"):
+        check_stages([{'name': 'a', 'depends_on': ['missing']}])
@@ -0,0 +1,31 @@
+import json
+import pandas as pd
+from profiling import call_profiled, slowest_steps, write_profile
+
+
+def test_call_profiled_records_timing_and_frame_size():
+    frame, profile = call_profiled(lambda rows: pd.DataFrame({'zcta': range(rows)}), 10)
+    assert len(frame) == 10
+    assert profile['rows_out'] == 10
+    assert profile['wall_seconds'] >= 0 and profile['cpu_seconds'] >= 0
+    assert profile['memory_mb'] > 0 and profile['peak_rss_mb'] > 0
+
+
+def test_profile_json_lists_profiled_steps_and_slowest_first(tmp_path):
+    def step(wall):
+        return {'wall_seconds': wall, 'cpu_seconds': wall / 2, 'peak_rss_mb': 1.0}
+
+    lineage_data = [
+        {'type': 'dataset', 'name': 'zcta_data', 'profile': step(0.5)},
+        {'type': 'output', 'name': 'merged_data_1'},
+        {'type': 'merge', 'input1': 'merged_data_1', 'input2': 'crime_data', 'output': 'merged_data_2',
+         'profile': step(2.0)},
+    ]
+    assert [entry['profile']['wall_seconds'] for entry in slowest_steps(lineage_data, count=1)] == [2.0]
+
+    path = tmp_path / "join_profile.json"
+    write_profile(lineage_data, "join_data", str(path))
+    profile = json.loads(path.read_text())
+    assert profile['stage'] == "join_data"
+    assert [step['name'] for step in profile['steps']] == ['zcta_data', 'merged_data_2']
+    assert profile['total_wall_seconds'] == 2.5
@@ -0,0 +1,28 @@
+import pandas as pd
+from schemas import schema_columns, read_csv_typed, apply_schema
+
+
+def test_read_csv_typed_reads_declared_columns_with_declared_dtypes(tmp_path):
+    path = tmp_path / "zcta_review.csv"
+    pd.DataFrame({
+        'zip': [2115, 601],
+        'city': ['Boston', 'Adjuntas'],
+        'stusab': ['MA', 'PR'],
+        'zcta': [2115.0, None],
+        'result': [2215.0, None],
+        'undeclared': ['x', 'y'],
+    }).to_csv(path, index=False)
+
+    columns = schema_columns('zcta_review', pd.read_csv(path, nrows=0).columns, exclude=['zip'])
+    frame = read_csv_typed(path, 'zcta_review', columns)
+
+    assert list(frame.columns) == ['city', 'stusab', 'zcta', 'result']
+    assert frame['city'].dtype == 'category'
+    assert frame['result'].dtype == 'Int64'
+    assert frame['result'].isna().tolist() == [False, True]
+
+
+def test_apply_schema_casts_only_declared_columns():
+    frame = apply_schema(pd.DataFrame({'crime_grade': ['A', 'C', 'A'], 'extra': [1, 2, 3]}), 'crime_data')
+    assert frame['crime_grade'].dtype == 'category'
+    assert frame['extra'].dtype == 'int64'
@@ -0,0 +1,83 @@
+import json
+import threading
+import urllib.request
+import pandas as pd
+from storage import write_dataset
+from serving import LookupService, serve, publish_snapshot, attach, current_snapshot
+
+
+def write_inputs(tmp_path, income):
+    folder = str(tmp_path / "data")
+    cleaned = pd.DataFrame({
+        'zcta': ['00601', '00602', '10001'],
+        'city': ['Adjuntas', None, 'New York'],
+        'zcta_latitude': [18.18, 18.36, 40.75],
+        'median_household_income': pd.array([income, None, 91000], dtype='Int64'),
+    })
+    write_dataset(cleaned, "cleaned_data", folder=folder, timestamp=f"2024010{income % 9}_000000")
+    xref_path = tmp_path / "xref.csv"
+    pd.DataFrame({'zcta': [601.0, 601.0, 10001.0], 'zip_code': [601, 631, 10118]}).to_csv(xref_path, index=False)
+    return folder, str(xref_path)
+
+
+def test_lookups_by_zcta_and_zip_and_hot_reload(tmp_path):
+    folder, xref_path = write_inputs(tmp_path, 12000)
+    service = LookupService(catalog_folder=folder, serving_folder=str(tmp_path / "serving"), xref_path=xref_path)
+    table = service.table
+    # Readers never publish: the snapshot attached workers use is left to clean_data
+    assert current_snapshot(str(tmp_path / "serving")) is None
+    assert table.lookup(601) == {'zcta': '00601', 'city': 'Adjuntas', 'zcta_latitude': 18.18,
+                                 'median_household_income': 12000}
+    assert table.lookup('00602')['median_household_income'] is None
+    assert table.lookup('99999') is None and table.lookup('abc') is None
+    assert table.lookup_zip('00631')['zcta'] == '00601'
+    assert [record and record['zcta'] for record in table.lookup_many(['10001', 'x', '601'])] == ['10001', None, '00601']
+    assert [record and record['zcta'] for record in table.lookup_zips([10118, 602])] == ['10001', None]
+
+    assert not service.refresh()
+    write_inputs(tmp_path, 13000)
+    assert service.refresh()
+    assert service.table is not table and service.table.lookup(601)['median_household_income'] == 13000
+    assert current_snapshot(str(tmp_path / "serving")) is None
+
+
+def test_http_endpoints(tmp_path):
+    folder, xref_path = write_inputs(tmp_path, 12000)
+    service = LookupService(catalog_folder=folder, serving_folder=str(tmp_path / "serving"), xref_path=xref_path)
+    server = serve(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{base}/zip/631") as response:
+            assert json.load(response)['city'] == 'Adjuntas'
+        with urllib.request.urlopen(f"{base}/zcta?codes=10001,00000") as response:
+            batch = json.load(response)
+        assert batch['10001']['zcta'] == '10001' and batch['00000'] is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_published_snapshots_swap_atomically_and_attach_zero_copy(tmp_path):
+    folder = str(tmp_path / "serving")
+    cleaned = pd.DataFrame({'zcta': ['00601', '10001'], 'city': ['Adjuntas', None],
+                            'median_household_income': pd.array([12000, None], dtype='Int64')})
+    first = publish_snapshot(cleaned, "a" * 64, xref_path=None, folder=folder)
+    table = attach(folder)
+    assert table.rows.base is not None and not table.rows.flags.writeable
+    frame = table.frame()
+    assert frame['zcta'].tolist() == ['00601', '10001'] and frame['city'].isna().tolist() == [False, True]
+    pd.testing.assert_series_equal(frame['median_household_income'], cleaned['median_household_income'])
+
+    second = publish_snapshot(cleaned.assign(median_household_income=13000), "b" * 64, xref_path=None, folder=folder)
+    publish_snapshot(cleaned, "c" * 64, xref_path=None, folder=folder, keep=2)
+    assert current_snapshot(folder).endswith("cleaned_" + "c" * 16)
+    assert not (tmp_path / "serving" / f"cleaned_{'a' * 16}").exists()
+    assert (tmp_path / "serving" / f"cleaned_{'b' * 16}").exists()
+    # A table attached before the swap keeps reading its own (now deleted) snapshot
+    assert table.lookup('00601')['median_household_income'] == 12000
+    assert attach(folder).lookup('10001') == {'zcta': '10001', 'city': None, 'median_household_income': None}
+    assert first != second
+    # Republishing the current snapshot reads nothing, not even the cleaned artifact
+    assert publish_snapshot(str(tmp_path / "missing.parquet"), "c" * 64, folder=folder) == current_snapshot(folder)
@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+from stage_cache import StageCache, fingerprint
+from storage import write_dataset
+from catalog import latest_artifact
+
+
+def test_fingerprint_tracks_contents_and_params(tmp_path):
+    cache_folder = str(tmp_path / "cache")
+    source = tmp_path / "input.csv"
+    source.write_text("zcta\n00601\n")
+    first = fingerprint("stage", [str(source)], {'fmt': 'parquet'}, cache_folder=cache_folder)
+    assert fingerprint("stage", [str(source)], {'fmt': 'parquet'}, cache_folder=cache_folder) == first
+    assert fingerprint("stage", [str(source)], {'fmt': 'csv'}, cache_folder=cache_folder) != first
+    source.write_text("zcta\n00602\n")
+    assert fingerprint("stage", [str(source)], {'fmt': 'parquet'}, cache_folder=cache_folder) != first
+
+
+def test_restore_and_lru_eviction(tmp_path):
+    folder = str(tmp_path)
+    cache = StageCache(folder=os.path.join(folder, "cache"), max_bytes=10 ** 9)
+    df = pd.DataFrame({'zcta': ['00601']})
+    first = write_dataset(df, "zcta_data", folder=folder, timestamp="20240101_000000")
+    entry = cache.put("a", {'zcta_data': first}, catalog_folder=folder)
+
+    # A newer, different artifact becomes latest; restoring the entry republishes the cached copy
+    write_dataset(pd.DataFrame({'zcta': ['00602']}), "zcta_data", folder=folder, timestamp="20240102_000000")
+    restored = cache.restore(cache.get("a"))['zcta_data']
+    assert restored != first and latest_artifact("zcta_data", catalog_folder=folder)['path'] == restored
+    assert latest_artifact("zcta_data", catalog_folder=folder)['rows'] == 1
+
+    cache.max_bytes = entry['size'] * 2
+    cache.put("b", {'zcta_data': first}, catalog_folder=folder)
+    cache.get("a")
+    cache.put("c", {'zcta_data': first}, catalog_folder=folder)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
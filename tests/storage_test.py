@@ -0,0 +1,32 @@
+import pandas as pd
+from storage import write_dataset, read_dataset, export_csv, get_latest_file
+from join_engine import multi_join
+
+
+def test_round_trip_keeps_leading_zeros(tmp_path):
+    df = pd.DataFrame({'zcta': ['00601', '02115'], 'latitude': [18.18, 42.34]})
+    for fmt in ('parquet', 'arrow', 'csv'):
+        path = write_dataset(df, "zcta_data", folder=str(tmp_path), fmt=fmt, timestamp="20240101_000000")
+        pd.testing.assert_frame_equal(read_dataset(path), df)
+
+
+def test_latest_file_is_format_aware(tmp_path):
+    df = pd.DataFrame({'zcta': ['00601'], 'latitude': [18.18]})
+    write_dataset(df, "zcta_data", folder=str(tmp_path), fmt='csv', timestamp="20240101_000000")
+    newest = write_dataset(df, "zcta_data", folder=str(tmp_path), fmt='parquet', timestamp="20240102_000000",
+                           csv_export=True)
+    assert get_latest_file("zcta_data", folder=str(tmp_path)) == newest
+    assert read_dataset(newest, columns=['zcta']).columns.tolist() == ['zcta']
+
+
+def test_nested_columns_round_trip_through_csv(tmp_path):
+    base = pd.DataFrame({'zcta': [1, 2, 3]})
+    xref = pd.DataFrame({'zcta': [1, 1, 3], 'zip_code': ['00601', '00631', '00603']})
+    merged, _ = multi_join(base, [{'name': 'xref', 'frame': xref, 'fanout': 'nest'}], key='zcta')
+    merged['zcta'] = ['00001', '00002', '00003']
+
+    path = write_dataset(merged, "merged_data", folder=str(tmp_path), fmt='csv', timestamp="20240101_000000")
+    exported = export_csv(merged, write_dataset(merged, "merged_data", folder=str(tmp_path)))
+    for result in (read_dataset(path), read_dataset(exported)):
+        assert [None if value is None else value.tolist() for value in result['zip_code']] == [
+            ['00601', '00631'], None, ['00603']]
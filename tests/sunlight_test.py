@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from sunlight import daily_sunlight, yearly_sunlight, get_sunlight_data
+
+
+def test_matches_fao56_examples_and_yearly_sums():
+    # FAO-56 examples 8 and 9: 20 degrees south on 3 September, Ra = 32.2 MJ/m2/day and N = 11.7 hours
+    daylength, clear_sky = daily_sunlight([-20.0], year=2023)
+    assert round(clear_sky[0, 245] * 3.6 / 0.75, 1) == 32.2
+    assert round(daylength[0, 245], 1) == 11.7
+
+    latitudes = np.array([0.0, 40.75, 71.3, -14.3])
+    daylength, clear_sky = daily_sunlight(latitudes, year=2024)
+    shortest, insolation = yearly_sunlight(latitudes, year=2024)
+    np.testing.assert_allclose(insolation, clear_sky.sum(axis=1))
+    np.testing.assert_allclose(shortest, daylength.min(axis=1))
+    # Polar night north of the Arctic circle
+    assert shortest[2] == 0
+
+
+def test_stage_writes_sunlight_data_for_located_zctas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    zcta_data = pd.DataFrame({'zcta': ['00601', '10001', '99999'], 'latitude': [18.18, 40.75, np.nan],
+                              'longitude': [-66.75, -73.99, np.nan]})
+    sunlight_data = get_sunlight_data(zcta_data, years=[2023, 2024], workers=2)
+    assert sunlight_data['zcta'].tolist() == ['00601', '10001']
+    assert sunlight_data['peak_sun_hours_per_day'].is_monotonic_decreasing
+    np.testing.assert_allclose(sunlight_data['sunlight_hours_per_year'],
+                               sunlight_data['peak_sun_hours_per_day'] * 365.5)
+    assert len(list((tmp_path / "automated data").glob("sunlight_data_*"))) == 1
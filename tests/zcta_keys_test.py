@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from zcta_keys import parse_zcta, format_zcta
+
+
+def test_all_forms_parse_to_the_same_key():
+    forms = [pd.Series([601, 2115]), pd.Series([601.0, 2115.0]), pd.Series(['00601', ' 2115 ']),
+             pd.Series(['601.0', '02115'])]
+    for form in forms:
+        keys = parse_zcta(form)
+        assert keys.dtype == 'UInt32'
+        assert keys.tolist() == [601, 2115]
+        assert format_zcta(keys).tolist() == ['00601', '02115']
+
+
+def test_invalid_values_become_missing():
+    keys = parse_zcta(pd.Series([np.nan, 'abc', '100000', 1.5, None], dtype=object))
+    assert keys.isna().all()
+    assert format_zcta(keys).isna().all()
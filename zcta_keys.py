@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ZCTAs (and the ZIP codes they are built from) are five-digit codes, so they fit in an unsigned
+# 32-bit integer; the nullable dtype keeps missing keys as <NA> instead of a dummy value.
+ZCTA_DTYPE = "UInt32"
+ZCTA_MAX = 99999
+# Whole numbers with up to five digits, optionally written as floats ('601', '00601', '601.0')
+ZCTA_PATTERN = r'^[0-9]{1,5}(\.0*)?$'
+
+
+def parse_zcta(values):
+    """Parse ZCTA or ZIP codes in any common form into compact nullable UInt32 keys in one vectorized pass.
+
+    Accepts ints (601), floats from CSV columns with gaps (601.0), and strings with or without
+    leading zeros or padding ('00601', ' 601 ', '601.0'). Anything that is not a whole number
+    between 0 and 99999 becomes <NA>.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if series.dtype == ZCTA_DTYPE:
+        return series
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        numeric = pd.to_numeric(series, errors='coerce')
+    else:
+        numeric = pd.to_numeric(series.astype('string').str.strip(), errors='coerce')
+    numeric = numeric.astype('Float64')
+    valid = (numeric >= 0) & (numeric <= ZCTA_MAX) & (numeric == np.floor(numeric))
+    return numeric.where(valid.fillna(False)).astype(ZCTA_DTYPE)
+
+
+def format_zcta(keys):
+    """Format ZCTA keys as five-digit strings with leading zeros; missing keys stay <NA>."""
+    keys = parse_zcta(keys)
+    return keys.astype('string').str.zfill(5)
+
+
+def parse_zcta_codes(array):
+    """Parse an Arrow array of ZCTA or ZIP codes into an int64 NumPy array, with -1 for invalid or missing codes.
+
+    The Arrow-kernel counterpart of parse_zcta for streamed chunks: the same forms parse to the
+    same keys, without going through Python string objects.
+    """
+    if pa.types.is_integer(array.type) or pa.types.is_floating(array.type):
+        values = pc.cast(array, pa.float64()).to_numpy(zero_copy_only=False)
+        valid = (values >= 0) & (values <= ZCTA_MAX) & (values == np.floor(values))
+        return np.where(valid, np.nan_to_num(values), -1).astype(np.int64)
+    text = pc.utf8_trim_whitespace(pc.cast(array, pa.string()))
+    valid = pc.fill_null(pc.match_substring_regex(text, ZCTA_PATTERN), False)
+    digits = pc.if_else(valid, pc.replace_substring_regex(text, r'\..*$', ''), '-1')
+    return pc.cast(digits, pa.int64()).to_numpy(zero_copy_only=False)
+
+
+def format_zcta_codes(codes):
+    """Format an int NumPy array of ZCTA codes (-1 for missing) as an Arrow array of five-digit strings."""
+    codes = np.asarray(codes)
+    text = pc.utf8_lpad(pc.cast(pa.array(codes), pa.string()), 5, '0')
+    return pc.if_else(pa.array(codes >= 0), text, pa.scalar(None, pa.string()))